@@ -1,84 +1,334 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
-import uvicorn
-from typing import List
-from pydantic import BaseModel
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
-from src.context.context_loader import ContextLoader
+from src.api.models import GeneralAnsweringRequest
+from src.api.services import Services
+from src.api.pipeline import Speculation
 from src.config.logging_config import logger
-from src.llm.openai_llm import OpenaiLLM
-from src.llm.bedrock_llm import BedrockLlamaLLM
-from src.graph.graph_generator import GraphGenerator
-from src.api.constants import GRAPH_IMAGE_PATH, GENERAL_ANSWERING_DATA_DIR, IDA_DATA_DIR, GRAPH_DATA_DIR
+from src.llm.base_llm import BaseLLM
+from src.metrics.metrics import REGISTRY, REQUEST_DURATION, REQUESTS_TOTAL, REQUESTS_IN_FLIGHT
+from src.metrics.tracing import RequestTrace, current_trace, span, annotate
+from src.api.constants import GRAPH_DATA_DIR, INTENT_CONFIDENCE_THRESHOLD, PIPELINE_SPECULATION_ENABLED, PIPELINE_GRAPH_SPECULATION_MIN_PROBABILITY, SEMANTIC_CACHE_ENABLED
 
 load_dotenv()
 
-app = FastAPI()
+# Objects are created on first use, so importing the app does not load pandas, matplotlib, openai or boto3.
+services = Services()
 
-class GeneralAnsweringRequest(BaseModel):
-    question: str
-    collections_names: List[str] = ["sales", "company"]
-    llm_type: str = "openai"
+# Module attributes kept for code that reaches into the app, e.g. app.context_loader in the benchmarks.
+SERVICE_NAMES = ("client_pool", "corpus_watcher", "context_loader", "intent_classifier", "response_cache", "history_store",
+                 "openai_llm", "bedrock_llama_llm", "dataset_registry", "plot_code_cache", "plot_image_cache", "semantic_answer_cache", "plot_worker_pool")
 
-class IdaAnsweringRequest(BaseModel):
-    question: str
-    ida_file_name: str
-    llm_type: str = "openai"
+def __getattr__(name: str):
+    if name in SERVICE_NAMES:
+        return getattr(services, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-context_loader = ContextLoader(general_answering_data_directory=GENERAL_ANSWERING_DATA_DIR, ida_data_directory=IDA_DATA_DIR, graph_data_directory=GRAPH_DATA_DIR)
-logger.info("ContextLoader initialized.")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Loads the corpus, context loader and intent classifier and starts the plot workers before serving; LLM backends stay lazy."""
+    await asyncio.to_thread(services.warm_up)
+    yield
+    services.close()
 
-openai_llm = OpenaiLLM()
-logger.info("OpenaiLLM initialized.")
+app = FastAPI(lifespan=lifespan)
 
-bedrock_llama_llm = BedrockLlamaLLM()
-logger.info("BedrockLlamaLLM initialized.")
+INTENT_DECISIONS = REGISTRY.counter("ai_agent_intent_decisions_total", "Intent decisions by source (local classifier or LLM).", ("source",))
+
+def collect_cache_metrics() -> list:
+    """Exposes the hit/miss counters and sizes kept by the caches that were created so far, read at scrape time."""
+    lookups = []
+    response_cache = services.get_if_created("response_cache")
+    if response_cache is not None:
+        for call_type, counts in list(response_cache.stats.items()):
+            for result, value in list(counts.items()):
+                lookups.append(("", {"cache": "response", "call_type": call_type, "result": result}, value))
+    sizes = []
+    for name in ("plot_code_cache", "plot_image_cache", "semantic_answer_cache"):
+        cache = services.get_if_created(name)
+        if cache is None:
+            continue
+        stats = cache.stats()
+        cache_name = name[:-len("_cache")]
+        lookups.append(("", {"cache": cache_name, "call_type": "", "result": "hits"}, stats["hits"]))
+        lookups.append(("", {"cache": cache_name, "call_type": "", "result": "misses"}, stats["misses"]))
+        sizes.append(("", {"cache": cache_name}, stats["size"]))
+    return [
+        ("ai_agent_cache_lookups_total", "counter", "Cache lookups by result.", lookups),
+        ("ai_agent_cache_entries", "gauge", "Entries currently held by in-memory caches.", sizes),
+    ]
+
+REGISTRY.register_collector(collect_cache_metrics)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Tracks in-flight requests and request durations, and writes one structured log line per request with
+    its per-stage breakdown and token usage. For streamed answers the line is written when streaming starts.
+    """
+    endpoint = request.url.path
+    if endpoint == "/metrics":
+        return await call_next(request)
+    trace = RequestTrace(endpoint)
+    token = current_trace.set(trace)
+    REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+        REQUESTS_TOTAL.inc(endpoint=endpoint, status=str(status))
+        REQUEST_DURATION.observe(trace.elapsed(), endpoint=endpoint, intent=trace.attributes.get("intent", ""))
+        logger.info(json.dumps({**trace.to_log_dict(), "status": status}))
+        current_trace.reset(token)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def get_llm(llm_type: str) -> BaseLLM:
+    """Returns the LLM client for the given llm_type (hedged if enabled), or None if it is not supported. Backends are created on first use."""
+    return services.llm(llm_type)
+
+def start_speculative_branches(question: str, llm: BaseLLM, collections_names: List[str], speculation: Speculation) -> None:
+    """
+    Starts the branches the intent LLM call may select: context retrieval (local and cheap, so always) and, when the
+    local classifier gives the graph intent at least PIPELINE_GRAPH_SPECULATION_MIN_PROBABILITY, CSV selection and dataset loading.
+    """
+    probabilities = services.intent_classifier.predict_proba(question)
+    speculation.start("context", services.context_loader.aget_context(file_names=collections_names, question=question))
+    if probabilities.get("2", 0.0) >= PIPELINE_GRAPH_SPECULATION_MIN_PROBABILITY:
+        speculation.start("graph", select_graph_dataset(question, llm))
+
+async def classify_intent(question: str, llm: BaseLLM, collections_names: List[str] = None, speculation: Speculation = None) -> str:
+    """
+    Classifies the question intent with the local classifier, falling back to the LLM when it is not confident.
+    With a `speculation`, the likely branches run while the LLM call is in flight.
+    """
+    logger.info("Understanding intent...")
+    with span("intent.local"):
+        intent, confidence = services.intent_classifier.predict(question)
+    if confidence >= INTENT_CONFIDENCE_THRESHOLD:
+        logger.info(f"Found intent: {intent} (local classifier, confidence {confidence:.2f})")
+        INTENT_DECISIONS.inc(source="local")
+        annotate(intent=intent)
+        return intent
+    if speculation is not None:
+        start_speculative_branches(question, llm, collections_names, speculation)
+    intent = (await llm.agenerate_answer(question=question, question_type="intent", context="")).strip()
+    logger.info(f"Found intent: {intent}")
+    INTENT_DECISIONS.inc(source="llm")
+    annotate(intent=intent)
+    return intent
+
+async def run_branch(speculation: Speculation, branch: str, run: Callable[[], Awaitable]):
+    """Returns the result of the speculatively started branch, or runs it now if it was not started."""
+    if speculation is not None and branch in speculation:
+        return await speculation.take(branch)
+    return await run()
+
+async def select_graph_dataset(question: str, llm: BaseLLM) -> Tuple[str, str]:
+    """
+    Selects the dataset relevant to the question with the local dataset index (the LLM only breaks ties between the
+    top candidates) and loads it into the dataset registry. Returns the CSV and description paths.
+    """
+    dataset = await services.dataset_selector.aselect(question, llm)
+    if dataset is None:
+        raise FileNotFoundError(f"No described CSV files in {GRAPH_DATA_DIR}.")
+    logger.info(f"Found graph dataset: {dataset.name}")
+    annotate(dataset=dataset.name)
+    try:
+        await asyncio.to_thread(services.dataset_registry.get, dataset.csv_file, dataset.description_file)
+    except Exception as e:
+        # GraphGenerator reports loading errors itself.
+        logger.warning(f"Could not load dataset {dataset.csv_file}: {e}")
+    return dataset.csv_file, dataset.description_file
+
+async def generate_graph_response(question: str, llm: BaseLLM, image_format: str = "png", speculation: Speculation = None) -> Response:
+    """Selects the relevant CSV file (unless selected speculatively), generates the plot and returns the image rendered in memory."""
+    # Imported here so pandas and matplotlib are only loaded once a graph is requested.
+    from src.graph.graph_generator import GraphGenerator
+    csv_file, description_file = await run_branch(speculation, "graph", lambda: select_graph_dataset(question, llm))
+    graph_generator = await asyncio.to_thread(GraphGenerator, csv_file=csv_file, description_file=description_file, llm=llm,
+                                              dataset_registry=services.dataset_registry, plot_code_cache=services.plot_code_cache,
+                                              image_cache=services.plot_image_cache, worker_pool=services.plot_worker_pool)
+    rendered_plot = await graph_generator.arender_plot(plot_question=question, image_format=image_format)
+    logger.info(f"Plot {rendered_plot.plot_id} rendered ({len(rendered_plot.content)} bytes, cached: {rendered_plot.cached}).")
+    return Response(content=rendered_plot.content, media_type=rendered_plot.media_type, headers={"X-Plot-Id": rendered_plot.plot_id})
+
+async def lookup_semantic_answer(request: GeneralAnsweringRequest, llm: BaseLLM) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Looks up the answer to an earlier paraphrase of the question asked in the same session against the same backend, collections
+    and corpus version.
+    A hit is added to the session's chat history as if it had been generated.
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: The cached answer (None on a miss) and the corpus version to store a new answer
+            under (None if the semantic cache is disabled).
+    """
+    if not SEMANTIC_CACHE_ENABLED or not request.collections_names:
+        return None, None
+    with span("semantic_cache.lookup"):
+        corpus_version = services.context_loader.collections_version(request.collections_names)
+        answer = services.semantic_answer_cache.get(request.question, llm.backend, request.collections_names, corpus_version,
+                                                     session_id=request.session_id)
+    annotate(semantic_cache="hit" if answer is not None else "miss")
+    if answer is not None:
+        logger.info("Answer served from the semantic cache.")
+        await asyncio.to_thread(llm.save_chat_history, request.session_id, [
+            {"role": "user", "content": request.question},
+            {"role": "assistant", "content": answer},
+        ])
+    return answer, corpus_version
+
+def store_semantic_answer(request: GeneralAnsweringRequest, llm: BaseLLM, corpus_version: Optional[str], answer: str) -> None:
+    """Stores a generated answer in the semantic cache under the session and corpus version it was generated from."""
+    if corpus_version is None or not answer or answer == "Could not provide answer.":
+        return
+    services.semantic_answer_cache.put(request.question, answer, llm.backend, request.collections_names, corpus_version,
+                                      session_id=request.session_id)
+
+def log_request(request: GeneralAnsweringRequest) -> None:
+    """Logs the received request fields."""
+    logger.info(f"Received question: {request.question[:200]}...")
+    logger.info(f"Received collections_names: {request.collections_names}...")
+    logger.info(f"Received llm_type: {request.llm_type}...")
+    annotate(llm_type=request.llm_type)
 
 @app.post("/general_answering")
 async def general_answering(request: GeneralAnsweringRequest):
+    speculation = Speculation() if PIPELINE_SPECULATION_ENABLED else None
     try:
         logger.info("general_answering request received.")
-        
+        log_request(request)
         question = request.question
-        logger.info(f"Received question: {question[:200]}...")
-        collections_names = request.collections_names
-        logger.info(f"Received collections_names: {collections_names}...")
-        llm_type = request.llm_type
-        logger.info(f"Received llm_type: {llm_type}...")
-
-        if llm_type == "openai":
-            llm = openai_llm
-        elif llm_type == "llama":
-            llm = bedrock_llama_llm
-        else:
+
+        llm = get_llm(request.llm_type)
+        if llm is None:
             return {
                 'answer': "Please provide valid llm_type!"
             }
-        
-        logger.info("Understanding intent...")
-        intent = llm.generate_answer(question=question, question_type="intent", context="").strip()
-        logger.info(f"Found intent: {intent}")
+
+        intent = await classify_intent(question, llm, request.collections_names, speculation)
 
         if intent == "1":
-            context = context_loader.get_context(file_names=collections_names)
+            cached_answer, corpus_version = await lookup_semantic_answer(request, llm)
+            if cached_answer is not None:
+                return {
+                    'answer': cached_answer
+                }
+            context = await run_branch(speculation, "context", lambda: services.context_loader.aget_context(
+                file_names=request.collections_names, question=question))
             if not context:
                 return {
                     'answer': "Please provide valid collections_names!"
                 }
-            answer = llm.generate_answer(question=question, question_type="general", context=context)
+            answer = await llm.agenerate_answer(question=question, question_type="general", context=context, session_id=request.session_id)
             logger.info(f"Answer generated: {answer[:100]}...")
+            store_semantic_answer(request, llm, corpus_version, answer)
             return {
                 'answer': answer
             }
         elif intent == "2":
-            file_descriptions = context_loader.get_graph_context()
-            found_filename = llm.select_relevant_csv_file(file_descriptions=file_descriptions, user_question=question)
-            logger.info(f"Found graph filename: {found_filename}")
-            csv_file = GRAPH_DATA_DIR + "/" + found_filename.split("_")[0] + ".csv"
-            description_file = GRAPH_DATA_DIR + "/" + found_filename
-            graph_generator = GraphGenerator(csv_file=csv_file, description_file=description_file, llm_type=llm_type)
-            graph_generator.generate_plot(plot_question=question)
-            return FileResponse(GRAPH_IMAGE_PATH, media_type="image/png")
+            return await generate_graph_response(question, llm, request.image_format, speculation)
+        elif intent == "3":
+            return {
+                'answer': "I will create task you requested!"
+            }
+        else:
+            raise Exception("Something went wrong, when finding intent.")
+    except Exception as e:
+        logger.error(f"An error occurred while generating answer: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if speculation is not None:
+            speculation.cancel()
+
+def format_sse(event: str, data: dict) -> str:
+    """Formats a Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_answer_events(llm: BaseLLM, question: str, context: str, session_id: str, start_time: float,
+                               on_done: Callable[[str], None] = None) -> AsyncIterator[str]:
+    """
+    Streams the answer as SSE "token" events followed by a "done" event holding the full answer,
+    time to first token and total generation time (both measured from request arrival).
+    `on_done` is called with the full answer once it was streamed completely.
+    """
+    parts = []
+    time_to_first_token = None
+    try:
+        async for token in llm.astream_answer(question=question, context=context, session_id=session_id):
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start_time
+                logger.info(f"Time to first token: {time_to_first_token * 1000:.0f} ms")
+            parts.append(token)
+            yield format_sse("token", {"token": token})
+        total_time = time.perf_counter() - start_time
+        logger.info(f"Answer streamed in {total_time * 1000:.0f} ms.")
+        if on_done is not None:
+            on_done("".join(parts))
+        yield format_sse("done", {
+            "answer": "".join(parts),
+            "time_to_first_token_ms": round(time_to_first_token * 1000, 1) if time_to_first_token is not None else None,
+            "total_time_ms": round(total_time * 1000, 1),
+        })
+    except Exception as e:
+        logger.error(f"An error occurred while streaming answer: {str(e)}")
+        yield format_sse("error", {"detail": str(e)})
+
+async def cached_answer_events(answer: str, start_time: float) -> AsyncIterator[str]:
+    """Streams a cached answer as one "token" event followed by the "done" event, like `stream_answer_events`."""
+    elapsed_ms = round((time.perf_counter() - start_time) * 1000, 1)
+    yield format_sse("token", {"token": answer})
+    yield format_sse("done", {"answer": answer, "time_to_first_token_ms": elapsed_ms, "total_time_ms": elapsed_ms})
+
+@app.post("/general_answering/stream")
+async def general_answering_stream(request: GeneralAnsweringRequest):
+    start_time = time.perf_counter()
+    speculation = Speculation() if PIPELINE_SPECULATION_ENABLED else None
+    try:
+        logger.info("general_answering_stream request received.")
+        log_request(request)
+        question = request.question
+
+        llm = get_llm(request.llm_type)
+        if llm is None:
+            return {
+                'answer': "Please provide valid llm_type!"
+            }
+
+        intent = await classify_intent(question, llm, request.collections_names, speculation)
+
+        if intent == "1":
+            cached_answer, corpus_version = await lookup_semantic_answer(request, llm)
+            if cached_answer is not None:
+                return StreamingResponse(
+                    cached_answer_events(cached_answer, start_time),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+                )
+            context = await run_branch(speculation, "context", lambda: services.context_loader.aget_context(
+                file_names=request.collections_names, question=question))
+            if not context:
+                return {
+                    'answer': "Please provide valid collections_names!"
+                }
+            return StreamingResponse(
+                stream_answer_events(llm, question, context, request.session_id, start_time,
+                                     on_done=lambda answer: store_semantic_answer(request, llm, corpus_version, answer)),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        elif intent == "2":
+            return await generate_graph_response(question, llm, request.image_format, speculation)
         elif intent == "3":
             return {
                 'answer': "I will create task you requested!"
@@ -88,7 +338,11 @@ async def general_answering(request: GeneralAnsweringRequest):
     except Exception as e:
         logger.error(f"An error occurred while generating answer: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if speculation is not None:
+            speculation.cancel()
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
@@ -0,0 +1,135 @@
+"""
+Cold start benchmark: time to import the app and time from process start to the first answered request.
+
+Usage:
+    python -m benchmarks.cold_start --runs 5 --llm-type openai --intent 1
+
+Every run starts a fresh Python process serving the app against the local fake LLM servers. Results are printed
+and saved as JSON (benchmarks/results/cold_start-<timestamp>.json by default).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_llm_servers import FakeLLMConfig, FakeLLMServer
+from benchmarks.run_benchmarks import INTENT_QUESTIONS, free_port, summarize_latencies
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("numpy", "pandas", "matplotlib", "openai", "boto3")
+
+# Runs in the child process. Reports the import time and which heavy modules the import loaded, then serves the app.
+SERVER_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+from src.api import constants
+constants.CHAT_HISTORY_DB_PATH = sys.argv[1] + "/history.sqlite3"
+constants.RESPONSE_CACHE_PATH = sys.argv[1] + "/llm_responses.sqlite3"
+import app
+import_seconds = time.perf_counter() - start
+print(json.dumps({"import_seconds": import_seconds, "loaded_modules": [m for m in sys.argv[3].split(",") if m in sys.modules]}), flush=True)
+import uvicorn
+uvicorn.run(app.app, host="127.0.0.1", port=int(sys.argv[2]), log_level="warning")
+"""
+
+def child_environment(openai_server: FakeLLMServer, bedrock_server: FakeLLMServer) -> Dict[str, str]:
+    """Environment pointing the child process at the fake servers, like `configure_environment` does in process."""
+    return {
+        **os.environ,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": openai_server.url + "/v1",
+        "AWS_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_ENDPOINT_URL_BEDROCK_RUNTIME": bedrock_server.url,
+        "PYTHONPATH": ROOT_DIRECTORY,
+    }
+
+def cold_start_once(env: Dict[str, str], payload: dict, timeout: float = 120.0) -> Dict[str, object]:
+    """
+    Starts the app in a new process and sends one request as soon as the server accepts connections.
+
+    Returns:
+        Dict[str, object]: import_ms, time_to_first_request_ms (process start until the first answer),
+            first_request_ms (the first request alone) and the heavy modules loaded by the import.
+    """
+    import httpx
+    work_directory = tempfile.mkdtemp(prefix="ai-agent-cold-start-")
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", SERVER_SCRIPT, work_directory, str(port), ",".join(HEAVY_MODULES)],
+                               cwd=ROOT_DIRECTORY, env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        import_report = json.loads(process.stdout.readline())
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            while True:
+                if time.perf_counter() - start > timeout or process.poll() is not None:
+                    raise RuntimeError("App did not start.")
+                try:
+                    request_start = time.perf_counter()
+                    response = client.post("/general_answering", json=payload)
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+        end = time.perf_counter()
+        return {
+            "import_ms": round(import_report["import_seconds"] * 1000, 1),
+            "time_to_first_request_ms": round((end - start) * 1000, 1),
+            "first_request_ms": round((end - request_start) * 1000, 1),
+            "status": response.status_code,
+            "loaded_modules": import_report["loaded_modules"],
+        }
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure app import time and time to the first answered request.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh processes to start.")
+    parser.add_argument("--llm-type", default="openai", help="Backend of the first request.")
+    parser.add_argument("--intent", default="1", choices=sorted(INTENT_QUESTIONS), help="Intent of the first request.")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake LLM latency before the first byte.")
+    parser.add_argument("--output", default=None, help="Result file. Default is benchmarks/results/cold_start-<timestamp>.json.")
+    return parser.parse_args(argv)
+
+def main(argv: List[str] = None) -> Dict[str, object]:
+    args = parse_args(argv)
+    llm_config = FakeLLMConfig(latency_ms=args.latency_ms, jitter_ms=0)
+    openai_server = FakeLLMServer(llm_config).start()
+    bedrock_server = FakeLLMServer(llm_config).start()
+    payload = {"question": INTENT_QUESTIONS[args.intent], "collections_names": ["sales"], "llm_type": args.llm_type}
+    try:
+        env = child_environment(openai_server, bedrock_server)
+        runs = [cold_start_once(env, payload) for _ in range(args.runs)]
+    finally:
+        openai_server.stop()
+        bedrock_server.stop()
+
+    summary = {key: summarize_latencies([run[key] / 1000 for run in runs]) for key in ("import_ms", "time_to_first_request_ms", "first_request_ms")}
+    for key, stats in summary.items():
+        print(f"{key:<26} p50 {stats['p50_ms']:>9.1f} ms  max {stats['max_ms']:>9.1f} ms")
+    print(f"Modules loaded by `import app`: {', '.join(runs[0]['loaded_modules']) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "runs": runs,
+        "summary": summary,
+    }
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "cold_start-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=4)
+    print(f"Results saved to {output}")
+    return results
+
+if __name__ == "__main__":
+    main()
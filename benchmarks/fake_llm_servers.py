@@ -0,0 +1,156 @@
+import re
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+LLAMA_MESSAGE_PATTERN = re.compile(r"<\|start_header_id\|>(\w+)<\|end_header_id\|>\n\n(.*?)<\|eot_id\|>", re.DOTALL)
+FILLER_WORDS = ("revenue", "growth", "region", "customers", "conversion", "retention", "pipeline", "quarter", "strategy", "team")
+PLOT_CODE = "plt.bar(df.iloc[:20, 0].astype(str), df.select_dtypes('number').iloc[:20, 0])"
+
+class FakeLLMConfig:
+    def __init__(self, latency_ms: float = 200.0, jitter_ms: float = 20.0, response_words: int = 80, token_delay_ms: float = 5.0) -> None:
+        """
+        Behaviour of the fake LLM servers.
+
+        Args:
+            latency_ms (float, optional): Time before the first byte of every response. Default is 200.
+            jitter_ms (float, optional): Uniform random jitter added to the latency. Default is 20.
+            response_words (int, optional): Number of words in general answers. Default is 80.
+            token_delay_ms (float, optional): Delay between streamed tokens. Default is 5.
+        """
+        self.latency_ms: float = latency_ms
+        self.jitter_ms: float = jitter_ms
+        self.response_words: int = response_words
+        self.token_delay_ms: float = token_delay_ms
+
+    def sleep(self) -> None:
+        time.sleep(max(self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000)
+
+def fake_intent(question: str) -> str:
+    """Intent of a lower-cased question, by keywords."""
+    if re.search(r"plot|chart|graph|visuali", question):
+        return "2"
+    if re.search(r"schedule|remind|alert|create a task|follow-up", question):
+        return "3"
+    return "1"
+
+def fake_completion(messages: List[Dict[str, str]], config: FakeLLMConfig) -> str:
+    """
+    Answers like the real model would for each call type of the app, recognised from the system prompt.
+
+    Args:
+        messages (List[Dict[str, str]]): Chat messages of the request.
+        config (FakeLLMConfig): Server behaviour.
+
+    Returns:
+        str: The completion text.
+    """
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "").lower()
+    if "intent classification" in system and "numbered list" in system:
+        inputs = re.findall(r"^\d+\. (.*)$", user, re.MULTILINE)
+        return json.dumps([int(fake_intent(text)) for text in inputs])
+    if "intent classification" in system:
+        return fake_intent(user)
+    if "most relevant CSV file" in system:
+        return "sport_csv_description.txt" if "sport" in user else "sales_csv_description.txt"
+    if "data scientist and Python programmer" in system:
+        return PLOT_CODE
+    return " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(config.response_words)) + "."
+
+def parse_llama_prompt(prompt: str) -> List[Dict[str, str]]:
+    """Splits a Llama 3 formatted prompt back into chat messages."""
+    return [{"role": role, "content": content} for role, content in LLAMA_MESSAGE_PATTERN.findall(prompt)]
+
+def _handler(config: FakeLLMConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def _read_json(self) -> dict:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _send_json(self, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:
+            request = self._read_json()
+            config.sleep()
+            if self.path.rstrip("/").endswith("/chat/completions"):
+                self._openai(request)
+            elif re.match(r"^/model/[^/]+/invoke$", self.path):
+                text = fake_completion(parse_llama_prompt(request.get("prompt", "")), config)
+                self._send_json({"generation": text, "prompt_token_count": len(request.get("prompt", "")) // 4,
+                                 "generation_token_count": len(text.split()), "stop_reason": "stop"})
+            else:
+                self.send_error(404)
+
+        def _openai(self, request: dict) -> None:
+            text = fake_completion(request.get("messages", []), config)
+            created = int(time.time())
+            if not request.get("stream"):
+                self._send_json({
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": request.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+                })
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in text.split(" "):
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": request.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(config.token_delay_ms / 1000)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return Handler
+
+class FakeLLMServer:
+    def __init__(self, config: FakeLLMConfig = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        Local HTTP server answering both the OpenAI chat completions API (`/v1/chat/completions`, including streaming)
+        and the Bedrock runtime invoke API (`/model/<model id>/invoke`).
+
+        Args:
+            config (FakeLLMConfig, optional): Server behaviour. Default is FakeLLMConfig().
+            host (str, optional): Interface to bind. Default is "127.0.0.1".
+            port (int, optional): Port to bind, 0 picks a free one. Default is 0.
+        """
+        self.config: FakeLLMConfig = config or FakeLLMConfig()
+        self.server = ThreadingHTTPServer((host, port), _handler(self.config))
+        self.server.daemon_threads = True
+        self.thread: threading.Thread = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        host, port = self.address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeLLMServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-llm-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,227 @@
+"""
+End-to-end and micro benchmarks against local fake LLM servers.
+
+Usage:
+    python -m benchmarks.run_benchmarks --concurrency 1,8,32 --requests 64 --latency-ms 200
+
+Results are printed and saved as JSON (benchmarks/results/<timestamp>.json by default) so runs can be compared.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import platform
+import numpy as np
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_llm_servers import FakeLLMConfig, FakeLLMServer, PLOT_CODE
+
+INTENT_QUESTIONS = {
+    "1": "Which region generated the most revenue and how should we improve conversion?",
+    "2": "Plot the revenue generated by each sales rep as a bar chart",
+    "3": "Schedule a follow-up email to all leads contacted last week",
+}
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    """
+    Summarises latencies given in seconds.
+
+    Returns:
+        Dict[str, float]: count, mean, p50, p95, p99 and max, in milliseconds.
+    """
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies, dtype=float) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "mean_ms": round(float(values.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(values.max()), 3)}
+
+def time_calls(fn: Callable[[], object], iterations: int, warmup: int = 3) -> Dict[str, float]:
+    """Calls fn repeatedly and summarises the per-call latency."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return summarize_latencies(latencies)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def configure_environment(openai_server: FakeLLMServer, bedrock_server: FakeLLMServer, work_directory: str, use_caches: bool) -> None:
+    """
+    Points the app at the fake servers and at a throwaway directory for chat history and caches.
+    Must run before `app` is imported, since the app reads its configuration at import time.
+    """
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["OPENAI_BASE_URL"] = openai_server.url + "/v1"
+    os.environ["AWS_REGION"] = "us-east-1"
+    os.environ["AWS_ACCESS_KEY_ID"] = "benchmark"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "benchmark"
+    os.environ["AWS_ENDPOINT_URL_BEDROCK_RUNTIME"] = bedrock_server.url
+
+    from src.api import constants
+    constants.CHAT_HISTORY_DB_PATH = os.path.join(work_directory, "history.sqlite3")
+    constants.RESPONSE_CACHE_PATH = os.path.join(work_directory, "llm_responses.sqlite3")
+    if not use_caches:
+        constants.RESPONSE_CACHE_CALL_TYPES = []
+        constants.PLOT_CODE_CACHE_SIZE = 0
+        constants.PLOT_IMAGE_CACHE_SIZE = 0
+        constants.SEMANTIC_CACHE_ENABLED = False
+
+def start_app_server(app) -> "uvicorn.Server":
+    """Runs the app with uvicorn on a free local port in a background thread."""
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=free_port(), log_level="warning"))
+    threading.Thread(target=server.run, name="benchmark-app", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+async def drive_endpoint(base_url: str, payload: dict, concurrency: int, total_requests: int, warmup: int = 2) -> Dict[str, float]:
+    """
+    Sends total_requests POST /general_answering requests with at most `concurrency` in flight.
+
+    Returns:
+        Dict[str, float]: Latency summary plus throughput (requests per second) and error count.
+    """
+    import httpx
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        for i in range(warmup):
+            await client.post("/general_answering", json={**payload, "session_id": f"warmup-{i}"})
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+        errors = 0
+
+        async def one(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/general_answering", json={**payload, "session_id": f"bench-{i % concurrency}"})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+        wall = time.perf_counter() - start
+    return {**summarize_latencies(latencies), "throughput_rps": round(total_requests / wall, 3), "errors": errors}
+
+def run_end_to_end(app_url: str, args: argparse.Namespace) -> List[Dict[str, object]]:
+    results = []
+    for llm_type in args.llm_types:
+        for intent in args.intents:
+            payload = {"question": INTENT_QUESTIONS[intent], "collections_names": ["sales"], "llm_type": llm_type}
+            for concurrency in args.concurrency:
+                summary = asyncio.run(drive_endpoint(app_url, payload, concurrency, args.requests))
+                result = {"llm_type": llm_type, "intent": intent, "concurrency": concurrency, **summary}
+                results.append(result)
+                print(f"{llm_type:<7} intent {intent} c={concurrency:<4} p50 {summary['p50_ms']:>9.1f} ms  p95 {summary['p95_ms']:>9.1f} ms  "
+                      f"p99 {summary['p99_ms']:>9.1f} ms  {summary['throughput_rps']:>8.1f} req/s  errors {summary['errors']}")
+    return results
+
+def run_micro(app_module, work_directory: str, iterations: int) -> Dict[str, Dict[str, float]]:
+    """Micro-benchmarks of context assembly, chat history I/O and plot rendering."""
+    from src.api.constants import GRAPH_DATA_DIR
+    from src.history.chat_history_store import ChatHistoryStore
+    from src.graph.dataset_registry import DatasetRegistry
+    from src.graph.graph_generator import GraphGenerator
+    from src.graph.plot_renderer import PlotImageCache
+
+    loader = app_module.context_loader
+    question = INTENT_QUESTIONS["1"]
+    results = {
+        "context_loader.get_context[bm25]": time_calls(lambda: loader.get_context(["sales", "ida"], question=question), iterations),
+        "context_loader.get_context[full]": time_calls(lambda: loader.get_context(["sales", "company"]), iterations),
+        "context_loader.get_graph_context": time_calls(loader.get_graph_context, iterations),
+    }
+
+    store = ChatHistoryStore(os.path.join(work_directory, "micro_history.sqlite3"))
+    turn = [{"role": "user", "content": question}, {"role": "assistant", "content": "Answer " * 50}]
+    results["chat_history.append"] = time_calls(lambda: store.append("openai", "micro", turn), iterations)
+    results["chat_history.tail"] = time_calls(lambda: store.tail("openai", "micro", 10), iterations)
+
+    class FixedCodeLLM:
+        def generate_plot_creation_code(self, user_question, df, df_description):
+            return PLOT_CODE
+
+    csv_file, description_file = GRAPH_DATA_DIR + "/sales.csv", GRAPH_DATA_DIR + "/sales_csv_description.txt"
+    registry = DatasetRegistry()
+    uncached = GraphGenerator(csv_file, description_file, llm=FixedCodeLLM(), dataset_registry=registry)
+    cached = GraphGenerator(csv_file, description_file, llm=FixedCodeLLM(), dataset_registry=registry, image_cache=PlotImageCache())
+    render_iterations = max(iterations // 10, 5)
+    results["graph_generator.render_plot[png]"] = time_calls(lambda: uncached.render_plot("revenue per rep"), render_iterations)
+    results["graph_generator.render_plot[svg]"] = time_calls(lambda: uncached.render_plot("revenue per rep", "svg"), render_iterations)
+    results["graph_generator.render_plot[image cache hit]"] = time_calls(lambda: cached.render_plot("revenue per rep"), iterations)
+
+    for name, summary in results.items():
+        print(f"{name:<48} p50 {summary['p50_ms']:>9.3f} ms  p95 {summary['p95_ms']:>9.3f} ms  p99 {summary['p99_ms']:>9.3f} ms")
+    return results
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark /general_answering and internal stages against fake LLM servers.")
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 8, 32], help="Comma separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per (backend, intent, concurrency) combination.")
+    parser.add_argument("--llm-types", type=lambda v: v.split(","), default=["openai", "llama"], help="Comma separated backends.")
+    parser.add_argument("--intents", type=lambda v: v.split(","), default=["1", "2", "3"], help="Comma separated intents.")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Fake LLM latency before the first byte.")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Uniform jitter added to the fake LLM latency.")
+    parser.add_argument("--response-words", type=int, default=80, help="Words per general answer of the fake LLM.")
+    parser.add_argument("--micro-iterations", type=int, default=200, help="Iterations per micro-benchmark.")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response, semantic answer, plot code and plot image caches.")
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run the micro-benchmarks.")
+    parser.add_argument("--skip-micro", action="store_true", help="Only run the end-to-end benchmarks.")
+    parser.add_argument("--output", default=None, help="Result file. Default is benchmarks/results/<timestamp>.json.")
+    return parser.parse_args(argv)
+
+def main(argv: List[str] = None) -> Dict[str, object]:
+    args = parse_args(argv)
+    llm_config = FakeLLMConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, response_words=args.response_words)
+    openai_server = FakeLLMServer(llm_config).start()
+    bedrock_server = FakeLLMServer(llm_config).start()
+    work_directory = tempfile.mkdtemp(prefix="ai-agent-bench-")
+    configure_environment(openai_server, bedrock_server, work_directory, use_caches=not args.no_cache)
+
+    import app as app_module
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+    }
+    server = None
+    try:
+        if not args.skip_e2e:
+            server = start_app_server(app_module.app)
+            results["end_to_end"] = run_end_to_end(f"http://127.0.0.1:{server.config.port}", args)
+        if not args.skip_micro:
+            results["micro"] = run_micro(app_module, work_directory, args.micro_iterations)
+    finally:
+        if server is not None:
+            server.should_exit = True
+        openai_server.stop()
+        bedrock_server.stop()
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=4)
+    print(f"Results saved to {output}")
+    return results
+
+if __name__ == "__main__":
+    main()
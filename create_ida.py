@@ -1,16 +1,41 @@
 import os
+import json
+import argparse
+import hashlib
+import re
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from openai import OpenAI
 from dotenv import load_dotenv
+from src.context.csv_profiler import CsvProfiler
+from src.llm.client_pool import ClientPool
+from src.api.constants import INDEX_DIR, CSV_PROFILE_MAX_TOKENS, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY_SECONDS, LLM_REQUEST_TIMEOUT_SECONDS
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client_pool = ClientPool(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                         keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS, timeout=LLM_REQUEST_TIMEOUT_SECONDS)
+client = client_pool.openai()
 
 input_folder = "./data/general_answering_data"  
 output_folder = "./data/insight_direction_action_data"  
 os.makedirs(output_folder, exist_ok=True)
 
 model_name = "gpt-4o-mini"
+MANIFEST_FILENAME = ".ida_manifest.json"
+
+# Inputs larger than this are extracted chunk by chunk and the partial results merged.
+CHUNKED_THRESHOLD_BYTES = 32 * 1024
+CSV_CHUNK_ROWS = 200
+TEXT_WINDOW_CHARS = 12000
+TEXT_WINDOW_OVERLAP = 500
+IDA_SECTIONS = ("Insights", "Direction", "Action")
+# Output names of this version (see output_filename_for) and of older versions, which numbered outputs by listing order.
+OUTPUT_FILENAME_PATTERN = re.compile(r"^.+_(?:txt|csv)_ida\.txt$")
+LEGACY_OUTPUT_FILENAME_PATTERN = re.compile(r"^(.+)_ida_\d+\.txt$")
+
+csv_profiler = CsvProfiler(max_tokens=CSV_PROFILE_MAX_TOKENS, cache_directory=os.path.join(INDEX_DIR, "profiles"))
 
 def extract_data(file_content):
     system_message = (
@@ -50,51 +75,316 @@ def extract_data(file_content):
 def convert_csv_to_text(csv_path):
     """
     Reads a CSV file and converts it into a text summary.
-    You can customize this function to summarize trends or include descriptive statistics.
+    The summary is a token-budgeted statistical profile (column stats, top categories, trends and group-by
+    aggregates), so its size does not grow with the number of rows.
     """
     try:
-        df = pd.read_csv(csv_path)
-        table_text = df.to_markdown(index=False)
-        summary = f"CSV File Summary:\n- Total Records: {len(df)}\n- Columns: {', '.join(df.columns)}\n\n"
-        return summary + table_text
+        return "CSV File Summary:\n" + csv_profiler.profile(csv_path)
     except Exception as e:
         print(f"Error processing CSV file {csv_path}: {e}")
         return None
 
-def process_files(input_folder, output_folder):
-    for index, filename in enumerate(os.listdir(input_folder)):
-        filepath = os.path.join(input_folder, filename)
-        file_content = ""
-        
-        if filename.lower().endswith(".csv"):
-            print(f"Processing CSV file: {filepath}")
-            file_content = convert_csv_to_text(filepath)
-            if file_content is None:
-                print(f"Skipping file {filename} due to CSV processing error.")
-                continue
-        elif filename.lower().endswith(".txt"):
-            print(f"Processing text file: {filepath}")
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    file_content = f.read()
-            except Exception as e:
-                print(f"Error reading {filename}: {e}")
-                continue
-        else:
+def file_sha256(filepath):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def output_filename_for(filename):
+    """
+    Returns a stable output name for an input file. The extension is kept in the name so that
+    e.g. sales.txt and sales.csv do not overwrite each other.
+    """
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}_{extension.lstrip('.').lower()}_ida.txt"
+
+def write_atomically(path, content):
+    """
+    Writes content to a temporary file and renames it over the target so readers never see partial files.
+    The temporary file has a unique name, so concurrent runs do not collide, and is removed if writing fails.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def load_manifest(output_folder):
+    manifest_path = os.path.join(output_folder, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print(f"Invalid manifest {manifest_path}, reprocessing all files.")
+        return {}
+
+def save_manifest(output_folder, manifest):
+    write_atomically(os.path.join(output_folder, MANIFEST_FILENAME), json.dumps(manifest, indent=4, sort_keys=True))
+
+def read_input_file(filepath):
+    """Reads a .csv or .txt input file as text. Returns None if it cannot be read."""
+    if filepath.lower().endswith(".csv"):
+        print(f"Processing CSV file: {filepath}")
+        return convert_csv_to_text(filepath)
+    print(f"Processing text file: {filepath}")
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+        return None
+
+def iter_csv_chunks(csv_path, chunk_rows=None):
+    """
+    Reads a CSV file with a chunked reader and yields each chunk as a markdown table,
+    so only one chunk of rows is in memory at a time.
+    """
+    start_row = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows or CSV_CHUNK_ROWS):
+        end_row = start_row + len(chunk)
+        summary = f"CSV File Chunk:\n- Records: {start_row + 1}-{end_row}\n- Columns: {', '.join(chunk.columns)}\n\n"
+        yield summary + chunk.to_markdown(index=False)
+        start_row = end_row
+
+def iter_text_windows(filepath, window_chars=TEXT_WINDOW_CHARS, overlap=TEXT_WINDOW_OVERLAP):
+    """
+    Reads a text file incrementally and yields overlapping windows of at most window_chars characters.
+    Windows end on whitespace where possible so words are not cut in half.
+    """
+    buffer = ""
+    carried = 0
+    with open(filepath, "r", encoding="utf-8") as f:
+        while True:
+            block = f.read(window_chars - len(buffer))
+            buffer += block
+            if not block or len(buffer) < window_chars:
+                if len(buffer) > carried and buffer.strip():
+                    yield buffer
+                return
+            cut = max(buffer.rfind(" ", overlap, window_chars), buffer.rfind("\n", overlap, window_chars))
+            cut = cut if cut > overlap else window_chars
+            yield buffer[:cut]
+            buffer = buffer[cut - overlap:]
+            carried = len(buffer)
+
+def iter_input_chunks(filepath):
+    if filepath.lower().endswith(".csv"):
+        return iter_csv_chunks(filepath)
+    return iter_text_windows(filepath)
+
+def parse_ida_sections(extracted_text):
+    """
+    Splits an extraction result into its 'Insights', 'Direction' and 'Action' bullet items.
+    Nested bullets and continuation lines stay attached to the item above them.
+    """
+    sections = {name: [] for name in IDA_SECTIONS}
+    current = None
+    for line in extracted_text.splitlines():
+        heading = re.sub(r"[#*:\s]", "", line).lower()
+        matched = next((name for name in IDA_SECTIONS if heading == name.lower()), None)
+        if matched is not None:
+            current = matched
             continue
+        if current is None or not line.strip():
+            continue
+        if re.match(r"^(?:[-*\u2022]|\d+[.)])\s+", line):
+            sections[current].append(line.rstrip())
+        elif sections[current]:
+            sections[current][-1] += "\n" + line.rstrip()
+        else:
+            sections[current].append("- " + line.strip())
+    return sections
+
+def dedup_key(item):
+    """Normalised form of a bullet item used to detect duplicates across chunks."""
+    first_line = item.split("\n", 1)[0].lower()
+    return re.sub(r"[^a-z0-9]+", " ", re.sub(r"^\s*(?:[-*\u2022]|\d+[.)])\s+", "", first_line)).strip()
+
+def merge_ida_sections(merged, seen, sections):
+    """Adds the items of one partial result to the merged result, skipping duplicates."""
+    for name in IDA_SECTIONS:
+        for item in sections[name]:
+            key = dedup_key(item)
+            if key and key not in seen[name]:
+                seen[name].add(key)
+                merged[name].append(item)
 
+def format_ida_sections(sections):
+    return "\n\n".join(f"### {name}\n" + "\n".join(sections[name]) for name in IDA_SECTIONS)
+
+def extract_data_chunked(chunks, chunk_executor, max_in_flight=8):
+    """
+    Map-reduce extraction: every chunk is sent to `extract_data` in parallel and the partial results
+    are merged in input order with duplicate items removed. At most max_in_flight chunks are read
+    ahead, so memory stays flat regardless of input size.
+
+    Returns:
+        str: The merged IDA text, or None if any chunk failed.
+    """
+    merged = {name: [] for name in IDA_SECTIONS}
+    seen = {name: set() for name in IDA_SECTIONS}
+    pending = deque()
+    chunk_count = 0
+
+    def reduce_oldest():
+        result = pending.popleft().result()
+        if result is None:
+            return False
+        merge_ida_sections(merged, seen, parse_ida_sections(result))
+        return True
+
+    for chunk in chunks:
+        pending.append(chunk_executor.submit(extract_data, chunk))
+        chunk_count += 1
+        if len(pending) >= max_in_flight and not reduce_oldest():
+            for future in pending:
+                future.cancel()
+            return None
+    while pending:
+        if not reduce_oldest():
+            for future in pending:
+                future.cancel()
+            return None
+    print(f"Merged {chunk_count} chunk(s).")
+    return format_ida_sections(merged)
+
+def process_file(filepath, output_path, chunk_executor=None, chunked=None):
+    """
+    Extracts IDA from one input file and writes it atomically. Returns True on success.
+
+    Text files above CHUNKED_THRESHOLD_BYTES (or all files when chunked is True) are extracted with
+    `extract_data_chunked`, smaller ones in a single call. CSV files are profiled, so their prompt has a
+    constant size, unless chunked is True, which sends their rows in chunks instead.
+    """
+    if chunked is None:
+        chunked = not filepath.lower().endswith(".csv") and os.path.getsize(filepath) > CHUNKED_THRESHOLD_BYTES
+    if chunked:
+        print(f"Processing file in chunks: {filepath}")
+        try:
+            if chunk_executor is None:
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    extracted_result = extract_data_chunked(iter_input_chunks(filepath), executor)
+            else:
+                extracted_result = extract_data_chunked(iter_input_chunks(filepath), chunk_executor)
+        except Exception as e:
+            print(f"Error processing file {filepath}: {e}")
+            extracted_result = None
+    else:
+        file_content = read_input_file(filepath)
+        if file_content is None:
+            print(f"Skipping file {filepath} due to processing error.")
+            return False
         extracted_result = extract_data(file_content)
-        if extracted_result is not None:
-            output_filename = os.path.splitext(filename)[0] + f"_ida_{index}.txt"
-            output_path = os.path.join(output_folder, output_filename)
-            try:
-                with open(output_path, "w", encoding="utf-8") as out_f:
-                    out_f.write(extracted_result)
-                print(f"Extracted data saved to: {output_path}")
-            except Exception as e:
-                print(f"Error writing to {output_filename}: {e}")
-        else:
-            print(f"Skipping file {filename} due to extraction error.")
+
+    if extracted_result is None:
+        print(f"Skipping file {filepath} due to extraction error.")
+        return False
+    try:
+        write_atomically(output_path, extracted_result)
+        print(f"Extracted data saved to: {output_path}")
+        return True
+    except Exception as e:
+        print(f"Error writing to {output_path}: {e}")
+        return False
+
+def remove_output(output_folder, output_filename):
+    try:
+        os.remove(os.path.join(output_folder, output_filename))
+        print(f"Removed stale output: {output_filename}")
+    except FileNotFoundError:
+        pass
+
+def prune_outputs(output_folder, manifest, input_filenames):
+    """
+    Removes outputs (and manifest entries) of inputs that no longer exist, since every .txt file in output_folder
+    is loaded as IDA context. Numbered outputs of older versions are removed once every input with the same name
+    has a current output, so the context is not duplicated and never missing while a run is in progress.
+
+    Returns:
+        bool: True if the manifest changed.
+    """
+    current_outputs = {output_filename_for(filename) for filename in input_filenames}
+    stale_entries = [filename for filename in manifest if filename not in input_filenames]
+    for filename in stale_entries:
+        output_filename = manifest.pop(filename).get("output")
+        if output_filename and output_filename not in current_outputs:
+            remove_output(output_folder, output_filename)
+    for output_filename in sorted(os.listdir(output_folder)):
+        if OUTPUT_FILENAME_PATTERN.match(output_filename):
+            if output_filename not in current_outputs:
+                remove_output(output_folder, output_filename)
+            continue
+        legacy = LEGACY_OUTPUT_FILENAME_PATTERN.match(output_filename)
+        if legacy:
+            sources = [filename for filename in input_filenames if os.path.splitext(filename)[0] == legacy.group(1)]
+            if all(os.path.exists(os.path.join(output_folder, output_filename_for(filename))) for filename in sources):
+                remove_output(output_folder, output_filename)
+    return bool(stale_entries)
+
+def process_files(input_folder, output_folder, max_workers=4, force=False, chunk_workers=4, chunked=None):
+    """
+    Converts every .txt and .csv file in input_folder into IDA format using a bounded pool of workers.
+    Chunks of large files are extracted on a separate pool of chunk_workers threads.
+
+    A manifest of input content hashes is kept in output_folder and updated after every finished file,
+    so unchanged inputs are skipped and an interrupted run resumes where it stopped. Outputs of removed or renamed
+    inputs are deleted at the end of the run, see `prune_outputs`.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = load_manifest(output_folder)
+    manifest_lock = threading.Lock()
+
+    jobs = []
+    input_filenames = set()
+    for filename in sorted(os.listdir(input_folder)):
+        if not filename.lower().endswith((".csv", ".txt")):
+            continue
+        input_filenames.add(filename)
+        filepath = os.path.join(input_folder, filename)
+        content_hash = file_sha256(filepath)
+        output_filename = output_filename_for(filename)
+        entry = manifest.get(filename)
+        up_to_date = (
+            entry is not None
+            and entry.get("sha256") == content_hash
+            and entry.get("model") == model_name
+            and os.path.exists(os.path.join(output_folder, entry.get("output", "")))
+        )
+        if up_to_date and not force:
+            print(f"Skipping unchanged file: {filepath}")
+            continue
+        jobs.append((filename, filepath, content_hash, output_filename))
+
+    def run(job):
+        filename, filepath, content_hash, output_filename = job
+        if process_file(filepath, os.path.join(output_folder, output_filename), chunk_executor, chunked):
+            with manifest_lock:
+                manifest[filename] = {"sha256": content_hash, "model": model_name, "output": output_filename}
+                save_manifest(output_folder, manifest)
+
+    # Chunks get their own pool so file workers waiting on their chunks can never starve them.
+    with ThreadPoolExecutor(max_workers=chunk_workers) as chunk_executor, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(run, jobs))
+    if prune_outputs(output_folder, manifest, input_filenames):
+        save_manifest(output_folder, manifest)
+    print(f"Processed {len(jobs)} file(s).")
 
 if __name__ == "__main__":
-    process_files(input_folder, output_folder)
+    parser = argparse.ArgumentParser(description="Convert files into insight-direction-action format.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of files processed concurrently.")
+    parser.add_argument("--force", action="store_true", help="Reprocess files even if they did not change.")
+    parser.add_argument("--chunk-workers", type=int, default=4, help="Number of chunks of large files extracted concurrently.")
+    parser.add_argument("--chunked", action="store_true", default=None, help="Extract every file in chunks, not only large ones.")
+    args = parser.parse_args()
+    process_files(input_folder, output_folder, max_workers=args.workers, force=args.force,
+                  chunk_workers=args.chunk_workers, chunked=args.chunked)
@@ -1,5 +1,58 @@
 GENERAL_ANSWERING_DATA_DIR = "./data/general_answering_data"
 IDA_DATA_DIR = "./data/insight_direction_action_data"
 GRAPH_DATA_DIR = "./data/graph_data"
-GRAPH_IMAGE_PATH = "./graphs/img.png"
-CHAT_HISTORY_DIR = "./chat_history"
\ No newline at end of file
+CHAT_HISTORY_DIR = "./chat_history"
+CHAT_HISTORY_DB_PATH = "./chat_history/history.sqlite3"
+CHAT_HISTORY_TAIL_MESSAGES = 10
+INDEX_DIR = "./data/index"
+CONTEXT_RETRIEVAL_MODE = "bm25"
+EMBEDDER_TYPE = "hashing"
+CONTEXT_TOP_K = 5
+CONTEXT_CHUNK_SIZE = 120
+CONTEXT_CHUNK_OVERLAP = 20
+CSV_PROFILE_MAX_TOKENS = 800
+CORPUS_POLL_INTERVAL_SECONDS = 2.0
+PROMPT_MAX_TOKENS = 4000
+PROMPT_HISTORY_SHARE = 0.25
+RESPONSE_CACHE_PATH = "./cache/llm_responses.sqlite3"
+RESPONSE_CACHE_MEMORY_SIZE = 1024
+RESPONSE_CACHE_TTL_SECONDS = 24 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 100000
+RESPONSE_CACHE_CALL_TYPES = ["intent", "csv_selection", "plot"]
+INTENT_EXAMPLES_PATH = "./data/intent_data/intent_examples.jsonl"
+INTENT_MODEL_PATH = "./data/index/intent_model.npz"
+INTENT_CONFIDENCE_THRESHOLD = 0.85
+PLOT_CODE_CACHE_SIZE = 256
+PLOT_IMAGE_CACHE_SIZE = 128
+PLOT_IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LLM_MAX_CONNECTIONS = 64
+LLM_MAX_KEEPALIVE_CONNECTIONS = 32
+LLM_KEEPALIVE_EXPIRY_SECONDS = 30.0
+LLM_REQUEST_TIMEOUT_SECONDS = 60.0
+LLM_HEDGING_ENABLED = False
+LLM_HEDGE_PERCENTILE = 95.0
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = 2.0
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_CALL_TYPES = ["intent", "csv_selection", "plot", "general"]
+STARTUP_PRELOAD_LLM_TYPES = []
+PIPELINE_SPECULATION_ENABLED = True
+PIPELINE_GRAPH_SPECULATION_MIN_PROBABILITY = 0.2
+DATASET_SELECTION_SAMPLE_ROWS = 50
+DATASET_SELECTION_MARGIN = 1.2
+DATASET_SELECTION_TIE_CANDIDATES = 3
+LLM_SINGLE_FLIGHT_ENABLED = True
+LLM_INTENT_BATCH_WINDOW_SECONDS = None
+LLM_INTENT_BATCH_MAX_SIZE = 16
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_EMBEDDER_TYPE = "hashing"
+SEMANTIC_CACHE_THRESHOLD = 0.9
+SEMANTIC_CACHE_MAX_ENTRIES = 1024
+SEMANTIC_CACHE_TTL_SECONDS = 60 * 60
+GRAPH_CUBE_ENABLED = True
+GRAPH_CUBE_MAX_CATEGORIES = 50
+GRAPH_CUBE_MAX_PAIR_CELLS = 2500
+PLOT_WORKER_POOL_ENABLED = True
+PLOT_WORKERS = None
+PLOT_WORKER_TIMEOUT_SECONDS = 30.0
+PLOT_WORKER_MEMORY_LIMIT_BYTES = 2 * 1024 * 1024 * 1024
+PLOT_WORKER_MAX_JOBS = 100
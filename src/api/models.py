@@ -1,10 +1,12 @@
-from typing import List
+from typing import List, Literal
 from pydantic import BaseModel
 
 class GeneralAnsweringRequest(BaseModel):
     question: str
     collections_names: List[str] = ["sales", "company"]
     llm_type: str = "openai"
+    session_id: str = "default"
+    image_format: Literal["png", "svg"] = "png"
 
 class IdaAnsweringRequest(BaseModel):
     question: str
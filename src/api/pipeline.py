@@ -0,0 +1,36 @@
+import asyncio
+from typing import Awaitable, Dict
+from src.metrics.metrics import REGISTRY
+from src.config.logging_config import logger
+
+SPECULATIONS = REGISTRY.counter("ai_agent_speculative_branches_total", "Branches started before the intent was known, by outcome.", ("branch", "outcome"))
+
+class Speculation:
+    def __init__(self) -> None:
+        """
+        Branches of a request started while its intent is still being classified. The branch the intent selects
+        is taken over with `take`; the others are cancelled with `cancel`.
+        """
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, branch: str, awaitable: Awaitable) -> None:
+        self.tasks[branch] = asyncio.ensure_future(awaitable)
+
+    def __contains__(self, branch: str) -> bool:
+        return branch in self.tasks
+
+    async def take(self, branch: str):
+        """Waits for a started branch and returns its result, raising its exception if it failed."""
+        task = self.tasks.pop(branch)
+        SPECULATIONS.inc(branch=branch, outcome="used")
+        return await task
+
+    def cancel(self) -> None:
+        """Cancels the branches that were not taken. Results or errors of branches that already finished are discarded."""
+        for branch, task in self.tasks.items():
+            task.cancel()
+            # Retrieves the outcome so a failed branch is not reported as a never-retrieved exception.
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            SPECULATIONS.inc(branch=branch, outcome="cancelled")
+            logger.info(f"Cancelled speculative {branch} branch.")
+        self.tasks.clear()
@@ -0,0 +1,211 @@
+import os
+import threading
+from typing import Callable, Dict, List
+from src.api.constants import GENERAL_ANSWERING_DATA_DIR, IDA_DATA_DIR, GRAPH_DATA_DIR, INDEX_DIR, CONTEXT_RETRIEVAL_MODE, CONTEXT_TOP_K, CONTEXT_CHUNK_SIZE, CONTEXT_CHUNK_OVERLAP, EMBEDDER_TYPE, CSV_PROFILE_MAX_TOKENS, CORPUS_POLL_INTERVAL_SECONDS
+from src.api.constants import INTENT_EXAMPLES_PATH, INTENT_MODEL_PATH, STARTUP_PRELOAD_LLM_TYPES
+from src.api.constants import CHAT_HISTORY_DB_PATH, PLOT_CODE_CACHE_SIZE, PLOT_IMAGE_CACHE_SIZE, PLOT_IMAGE_CACHE_MAX_BYTES
+from src.api.constants import LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY_SECONDS, LLM_REQUEST_TIMEOUT_SECONDS
+from src.api.constants import DATASET_SELECTION_SAMPLE_ROWS, DATASET_SELECTION_MARGIN, DATASET_SELECTION_TIE_CANDIDATES
+from src.api.constants import SEMANTIC_CACHE_EMBEDDER_TYPE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL_SECONDS
+from src.api.constants import GRAPH_CUBE_ENABLED, GRAPH_CUBE_MAX_CATEGORIES, GRAPH_CUBE_MAX_PAIR_CELLS
+from src.api.constants import PLOT_WORKER_POOL_ENABLED, PLOT_WORKERS, PLOT_WORKER_TIMEOUT_SECONDS, PLOT_WORKER_MEMORY_LIMIT_BYTES, PLOT_WORKER_MAX_JOBS
+from src.api.constants import LLM_SINGLE_FLIGHT_ENABLED, LLM_INTENT_BATCH_WINDOW_SECONDS, LLM_INTENT_BATCH_MAX_SIZE
+from src.api.constants import LLM_HEDGING_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_DEFAULT_DELAY_SECONDS, LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_CALL_TYPES
+from src.api.constants import RESPONSE_CACHE_PATH, RESPONSE_CACHE_MEMORY_SIZE, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_CALL_TYPES
+from src.config.logging_config import logger
+
+LLM_TYPES = ("openai", "llama")
+
+class Services:
+    def __init__(self) -> None:
+        """
+        Lazily created, process-wide objects of the app. Each one is built on first access, together with the
+        modules it needs, so importing the app stays cheap: pandas is imported with the first CSV profile or graph,
+        matplotlib with the first graph, and the openai/boto3 clients when their backend is first selected.
+        """
+        self.instances: Dict[str, object] = {}
+        # Reentrant, since building one object can require another (e.g. an LLM needs the response cache).
+        self.lock = threading.RLock()
+
+    def _get(self, name: str, factory: Callable[[], object]) -> object:
+        instance = self.instances.get(name)
+        if instance is not None:
+            return instance
+        with self.lock:
+            instance = self.instances.get(name)
+            if instance is None:
+                instance = self.instances[name] = factory()
+                logger.info(f"{type(instance).__name__} initialized.")
+            return instance
+
+    def get_if_created(self, name: str) -> object:
+        """Returns the object if it was already created, without creating it."""
+        return self.instances.get(name)
+
+    @property
+    def client_pool(self):
+        from src.llm.client_pool import ClientPool
+        return self._get("client_pool", lambda: ClientPool(
+            max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS, timeout=LLM_REQUEST_TIMEOUT_SECONDS))
+
+    def _create_corpus_watcher(self):
+        from src.context.corpus_snapshot import CorpusWatcher
+        corpus_watcher = CorpusWatcher([GENERAL_ANSWERING_DATA_DIR, IDA_DATA_DIR, GRAPH_DATA_DIR], poll_interval=CORPUS_POLL_INTERVAL_SECONDS)
+        corpus_watcher.start()
+        return corpus_watcher
+
+    @property
+    def corpus_watcher(self):
+        return self._get("corpus_watcher", self._create_corpus_watcher)
+
+    def _create_context_loader(self):
+        from src.context.context_loader import ContextLoader
+        from src.context.embedders import get_embedder
+        return ContextLoader(general_answering_data_directory=GENERAL_ANSWERING_DATA_DIR, ida_data_directory=IDA_DATA_DIR, graph_data_directory=GRAPH_DATA_DIR,
+                             retrieval_mode=CONTEXT_RETRIEVAL_MODE, index_directory=INDEX_DIR, top_k=CONTEXT_TOP_K,
+                             chunk_size=CONTEXT_CHUNK_SIZE, chunk_overlap=CONTEXT_CHUNK_OVERLAP,
+                             embedder=get_embedder(EMBEDDER_TYPE, self.client_pool),
+                             csv_profile_max_tokens=CSV_PROFILE_MAX_TOKENS, corpus_watcher=self.corpus_watcher)
+
+    @property
+    def context_loader(self):
+        return self._get("context_loader", self._create_context_loader)
+
+    @property
+    def intent_classifier(self):
+        from src.intent.intent_classifier import IntentClassifier
+        return self._get("intent_classifier", lambda: IntentClassifier.load_or_train(examples_path=INTENT_EXAMPLES_PATH, model_path=INTENT_MODEL_PATH))
+
+    @property
+    def response_cache(self):
+        from src.llm.response_cache import ResponseCache
+        return self._get("response_cache", lambda: ResponseCache(
+            sqlite_path=RESPONSE_CACHE_PATH, memory_size=RESPONSE_CACHE_MEMORY_SIZE, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES, enabled_call_types=RESPONSE_CACHE_CALL_TYPES))
+
+    @property
+    def semantic_answer_cache(self):
+        from src.llm.semantic_cache import SemanticAnswerCache
+        from src.context.embedders import get_embedder
+        return self._get("semantic_answer_cache", lambda: SemanticAnswerCache(
+            get_embedder(SEMANTIC_CACHE_EMBEDDER_TYPE, self.client_pool), threshold=SEMANTIC_CACHE_THRESHOLD,
+            max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS))
+
+    @property
+    def history_store(self):
+        from src.history.chat_history_store import ChatHistoryStore
+        return self._get("history_store", lambda: ChatHistoryStore(db_path=CHAT_HISTORY_DB_PATH))
+
+    @property
+    def openai_llm(self):
+        from src.llm.openai_llm import OpenaiLLM
+        return self._get("openai_llm", lambda: OpenaiLLM(response_cache=self.response_cache, history_store=self.history_store,
+                                                          client_pool=self.client_pool, single_flight=LLM_SINGLE_FLIGHT_ENABLED,
+                                                          intent_batch_window=LLM_INTENT_BATCH_WINDOW_SECONDS,
+                                                          intent_batch_max_size=LLM_INTENT_BATCH_MAX_SIZE))
+
+    @property
+    def bedrock_llama_llm(self):
+        from src.llm.bedrock_llm import BedrockLlamaLLM
+        return self._get("bedrock_llama_llm", lambda: BedrockLlamaLLM(response_cache=self.response_cache, history_store=self.history_store,
+                                                                      client_pool=self.client_pool, single_flight=LLM_SINGLE_FLIGHT_ENABLED,
+                                                                      intent_batch_window=LLM_INTENT_BATCH_WINDOW_SECONDS,
+                                                                      intent_batch_max_size=LLM_INTENT_BATCH_MAX_SIZE))
+
+    def _create_hedged_llm(self, llm_type: str):
+        from src.llm.hedged_llm import HedgedLLM
+        backends = {"openai": lambda: self.openai_llm, "llama": lambda: self.bedrock_llama_llm}
+        # The secondary backend is created with the first hedge, not with the primary.
+        secondary_type = next(other for other in LLM_TYPES if other != llm_type)
+        return HedgedLLM(backends[llm_type](), LazyBackend(backends[secondary_type], secondary_type), percentile=LLM_HEDGE_PERCENTILE,
+                         default_delay=LLM_HEDGE_DEFAULT_DELAY_SECONDS, min_samples=LLM_HEDGE_MIN_SAMPLES, call_types=LLM_HEDGE_CALL_TYPES)
+
+    def llm(self, llm_type: str):
+        """
+        Returns the LLM for the given llm_type, hedged with the other backend if LLM_HEDGING_ENABLED, or None if it is not supported.
+        The backend is created the first time it is selected.
+        """
+        if llm_type not in LLM_TYPES:
+            return None
+        if LLM_HEDGING_ENABLED:
+            return self._get(f"hedged_{llm_type}_llm", lambda: self._create_hedged_llm(llm_type))
+        return self.openai_llm if llm_type == "openai" else self.bedrock_llama_llm
+
+    @property
+    def dataset_registry(self):
+        from src.graph.dataset_registry import DatasetRegistry
+        return self._get("dataset_registry", lambda: DatasetRegistry(
+            build_cubes=GRAPH_CUBE_ENABLED, max_categories=GRAPH_CUBE_MAX_CATEGORIES, max_pair_cells=GRAPH_CUBE_MAX_PAIR_CELLS))
+
+    @property
+    def dataset_selector(self):
+        from src.graph.dataset_selector import DatasetSelector
+        return self._get("dataset_selector", lambda: DatasetSelector(
+            graph_data_directory=GRAPH_DATA_DIR, corpus_watcher=self.corpus_watcher, sample_rows=DATASET_SELECTION_SAMPLE_ROWS,
+            margin=DATASET_SELECTION_MARGIN, tie_candidates=DATASET_SELECTION_TIE_CANDIDATES))
+
+    @property
+    def plot_code_cache(self):
+        from src.graph.plot_code_cache import PlotCodeCache
+        return self._get("plot_code_cache", lambda: PlotCodeCache(max_entries=PLOT_CODE_CACHE_SIZE))
+
+    @property
+    def plot_image_cache(self):
+        from src.graph.plot_renderer import PlotImageCache
+        return self._get("plot_image_cache", lambda: PlotImageCache(max_entries=PLOT_IMAGE_CACHE_SIZE, max_bytes=PLOT_IMAGE_CACHE_MAX_BYTES))
+
+    def _create_plot_worker_pool(self):
+        from src.graph.plot_worker_pool import PlotWorkerPool
+        # Workers load every described graph dataset up front, so no plot job parses a CSV.
+        self.dataset_selector.rank("")
+        preload = [(candidate.csv_file, candidate.description_file) for candidate in self.dataset_selector.candidates.values()]
+        return PlotWorkerPool(size=PLOT_WORKERS, timeout=PLOT_WORKER_TIMEOUT_SECONDS, memory_limit=PLOT_WORKER_MEMORY_LIMIT_BYTES,
+                              max_jobs=PLOT_WORKER_MAX_JOBS, preload=preload, registry_options={
+                                  "build_cubes": GRAPH_CUBE_ENABLED, "max_categories": GRAPH_CUBE_MAX_CATEGORIES,
+                                  "max_pair_cells": GRAPH_CUBE_MAX_PAIR_CELLS})
+
+    @property
+    def plot_worker_pool(self):
+        """Worker processes running generated plot code, or None if PLOT_WORKER_POOL_ENABLED is off."""
+        if not PLOT_WORKER_POOL_ENABLED:
+            return None
+        return self._get("plot_worker_pool", self._create_plot_worker_pool)
+
+    def warm_up(self, llm_types: List[str] = None) -> None:
+        """
+        Creates what every request needs (corpus snapshot, context loader, intent classifier, dataset selection index)
+        before the first request arrives, and starts the plot workers, which import the graph stack in their own processes.
+
+        Args:
+            llm_types (List[str], optional): Backends to create as well. Default is STARTUP_PRELOAD_LLM_TYPES.
+        """
+        self.context_loader
+        self.intent_classifier
+        self.dataset_selector.rank("")
+        self.plot_worker_pool
+        for llm_type in STARTUP_PRELOAD_LLM_TYPES if llm_types is None else llm_types:
+            self.llm(llm_type)
+
+    def close(self) -> None:
+        corpus_watcher = self.get_if_created("corpus_watcher")
+        if corpus_watcher is not None:
+            corpus_watcher.stop()
+        plot_worker_pool = self.get_if_created("plot_worker_pool")
+        if plot_worker_pool is not None:
+            plot_worker_pool.close()
+
+class LazyBackend:
+    def __init__(self, factory: Callable[[], object], backend: str) -> None:
+        """
+        Stands in for an LLM backend that is only created when one of its methods is first used.
+
+        Args:
+            factory (Callable[[], object]): Returns the backend.
+            backend (str): Backend name, available without creating it.
+        """
+        self.factory: Callable[[], object] = factory
+        self.backend: str = backend
+
+    def __getattr__(self, name: str):
+        return getattr(self.factory(), name)
@@ -0,0 +1,208 @@
+import os
+import json
+import math
+import tempfile
+from collections import Counter
+from typing import Dict, List, Tuple
+from src.context.tokenizer import tokenize
+
+INDEX_FORMAT_VERSION = 1
+
+def chunk_text(text: str, chunk_size: int = 120, chunk_overlap: int = 20) -> List[str]:
+    """
+    Split text into chunks of at most `chunk_size` words, keeping paragraphs together when possible.
+
+    Args:
+        text (str): Text to split.
+        chunk_size (int, optional): Maximum number of words per chunk. Default is 120.
+        chunk_overlap (int, optional): Number of words repeated between consecutive windows of a long paragraph. Default is 20.
+
+    Returns:
+        List[str]: List of chunks.
+    """
+    step = max(chunk_size - chunk_overlap, 1)
+    chunks: List[str] = []
+    current: List[str] = []
+    for paragraph in text.split("\n\n"):
+        words = paragraph.split()
+        if not words:
+            continue
+        if len(words) > chunk_size:
+            if current:
+                chunks.append(" ".join(current))
+                current = []
+            for start in range(0, len(words), step):
+                chunks.append(" ".join(words[start:start + chunk_size]))
+                if start + chunk_size >= len(words):
+                    break
+            continue
+        if len(current) + len(words) > chunk_size:
+            chunks.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def sources_signature(file_paths: List[str]) -> Dict[str, List[int]]:
+    """
+    Build a signature of the given files based on their modification time and size.
+
+    Args:
+        file_paths (List[str]): Paths of the files the index is built from.
+
+    Returns:
+        Dict[str, List[int]]: Mapping of file path to [mtime_ns, size].
+    """
+    signature: Dict[str, List[int]] = {}
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        signature[file_path] = [stat.st_mtime_ns, stat.st_size]
+    return signature
+
+class BM25Index:
+    def __init__(self, chunks: List[Dict[str, str]], sources: Dict[str, List[int]] = None, k1: float = 1.5, b: float = 0.75,
+                 postings: Dict[str, List[Tuple[int, int]]] = None, doc_lengths: List[int] = None) -> None:
+        """
+        Initializes an Okapi BM25 inverted index over text chunks.
+
+        Args:
+            chunks (List[Dict[str, str]]): Chunks to index, each with "source" (file name) and "text" keys.
+            sources (Dict[str, List[int]], optional): Signature of the files the chunks come from.
+            k1 (float, optional): Term frequency saturation parameter. Default is 1.5.
+            b (float, optional): Document length normalization parameter. Default is 0.75.
+            postings (Dict[str, List[Tuple[int, int]]], optional): Precomputed inverted index, as stored on disk.
+            doc_lengths (List[int], optional): Precomputed number of terms per chunk, as stored on disk.
+        """
+        self.chunks: List[Dict[str, str]] = chunks
+        self.sources: Dict[str, List[int]] = sources or {}
+        self.k1: float = k1
+        self.b: float = b
+        if postings is not None and doc_lengths is not None:
+            self.postings: Dict[str, List[Tuple[int, int]]] = postings
+            self.doc_lengths: List[int] = doc_lengths
+        else:
+            self.postings = {}
+            self.doc_lengths = []
+            for chunk_id, chunk in enumerate(chunks):
+                terms = tokenize(chunk["text"])
+                self.doc_lengths.append(len(terms))
+                for term, tf in Counter(terms).items():
+                    self.postings.setdefault(term, []).append((chunk_id, tf))
+        self.avg_doc_length: float = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    @classmethod
+    def from_files(cls, file_paths: List[str], chunk_size: int = 120, chunk_overlap: int = 20) -> "BM25Index":
+        """
+        Builds an index by chunking the given text files.
+
+        Args:
+            file_paths (List[str]): Paths of the text files to index.
+            chunk_size (int, optional): Maximum number of words per chunk. Default is 120.
+            chunk_overlap (int, optional): Number of overlapping words between windows. Default is 20.
+
+        Returns:
+            BM25Index: The built index.
+        """
+        chunks: List[Dict[str, str]] = []
+        for file_path in file_paths:
+            with open(file_path, "r", encoding="utf-8") as file:
+                file_name = os.path.basename(file_path)
+                for text in chunk_text(file.read(), chunk_size=chunk_size, chunk_overlap=chunk_overlap):
+                    chunks.append({"source": file_name, "text": text})
+        return cls(chunks, sources=sources_signature(file_paths))
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, Dict[str, str]]]:
+        """
+        Scores all chunks against the query and returns the best matches.
+
+        Args:
+            query (str): The user question.
+            top_k (int, optional): Maximum number of chunks to return. Default is 5.
+
+        Returns:
+            List[Tuple[float, Dict[str, str]]]: (score, chunk) pairs sorted by descending score.
+        """
+        num_chunks = len(self.chunks)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[chunk_id] / self.avg_doc_length
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in best]
+
+    def is_stale(self, file_paths: List[str], signature: Dict[str, List[int]] = None) -> bool:
+        """
+        Checks whether the indexed files changed since the index was built.
+
+        Args:
+            file_paths (List[str]): Paths of the files that currently make up the collection.
+            signature (Dict[str, List[int]], optional): Current signature of the files, if already known. The files are stat'ed otherwise.
+
+        Returns:
+            bool: True if the index needs to be rebuilt.
+        """
+        if signature is not None:
+            return signature != self.sources
+        try:
+            return sources_signature(file_paths) != self.sources
+        except OSError:
+            return True
+
+    def save(self, index_path: str) -> None:
+        """
+        Persists the index to a JSON file, writing to a temporary file first so readers never see a partial index.
+
+        Args:
+            index_path (str): Path of the index file.
+        """
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        data = {
+            "version": INDEX_FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "sources": self.sources,
+            "chunks": self.chunks,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        # A unique temporary file per writer, so concurrent saves (e.g. from other processes) do not collide.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), prefix=os.path.basename(index_path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, index_path: str) -> "BM25Index":
+        """
+        Loads an index previously written with `save`.
+
+        Args:
+            index_path (str): Path of the index file.
+
+        Returns:
+            BM25Index: The loaded index, or None if the file is missing or has an incompatible format.
+        """
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "r", encoding="utf-8") as file:
+            try:
+                data = json.load(file)
+            except json.JSONDecodeError:
+                return None
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            return None
+        return cls(data["chunks"], sources=data["sources"], k1=data["k1"], b=data["b"],
+                   postings=data["postings"], doc_lengths=data["doc_lengths"])
@@ -1,8 +1,24 @@
 import os
-from typing import List
+import asyncio
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Dict, List, Tuple
+from src.context.bm25_index import BM25Index
+from src.context.corpus_snapshot import CorpusSnapshot, CorpusWatcher
+from src.context.vector_store import VectorStore
+from src.context.embedders import BaseEmbedder, HashingEmbedder
+from src.api.constants import INDEX_DIR
+from src.config.logging_config import logger
+from src.metrics.tracing import span
+
+if TYPE_CHECKING:
+    from src.context.csv_profiler import CsvProfiler
 
 class ContextLoader:
-    def __init__(self, general_answering_data_directory: str, ida_data_directory: str, graph_data_directory: str) -> None:
+    def __init__(self, general_answering_data_directory: str, ida_data_directory: str, graph_data_directory: str,
+                 retrieval_mode: str = "full", index_directory: str = None, top_k: int = 5,
+                 chunk_size: int = 120, chunk_overlap: int = 20, embedder: BaseEmbedder = None,
+                 csv_profiler: "CsvProfiler" = None, corpus_watcher: CorpusWatcher = None, csv_profile_max_tokens: int = 800) -> None:
         """
         Initialize the context loader with directories containing categorized files.
 
@@ -10,34 +26,225 @@ class ContextLoader:
             general_answering_data_directory (str): Path to the folder containing files for general answering.
             ida_data_directory (str): Path to the folder containing files for insight, direction, action answering.
             graph_data_directory (str): graph_data_directory
+            retrieval_mode (str, optional): "full" concatenates whole files, "bm25" returns only the top-k chunks
+                relevant to the question by keyword match and "vector" by embedding similarity. Default is "full".
+            index_directory (str, optional): Folder where per-collection BM25 indexes and vector stores are persisted.
+                BM25 indexes are kept only in memory if not set.
+            top_k (int, optional): Number of chunks returned in "bm25" mode. Default is 5.
+            chunk_size (int, optional): Maximum number of words per indexed chunk. Default is 120.
+            chunk_overlap (int, optional): Number of overlapping words between chunks of long paragraphs. Default is 20.
+            embedder (BaseEmbedder, optional): Embedder used in "vector" mode. Default is a local HashingEmbedder.
+            csv_profiler (CsvProfiler, optional): Profiler used for collections backed by a CSV file. Default is one
+                caching profiles in `index_directory`, created (and pandas imported) when the first CSV collection is requested.
+            corpus_watcher (CorpusWatcher, optional): Source of in-memory snapshots of the three data directories. Default is
+                a watcher without a poller, which checks the directories on every request.
+            csv_profile_max_tokens (int, optional): Token budget of the default CSV profiler. Default is 800.
         """
         self.general_answering_data_directory: str = general_answering_data_directory
         self.ida_data_directory: str = ida_data_directory
         self.graph_data_directory: str = graph_data_directory
+        self.retrieval_mode: str = retrieval_mode
+        self.index_directory: str = index_directory
+        self.top_k: int = top_k
+        self.chunk_size: int = chunk_size
+        self.chunk_overlap: int = chunk_overlap
+        self.embedder: BaseEmbedder = embedder or HashingEmbedder()
+        self._csv_profiler: "CsvProfiler" = csv_profiler
+        self.csv_profile_max_tokens: int = csv_profile_max_tokens
+        self.indexes: Dict[str, BM25Index] = {}
+        self.vector_stores: Dict[str, VectorStore] = {}
+        # One lock per (kind, collection), so concurrent first requests build a collection once while other collections stay available.
+        self.collection_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self.lock = threading.Lock()
+        self.corpus_watcher: CorpusWatcher = corpus_watcher or CorpusWatcher(
+            [general_answering_data_directory, ida_data_directory, graph_data_directory])
+
+    @property
+    def csv_profiler(self) -> "CsvProfiler":
+        if self._csv_profiler is None:
+            from src.context.csv_profiler import CsvProfiler
+            self._csv_profiler = CsvProfiler(max_tokens=self.csv_profile_max_tokens,
+                                             cache_directory=os.path.join(self.index_directory, "profiles") if self.index_directory else None)
+        return self._csv_profiler
 
-    def _load_txt_files_content(self, file_paths: List[str]) -> str:
+    def _load_txt_files_content(self, file_paths: List[str], snapshot: CorpusSnapshot) -> str:
         """
         Load and concatenate content from the given text files.
 
         Args:
             file_paths (List[str]): List of file paths to be read.
+            snapshot (CorpusSnapshot): Snapshot the files are read from.
 
         Returns:
             str: Combined content of all the files.
         """
         content: List[str] = []
         for file_path in file_paths:
-            with open(file_path, "r", encoding="utf-8") as file:
-                file_name = file_path.split("/")[-1]
-                content.append(file_name + "\n\n" + file.read() + "\n\n")
+            file_name = file_path.split("/")[-1]
+            content.append(file_name + "\n\n" + snapshot.read(file_path) + "\n\n")
+        return "\n".join(content)
+
+    def _load_csv_profiles(self, file_paths: List[str], snapshot: CorpusSnapshot) -> str:
+        """
+        Load the statistical profiles of the given CSV files, which stay the same size however many rows the files have.
+
+        Args:
+            file_paths (List[str]): List of CSV file paths.
+            snapshot (CorpusSnapshot): Snapshot providing the current version of the files.
+
+        Returns:
+            str: Combined profiles, each prefixed with the file name.
+        """
+        content: List[str] = []
+        for file_path in file_paths:
+            content.append(file_path.split("/")[-1] + "\n\n" + self.csv_profiler.profile(file_path, snapshot.signature([file_path])) + "\n\n")
+        return "\n".join(content)
+
+    def _get_collection_file_paths(self, collection_name: str, snapshot: CorpusSnapshot) -> List[str]:
+        """
+        Resolve the files that make up a collection.
+
+        Args:
+            collection_name (str): Collection name ("ida" or a file name without the '.txt' extension).
+                A collection without a '.txt' file but with a '.csv' one is backed by that CSV file.
+            snapshot (CorpusSnapshot): Snapshot the directories are listed from.
+
+        Returns:
+            List[str]: Paths of the collection files.
+        """
+        if collection_name == "ida":
+            # Only finished IDA outputs; the manifest and in-progress temporary files of create_ida.py are skipped.
+            return [self.ida_data_directory + "/" + ida_fn for ida_fn in snapshot.listdir(self.ida_data_directory)
+                    if ida_fn.endswith(".txt") and not ida_fn.startswith(".")]
+        txt_path = self.general_answering_data_directory + "/" + collection_name + ".txt"
+        csv_path = self.general_answering_data_directory + "/" + collection_name + ".csv"
+        if not snapshot.exists(txt_path) and snapshot.exists(csv_path):
+            return [csv_path]
+        return [txt_path]
+
+    def _split_csv_collections(self, file_names: List[str], snapshot: CorpusSnapshot) -> Tuple[List[str], List[str]]:
+        """
+        Separate text collections from collections backed by a CSV file.
+
+        Args:
+            file_names (List[str]): List of collection names.
+            snapshot (CorpusSnapshot): Snapshot the collections are resolved against.
+
+        Returns:
+            Tuple[List[str], List[str]]: Names of the text collections and paths of the CSV files.
+        """
+        text_names: List[str] = []
+        csv_paths: List[str] = []
+        for fn in file_names:
+            file_paths = self._get_collection_file_paths(fn, snapshot)
+            if len(file_paths) == 1 and file_paths[0].endswith(".csv"):
+                csv_paths.append(file_paths[0])
+            else:
+                text_names.append(fn)
+        return text_names, csv_paths
+
+    def _collection_lock(self, kind: str, collection_name: str) -> threading.Lock:
+        with self.lock:
+            return self.collection_locks.setdefault((kind, collection_name), threading.Lock())
+
+    def _get_collection_index(self, collection_name: str, file_paths: List[str], snapshot: CorpusSnapshot) -> BM25Index:
+        """
+        Return the BM25 index of a collection, loading it from disk or rebuilding it when the files changed.
+
+        Args:
+            collection_name (str): Collection name.
+            file_paths (List[str]): Paths of the collection files.
+            snapshot (CorpusSnapshot): Snapshot providing the current version of the files.
+
+        Returns:
+            BM25Index: Up to date index of the collection.
+        """
+        signature = snapshot.signature(file_paths)
+        index = self.indexes.get(collection_name)
+        if index is not None and not index.is_stale(file_paths, signature):
+            return index
+        with self._collection_lock("bm25", collection_name):
+            index = self.indexes.get(collection_name)
+            if index is not None and not index.is_stale(file_paths, signature):
+                return index
+            index_path = os.path.join(self.index_directory, "bm25", collection_name + ".json") if self.index_directory else None
+            if index is None and index_path:
+                index = BM25Index.load(index_path)
+            if index is None or index.is_stale(file_paths, signature):
+                logger.info(f"Building BM25 index for collection {collection_name}...")
+                index = BM25Index.from_files(file_paths, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+                if index_path:
+                    index.save(index_path)
+            self.indexes[collection_name] = index
+            return index
+
+    def _get_collection_vector_store(self, collection_name: str, file_paths: List[str], snapshot: CorpusSnapshot) -> VectorStore:
+        """
+        Return the vector store of a collection, opening it from disk or rebuilding it when the files changed.
+
+        Args:
+            collection_name (str): Collection name.
+            file_paths (List[str]): Paths of the collection files.
+            snapshot (CorpusSnapshot): Snapshot providing the current version of the files.
+
+        Returns:
+            VectorStore: Up to date vector store of the collection.
+        """
+        signature = snapshot.signature(file_paths)
+        store = self.vector_stores.get(collection_name)
+        if store is not None and not store.is_stale(file_paths, self.embedder, signature):
+            return store
+        # Builds replace the matrix file of the previous one, so they must not overlap with loads of the same collection.
+        with self._collection_lock("vector", collection_name):
+            store = self.vector_stores.get(collection_name)
+            if store is not None and not store.is_stale(file_paths, self.embedder, signature):
+                return store
+            store_directory = os.path.join(self.index_directory or INDEX_DIR, "vector", collection_name)
+            if store is None:
+                store = VectorStore.load(store_directory)
+            if store is None or store.is_stale(file_paths, self.embedder, signature):
+                logger.info(f"Building vector store for collection {collection_name}...")
+                store = VectorStore.build(store_directory, file_paths, self.embedder,
+                                          chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+            self.vector_stores[collection_name] = store
+            return store
+
+    def _retrieve_chunks(self, file_names: List[str], question: str, snapshot: CorpusSnapshot) -> str:
+        """
+        Retrieve the chunks most relevant to the question across the given collections.
+
+        Args:
+            file_names (List[str]): List of collection names.
+            question (str): The user question.
+            snapshot (CorpusSnapshot): Snapshot the collections are resolved against.
+
+        Returns:
+            str: The top-k chunks, each prefixed with the name of the file it comes from.
+        """
+        results = []
+        if self.retrieval_mode == "vector":
+            query_vectors = self.embedder.embed([question])
+            for fn in file_names:
+                store = self._get_collection_vector_store(fn, self._get_collection_file_paths(fn, snapshot), snapshot)
+                results.extend(store.search_vectors(query_vectors, top_k=self.top_k)[0])
+        else:
+            for fn in file_names:
+                index = self._get_collection_index(fn, self._get_collection_file_paths(fn, snapshot), snapshot)
+                results.extend(index.search(question, top_k=self.top_k))
+        results.sort(key=lambda result: -result[0])
+        content: List[str] = [chunk["source"] + "\n\n" + chunk["text"] + "\n\n" for _, chunk in results[:self.top_k]]
         return "\n".join(content)
 
-    def get_context(self, file_names: List[str]) -> str:
+    def get_context(self, file_names: List[str], question: str = None) -> str:
         """
         Retrieve the context based on the specified context type.
 
         Args:
             file_names (List[str]): List of file names to be loaded (without the '.txt' extension).
+            question (str, optional): The user question. In "bm25" and "vector" mode only the chunks relevant to it
+                are returned; whole files are returned when it is not provided. CSV-backed collections are always
+                returned as their statistical profile. All files come from one corpus snapshot, so the result is
+                consistent even if files change while it is assembled.
 
         Returns:
             str: The combined context from the specified files.
@@ -45,22 +252,65 @@ class ContextLoader:
         Raises:
             ValueError: If an unsupported context type is provided.
         """
-        file_paths = []
-        for fn in file_names:
-            if fn == "ida":
-                file_paths.extend([self.ida_data_directory + "/" + ida_fn for ida_fn in os.listdir(self.ida_data_directory)])
-            else:
-                file_paths.append(self.general_answering_data_directory + "/" + fn + ".txt")
-        context: str = self._load_txt_files_content(file_paths)
-        return context
+        with span("context.get_context"):
+            snapshot = self.corpus_watcher.snapshot()
+            file_names, csv_paths = self._split_csv_collections(file_names, snapshot)
+            profiles: str = self._load_csv_profiles(csv_paths, snapshot)
+            if self.retrieval_mode in ("bm25", "vector") and question:
+                chunks: str = self._retrieve_chunks(file_names, question, snapshot) if file_names else ""
+                return "\n".join(part for part in (profiles, chunks) if part)
+            file_paths = []
+            for fn in file_names:
+                file_paths.extend(self._get_collection_file_paths(fn, snapshot))
+            context: str = self._load_txt_files_content(file_paths, snapshot)
+            return "\n".join(part for part in (profiles, context) if part)
     
+    def collections_version(self, file_names: List[str]) -> str:
+        """
+        Fingerprint of the current files behind the collections, answered from the corpus snapshot.
+        It changes whenever one of the files is modified, added or removed.
+
+        Args:
+            file_names (List[str]): List of collection names.
+
+        Returns:
+            str: SHA-1 hex digest of the collection files and their signatures.
+        """
+        snapshot = self.corpus_watcher.snapshot()
+        signature = {}
+        for fn in sorted(set(file_names)):
+            for file_path in self._get_collection_file_paths(fn, snapshot):
+                signature[file_path] = snapshot.signatures.get(file_path)
+        return hashlib.sha1(repr(sorted(signature.items())).encode("utf-8")).hexdigest()
+
     def get_graph_context(self):
         """
         Retrieve the context for graph generation.
         """
-        filenames = []
-        for fn in os.listdir(self.graph_data_directory):
-            if fn.endswith("txt"):
-                filenames.append(self.graph_data_directory + "/" + fn)
+        with span("context.get_graph_context"):
+            snapshot = self.corpus_watcher.snapshot()
+            filenames = []
+            for fn in snapshot.listdir(self.graph_data_directory):
+                if fn.endswith("txt"):
+                    filenames.append(self.graph_data_directory + "/" + fn)
+
+            return self._load_txt_files_content(file_paths=filenames, snapshot=snapshot)
+
+    async def aget_context(self, file_names: List[str], question: str = None) -> str:
+        """
+        Async variant of `get_context` that searches indexes in a worker thread.
 
-        return self._load_txt_files_content(file_paths=filenames)
+        Args:
+            file_names (List[str]): List of file names to be loaded (without the '.txt' extension).
+            question (str, optional): The user question.
+
+        Returns:
+            str: The combined context from the specified files.
+        """
+        return await asyncio.to_thread(self.get_context, file_names, question)
+
+    async def aget_graph_context(self) -> str:
+        """
+        Async variant of `get_graph_context` running in a worker thread, where the corpus may be re-scanned when no poller is running.
+        """
+        return await asyncio.to_thread(self.get_graph_context)
@@ -0,0 +1,157 @@
+import os
+import threading
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple
+from src.config.logging_config import logger
+
+class CorpusSnapshot:
+    def __init__(self, version: int, listings: Dict[str, Tuple[str, ...]], signatures: Dict[str, Tuple[int, int]],
+                 contents: Dict[str, str]) -> None:
+        """
+        Immutable in-memory view of the data directories at one point in time.
+        A request that holds a snapshot keeps seeing the same files even if a newer snapshot is published meanwhile.
+
+        Args:
+            version (int): Increases every time a change on disk is picked up.
+            listings (Dict[str, Tuple[str, ...]]): Sorted file names of every watched directory.
+            signatures (Dict[str, Tuple[int, int]]): (mtime_ns, size) of every file, keyed by "<directory>/<name>".
+            contents (Dict[str, str]): Content of every text file, keyed the same way.
+        """
+        self.version: int = version
+        self.listings: Mapping[str, Tuple[str, ...]] = MappingProxyType(listings)
+        self.signatures: Mapping[str, Tuple[int, int]] = MappingProxyType(signatures)
+        self.contents: Mapping[str, str] = MappingProxyType(contents)
+
+    def listdir(self, directory: str) -> List[str]:
+        """
+        Returns the sorted file names of a watched directory.
+
+        Raises:
+            FileNotFoundError: If the directory is not watched or does not exist.
+        """
+        if directory not in self.listings:
+            raise FileNotFoundError(directory)
+        return list(self.listings[directory])
+
+    def exists(self, path: str) -> bool:
+        return path in self.signatures
+
+    def read(self, path: str) -> str:
+        """
+        Returns the content of a text file.
+
+        Raises:
+            FileNotFoundError: If the file is not part of the snapshot.
+        """
+        content = self.contents.get(path)
+        if content is None:
+            raise FileNotFoundError(path)
+        return content
+
+    def signature(self, file_paths: List[str]) -> Dict[str, List[int]]:
+        """
+        Same as `sources_signature`, but answered from the snapshot.
+
+        Raises:
+            FileNotFoundError: If one of the files is not part of the snapshot.
+        """
+        try:
+            return {file_path: list(self.signatures[file_path]) for file_path in file_paths}
+        except KeyError as e:
+            raise FileNotFoundError(e.args[0])
+
+class CorpusWatcher:
+    def __init__(self, directories: List[str], poll_interval: float = None, text_extensions: Tuple[str, ...] = (".txt",)) -> None:
+        """
+        Keeps an in-memory snapshot of the data directories and reloads only the files that changed.
+
+        Without a running poller every `snapshot()` call checks the directories first (one stat per file, changed
+        files are re-read). After `start()` a background thread does that every `poll_interval` seconds and
+        `snapshot()` becomes a plain memory lookup.
+
+        Args:
+            directories (List[str]): Directories to watch (not recursive).
+            poll_interval (float, optional): Seconds between checks of the background poller. Default is None (no poller).
+            text_extensions (Tuple[str, ...], optional): Extensions of files whose content is kept in memory. Other files are
+                only listed with their signature. Default is (".txt",).
+        """
+        self.directories: List[str] = list(directories)
+        self.poll_interval: float = poll_interval
+        self.text_extensions: Tuple[str, ...] = text_extensions
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread = None
+        self.current: CorpusSnapshot = CorpusSnapshot(0, {}, {}, {})
+        self.refresh()
+
+    def refresh(self) -> CorpusSnapshot:
+        """
+        Scans the directories and publishes a new snapshot if anything changed.
+
+        Returns:
+            CorpusSnapshot: The current snapshot.
+        """
+        with self.lock:
+            previous = self.current
+            listings: Dict[str, Tuple[str, ...]] = {}
+            signatures: Dict[str, Tuple[int, int]] = {}
+            contents: Dict[str, str] = {}
+            reloaded = 0
+            for directory in self.directories:
+                try:
+                    entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+                except FileNotFoundError:
+                    continue
+                listings[directory] = tuple(entry.name for entry in entries)
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    path = directory + "/" + entry.name
+                    stat = entry.stat()
+                    signature = (stat.st_mtime_ns, stat.st_size)
+                    signatures[path] = signature
+                    if not entry.name.endswith(self.text_extensions):
+                        continue
+                    if previous.signatures.get(path) == signature and path in previous.contents:
+                        contents[path] = previous.contents[path]
+                        continue
+                    try:
+                        with open(path, "r", encoding="utf-8") as file:
+                            contents[path] = file.read()
+                        reloaded += 1
+                    except (OSError, UnicodeDecodeError) as e:
+                        logger.warning(f"Could not load {path} into the corpus snapshot: {e}")
+            if listings == dict(previous.listings) and signatures == dict(previous.signatures):
+                return previous
+            self.current = CorpusSnapshot(previous.version + 1, listings, signatures, contents)
+            logger.info(f"Corpus snapshot {self.current.version} published ({reloaded} file(s) reloaded).")
+            return self.current
+
+    def snapshot(self) -> CorpusSnapshot:
+        """Returns the current snapshot, checking the directories first when no poller is running."""
+        if self.thread is None:
+            return self.refresh()
+        return self.current
+
+    def _poll(self) -> None:
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing corpus snapshot: {e}")
+
+    def start(self) -> None:
+        """Starts the background poller."""
+        if self.thread is not None or not self.poll_interval:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._poll, name="corpus-watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops the background poller; `snapshot()` checks the directories on every call again."""
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
@@ -0,0 +1,244 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+from src.context.bm25_index import sources_signature
+from src.llm.prompt_assembler import default_token_counter
+from src.config.logging_config import logger
+
+PROFILE_FORMAT_VERSION = 2
+
+def estimate_tokens(text: str) -> int:
+    """Token count used for budgeting, from the tokenizer shared with the prompt assembler."""
+    return default_token_counter().count(text)
+
+def format_number(value: float) -> str:
+    """Formats a number compactly for the profile."""
+    if value is None or pd.isna(value):
+        return "n/a"
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return f"{int(value):,}"
+    if abs(value) >= 1000:
+        return f"{value:,.0f}"
+    return f"{value:.4g}"
+
+def _datetime_columns(df: pd.DataFrame, min_parsed_ratio: float = 0.9) -> Dict[str, pd.Series]:
+    """
+    Detects columns holding dates, either already parsed or as strings that mostly parse as dates.
+
+    Returns:
+        Dict[str, pd.Series]: Column name to parsed datetime series.
+    """
+    columns: Dict[str, pd.Series] = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            columns[col] = series
+        elif series.dtype == object:
+            sample = series.dropna().head(50).astype(str)
+            # Plain numbers and short codes parse as dates too easily, so only strings that look like dates qualify.
+            if sample.empty or not sample.str.contains(r"\d{1,4}[-/.]\d{1,2}", regex=True).all():
+                continue
+            parsed = pd.to_datetime(series, errors="coerce")
+            if parsed.notna().mean() >= min_parsed_ratio:
+                columns[col] = parsed
+    return columns
+
+def _overview_lines(df: pd.DataFrame) -> List[str]:
+    columns = ", ".join(f"{col} ({dtype})" for col, dtype in df.dtypes.astype(str).items())
+    return [f"Rows: {len(df):,}", f"Columns ({len(df.columns)}): {columns}"]
+
+def _numeric_lines(df: pd.DataFrame, numeric_columns: List[str]) -> List[str]:
+    if not numeric_columns:
+        return []
+    stats = df[numeric_columns].agg(["mean", "std", "min", "median", "max", "sum"]).T
+    nulls = df[numeric_columns].isna().sum()
+    lines = ["Numeric columns (mean / std / min / median / max / sum):"]
+    for col, row in stats.iterrows():
+        values = " / ".join(format_number(row[stat]) for stat in ("mean", "std", "min", "median", "max", "sum"))
+        null_note = f", {int(nulls[col])} missing" if nulls[col] else ""
+        lines.append(f"- {col}: {values}{null_note}")
+    return lines
+
+def _categorical_lines(df: pd.DataFrame, categorical_columns: List[str], top_categories: int) -> List[str]:
+    if not categorical_columns:
+        return []
+    lines = ["Categorical columns (top values with counts):"]
+    for col in categorical_columns:
+        counts = df[col].value_counts()
+        if len(counts) > 0.9 * len(df) and len(df) > top_categories:
+            lines.append(f"- {col}: {len(counts):,} unique values (identifier-like)")
+            continue
+        top = ", ".join(f"{value} ({count})" for value, count in counts.head(top_categories).items())
+        more = f", ... {len(counts) - top_categories} more" if len(counts) > top_categories else ""
+        lines.append(f"- {col}: {top}{more}")
+    return lines
+
+def _trend_lines(df: pd.DataFrame, datetime_columns: Dict[str, pd.Series], numeric_columns: List[str]) -> List[str]:
+    lines: List[str] = []
+    for col, dates in datetime_columns.items():
+        valid = dates.notna()
+        if valid.sum() < 2:
+            continue
+        start, end = dates[valid].min(), dates[valid].max()
+        frequency = "MS" if (end - start).days > 62 else "D"
+        lines.append(f"Time series over {col} ({start.date()} to {end.date()}, per {'month' if frequency == 'MS' else 'day'}):")
+        if not numeric_columns:
+            continue
+        periods = df.loc[valid, numeric_columns].groupby(dates[valid].dt.to_period(frequency[0])).sum()
+        if len(periods) < 2:
+            continue
+        x = np.arange(len(periods), dtype=float)
+        values = periods.to_numpy(dtype=float)
+        # Least-squares slope of every column at once.
+        slopes = ((x - x.mean())[:, None] * (values - values.mean(axis=0))).sum(axis=0) / ((x - x.mean()) ** 2).sum()
+        for i, numeric_col in enumerate(numeric_columns):
+            first, last = values[0, i], values[-1, i]
+            change = f"{(last - first) / abs(first) * 100:+.1f}%" if first else "n/a"
+            lines.append(f"- {numeric_col}: first {format_number(first)}, last {format_number(last)}, change {change}, "
+                         f"slope {format_number(slopes[i])} per period, peak {periods.index[values[:, i].argmax()]}")
+    return lines
+
+def _group_lines(df: pd.DataFrame, categorical_columns: List[str], numeric_columns: List[str],
+                 max_groups: int, max_group_cardinality: int = 20, max_numeric: int = 4) -> List[str]:
+    if not numeric_columns:
+        return []
+    lines: List[str] = []
+    measures = numeric_columns[:max_numeric]
+    for col in categorical_columns:
+        cardinality = df[col].nunique()
+        if cardinality < 2 or cardinality > max_group_cardinality:
+            continue
+        grouped = df.groupby(col)[measures].agg(["mean", "sum"])
+        grouped.insert(0, ("rows", "count"), df.groupby(col).size())
+        grouped = grouped.sort_values(("rows", "count"), ascending=False).head(max_groups)
+        lines.append(f"Grouped by {col} (mean / sum):")
+        for group, row in grouped.iterrows():
+            parts = [f"{int(row[('rows', 'count')])} rows"]
+            parts += [f"{m} {format_number(row[(m, 'mean')])} / {format_number(row[(m, 'sum')])}" for m in measures]
+            lines.append(f"- {group}: " + ", ".join(parts))
+    return lines
+
+def profile_dataframe(df: pd.DataFrame, max_tokens: int = 800, top_categories: int = 5, max_groups: int = 5) -> str:
+    """
+    Build a compact statistical profile of a table for use as LLM context.
+    Sections are added by priority (overview, numeric stats, top categories, time-series trends, group-by aggregates)
+    until `max_tokens` is reached, so the profile size does not depend on the number of rows.
+
+    Args:
+        df (pd.DataFrame): Table to profile.
+        max_tokens (int, optional): Token budget of the profile. Default is 800.
+        top_categories (int, optional): Number of most frequent values listed per categorical column. Default is 5.
+        max_groups (int, optional): Number of groups listed per group-by aggregate. Default is 5.
+
+    Returns:
+        str: The profile text.
+    """
+    datetime_columns = _datetime_columns(df)
+    # Unique, increasing integer columns are row identifiers rather than measures.
+    numeric_columns = [col for col in df.select_dtypes(include="number").columns if col not in datetime_columns
+                       and not (pd.api.types.is_integer_dtype(df[col]) and df[col].is_unique and df[col].is_monotonic_increasing)]
+    categorical_columns = [col for col in df.columns if col not in numeric_columns and col not in datetime_columns]
+
+    sections = [
+        _overview_lines(df),
+        _numeric_lines(df, numeric_columns),
+        _categorical_lines(df, categorical_columns, top_categories),
+        _trend_lines(df, datetime_columns, numeric_columns),
+        _group_lines(df, categorical_columns, numeric_columns, max_groups),
+    ]
+    lines: List[str] = []
+    used_tokens = 0
+    for section in sections:
+        for line in section:
+            line_tokens = estimate_tokens(line) + 1
+            if used_tokens + line_tokens > max_tokens:
+                lines.append("... (profile truncated)")
+                return "\n".join(lines)
+            lines.append(line)
+            used_tokens += line_tokens
+    return "\n".join(lines)
+
+class CsvProfiler:
+    def __init__(self, max_tokens: int = 800, cache_directory: str = None) -> None:
+        """
+        Initializes a profiler that caches CSV profiles per file version (mtime and size).
+
+        Args:
+            max_tokens (int, optional): Token budget of every profile. Default is 800.
+            cache_directory (str, optional): Folder where profiles are persisted across runs. Kept only in memory if not set.
+        """
+        self.max_tokens: int = max_tokens
+        self.cache_directory: str = cache_directory
+        self.profiles: Dict[str, Tuple[Dict[str, List[int]], str]] = {}
+        self.lock = threading.Lock()
+
+    def _cache_path(self, csv_path: str) -> str:
+        name = hashlib.sha1(os.path.abspath(csv_path).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_directory, f"{name}.json")
+
+    def _load_cached(self, csv_path: str, signature: Dict[str, List[int]]) -> str:
+        if not self.cache_directory or not os.path.exists(self._cache_path(csv_path)):
+            return None
+        try:
+            with open(self._cache_path(csv_path), "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get("version") != PROFILE_FORMAT_VERSION or data.get("max_tokens") != self.max_tokens or data.get("sources") != signature:
+            return None
+        return data["profile"]
+
+    def _save_cached(self, csv_path: str, signature: Dict[str, List[int]], profile: str) -> None:
+        if not self.cache_directory:
+            return
+        os.makedirs(self.cache_directory, exist_ok=True)
+        path = self._cache_path(csv_path)
+        # A unique temporary file per writer, so concurrent profile requests for one file do not collide.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump({"version": PROFILE_FORMAT_VERSION, "max_tokens": self.max_tokens, "sources": signature, "profile": profile}, file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def profile(self, csv_path: str, signature: Dict[str, List[int]] = None) -> str:
+        """
+        Returns the profile of a CSV file, computing it only when the file changed since it was last profiled.
+
+        Args:
+            csv_path (str): Path to the CSV file.
+            signature (Dict[str, List[int]], optional): Current signature of the file, if already known. The file is stat'ed otherwise.
+
+        Returns:
+            str: The profile text.
+
+        Raises:
+            OSError: If the file cannot be read.
+        """
+        signature = signature if signature is not None else sources_signature([csv_path])
+        key = os.path.abspath(csv_path)
+        cached = self.profiles.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with self.lock:
+            cached = self.profiles.get(key)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+            profile = self._load_cached(csv_path, signature)
+            if profile is None:
+                logger.info(f"Profiling CSV file {csv_path}...")
+                profile = profile_dataframe(pd.read_csv(csv_path), max_tokens=self.max_tokens)
+                self._save_cached(csv_path, signature, profile)
+            self.profiles[key] = (signature, profile)
+            return profile
@@ -0,0 +1,132 @@
+import zlib
+import math
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import List
+from src.context.tokenizer import tokenize
+from src.llm.client_pool import ClientPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class BaseEmbedder(ABC):
+    name: str = ""
+    dim: int = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Abstract method to embed a batch of texts into L2 normalized float32 vectors of shape (len(texts), dim).
+        """
+        pass
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2 normalize every row of the matrix, leaving all-zero rows untouched.
+
+    Args:
+        matrix (np.ndarray): Matrix to normalize.
+
+    Returns:
+        np.ndarray: Normalized float32 matrix.
+    """
+    matrix = matrix.astype(np.float32, copy=False)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class HashingEmbedder(BaseEmbedder):
+    def __init__(self, dim: int = 512, use_bigrams: bool = True) -> None:
+        """
+        Initializes a local embedder that hashes unigram and bigram features into a fixed size vector.
+        It needs no model download or network access.
+
+        Args:
+            dim (int, optional): Dimension of the embedding vectors. Default is 512.
+            use_bigrams (bool, optional): Whether to add bigram features. Default is True.
+        """
+        self.dim: int = dim
+        self.use_bigrams: bool = use_bigrams
+        self.name: str = f"hashing-{dim}{'-bigrams' if use_bigrams else ''}"
+
+    def _features(self, text: str) -> List[str]:
+        terms = tokenize(text)
+        if self.use_bigrams:
+            terms += [f"{first} {second}" for first, second in zip(terms, terms[1:])]
+        return terms
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds texts with signed feature hashing and sublinear term frequency weighting.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            np.ndarray: L2 normalized embeddings of shape (len(texts), dim).
+        """
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, tf in Counter(self._features(text)).items():
+                hashed = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if hashed & 0x80000000 else -1.0
+                matrix[row, hashed % self.dim] += sign * (1.0 + math.log(tf))
+        return normalize_rows(matrix)
+
+class OpenaiEmbedder(BaseEmbedder):
+    def __init__(self, model_name: str = "text-embedding-3-small", dim: int = 1536, batch_size: int = 256, client_pool: ClientPool = None) -> None:
+        """
+        Initializes an embedder backed by the OpenAI embeddings API.
+
+        Args:
+            model_name (str, optional): Name of the embedding model. Default is "text-embedding-3-small".
+            dim (int, optional): Dimension of the returned vectors. Default is 1536.
+            batch_size (int, optional): Number of texts sent per API call. Default is 256.
+            client_pool (ClientPool, optional): Registry of shared API clients. Default creates a private one.
+        """
+        self.client = (client_pool or ClientPool()).openai()
+        self.model_name: str = model_name
+        self.dim: int = dim
+        self.batch_size: int = batch_size
+        self.name: str = f"openai-{model_name}-{dim}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds texts with the OpenAI embeddings API in batches.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            np.ndarray: L2 normalized embeddings of shape (len(texts), dim).
+        """
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(
+                model=self.model_name,
+                input=texts[start:start + self.batch_size],
+                dimensions=self.dim
+            )
+            vectors.extend(item.embedding for item in response.data)
+        return normalize_rows(np.array(vectors, dtype=np.float32).reshape(len(texts), self.dim))
+
+def get_embedder(embedder_type: str, client_pool: ClientPool = None) -> BaseEmbedder:
+    """
+    Create an embedder by type name.
+
+    Args:
+        embedder_type (str): Either "hashing" or "openai".
+        client_pool (ClientPool, optional): Registry of shared API clients used by API backed embedders.
+
+    Returns:
+        BaseEmbedder: The embedder instance.
+
+    Raises:
+        ValueError: If an unsupported embedder type is provided.
+    """
+    if embedder_type == "hashing":
+        return HashingEmbedder()
+    elif embedder_type == "openai":
+        return OpenaiEmbedder(client_pool=client_pool)
+    raise ValueError(f"Unsupported embedder type: {embedder_type}")
@@ -0,0 +1,26 @@
+import re
+from typing import List
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with", "what",
+    "which", "who", "how", "me", "my", "our", "we", "you", "your", "do", "does", "did", "can",
+})
+
+def tokenize(text: str, remove_stopwords: bool = True) -> List[str]:
+    """
+    Split text into lowercase alphanumeric terms.
+
+    Args:
+        text (str): Text to tokenize.
+        remove_stopwords (bool, optional): Whether to drop common English stopwords. Default is True.
+
+    Returns:
+        List[str]: List of terms in the order they appear in the text.
+    """
+    terms = TOKEN_PATTERN.findall(text.lower())
+    if remove_stopwords:
+        return [term for term in terms if term not in STOPWORDS]
+    return terms
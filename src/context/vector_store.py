@@ -0,0 +1,199 @@
+import os
+import json
+import uuid
+import tempfile
+import numpy as np
+from typing import Dict, List, Tuple
+from src.context.bm25_index import chunk_text, sources_signature
+from src.context.embedders import BaseEmbedder
+
+METADATA_FILE_NAME = "metadata.json"
+STORE_FORMAT_VERSION = 1
+
+class VectorStore:
+    def __init__(self, store_directory: str, embeddings: np.ndarray, chunks: List[Dict[str, str]],
+                 sources: Dict[str, List[int]], embedder_name: str) -> None:
+        """
+        Initializes a dense retrieval store over a (read-only, memory-mapped) embedding matrix.
+        Several processes opening the same store share the matrix pages through the OS page cache.
+
+        Args:
+            store_directory (str): Folder holding the embedding matrix and the metadata sidecar file.
+            embeddings (np.ndarray): L2 normalized float32 matrix with one row per chunk.
+            chunks (List[Dict[str, str]]): Chunks matching the matrix rows, each with "source" and "text" keys.
+            sources (Dict[str, List[int]]): Signature of the files the chunks come from.
+            embedder_name (str): Name of the embedder the matrix was built with.
+        """
+        self.store_directory: str = store_directory
+        self.embeddings: np.ndarray = embeddings
+        self.chunks: List[Dict[str, str]] = chunks
+        self.sources: Dict[str, List[int]] = sources
+        self.embedder_name: str = embedder_name
+
+    @classmethod
+    def build(cls, store_directory: str, file_paths: List[str], embedder: BaseEmbedder,
+              chunk_size: int = 120, chunk_overlap: int = 20, batch_size: int = 256) -> "VectorStore":
+        """
+        Chunks and embeds the given text files and writes the store to disk.
+        The matrix is written under a new name and the metadata file is replaced last, so readers
+        of an existing store keep a consistent view while it is rebuilt.
+
+        Args:
+            store_directory (str): Folder to write the store to.
+            file_paths (List[str]): Paths of the text files to index.
+            embedder (BaseEmbedder): Embedder used to compute chunk vectors.
+            chunk_size (int, optional): Maximum number of words per chunk. Default is 120.
+            chunk_overlap (int, optional): Number of overlapping words between windows. Default is 20.
+            batch_size (int, optional): Number of chunks embedded per call. Default is 256.
+
+        Returns:
+            VectorStore: The built store, memory-mapped from disk.
+        """
+        os.makedirs(store_directory, exist_ok=True)
+        sources = sources_signature(file_paths)
+        chunks: List[Dict[str, str]] = []
+        for file_path in file_paths:
+            with open(file_path, "r", encoding="utf-8") as file:
+                file_name = os.path.basename(file_path)
+                for text in chunk_text(file.read(), chunk_size=chunk_size, chunk_overlap=chunk_overlap):
+                    chunks.append({"source": file_name, "text": text})
+
+        matrix_file_name = f"embeddings-{uuid.uuid4().hex}.npy"
+        matrix_path = os.path.join(store_directory, matrix_file_name)
+        matrix = np.lib.format.open_memmap(matrix_path, mode="w+", dtype=np.float32, shape=(len(chunks), embedder.dim))
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            matrix[start:start + len(batch)] = embedder.embed([chunk["text"] for chunk in batch])
+        matrix.flush()
+        del matrix
+
+        metadata_path = os.path.join(store_directory, METADATA_FILE_NAME)
+        previous = cls._read_metadata(metadata_path)
+        metadata = {
+            "version": STORE_FORMAT_VERSION,
+            "embedder": embedder.name,
+            "dim": embedder.dim,
+            "matrix_file": matrix_file_name,
+            "sources": sources,
+            "chunks": chunks,
+        }
+        # A unique temporary file per writer, so concurrent builds (e.g. from other processes) do not collide.
+        fd, tmp_path = tempfile.mkstemp(dir=store_directory, prefix=METADATA_FILE_NAME + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(metadata, file, ensure_ascii=False)
+            os.replace(tmp_path, metadata_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        if previous and previous.get("matrix_file") != matrix_file_name:
+            try:
+                os.remove(os.path.join(store_directory, previous["matrix_file"]))
+            except OSError:
+                pass
+        return cls.load(store_directory)
+
+    @staticmethod
+    def _read_metadata(metadata_path: str) -> dict:
+        if not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path, "r", encoding="utf-8") as file:
+            try:
+                return json.load(file)
+            except json.JSONDecodeError:
+                return None
+
+    @classmethod
+    def load(cls, store_directory: str) -> "VectorStore":
+        """
+        Opens a store previously written with `build`, memory-mapping the embedding matrix read-only.
+
+        Args:
+            store_directory (str): Folder holding the store.
+
+        Returns:
+            VectorStore: The opened store, or None if it is missing or has an incompatible format.
+        """
+        metadata = cls._read_metadata(os.path.join(store_directory, METADATA_FILE_NAME))
+        if not metadata or metadata.get("version") != STORE_FORMAT_VERSION:
+            return None
+        try:
+            # The matrix may have been replaced by a newer build since the metadata was read.
+            embeddings = np.load(os.path.join(store_directory, metadata["matrix_file"]), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        return cls(store_directory, embeddings, metadata["chunks"], metadata["sources"], metadata["embedder"])
+
+    def is_stale(self, file_paths: List[str], embedder: BaseEmbedder, signature: Dict[str, List[int]] = None) -> bool:
+        """
+        Checks whether the store must be rebuilt because the files or the embedder changed.
+
+        Args:
+            file_paths (List[str]): Paths of the files that currently make up the collection.
+            embedder (BaseEmbedder): Embedder currently configured.
+            signature (Dict[str, List[int]], optional): Current signature of the files, if already known. The files are stat'ed otherwise.
+
+        Returns:
+            bool: True if the store needs to be rebuilt.
+        """
+        if embedder.name != self.embedder_name:
+            return True
+        if signature is not None:
+            return signature != self.sources
+        try:
+            return sources_signature(file_paths) != self.sources
+        except OSError:
+            return True
+
+    def search_vectors(self, query_vectors: np.ndarray, top_k: int = 5, block_size: int = 65536) -> List[List[Tuple[float, Dict[str, str]]]]:
+        """
+        Finds the top-k chunks by cosine similarity for a batch of query vectors.
+        The matrix is scanned in row blocks so memory stays bounded for large stores.
+
+        Args:
+            query_vectors (np.ndarray): L2 normalized query matrix of shape (num_queries, dim).
+            top_k (int, optional): Number of chunks returned per query. Default is 5.
+            block_size (int, optional): Number of matrix rows scored at once. Default is 65536.
+
+        Returns:
+            List[List[Tuple[float, Dict[str, str]]]]: For every query, (score, chunk) pairs sorted by descending score.
+        """
+        num_queries = query_vectors.shape[0]
+        num_chunks = self.embeddings.shape[0]
+        if num_chunks == 0 or top_k <= 0:
+            return [[] for _ in range(num_queries)]
+        best_scores = np.full((num_queries, 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((num_queries, 0), dtype=np.int64)
+        for start in range(0, num_chunks, block_size):
+            block_scores = query_vectors @ np.asarray(self.embeddings[start:start + block_size]).T
+            block_ids = np.broadcast_to(np.arange(start, start + block_scores.shape[1]), block_scores.shape)
+            scores = np.concatenate([best_scores, block_scores], axis=1)
+            ids = np.concatenate([best_ids, block_ids], axis=1)
+            k = min(top_k, scores.shape[1])
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_ids = np.take_along_axis(ids, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        return [
+            [(float(score), self.chunks[chunk_id]) for score, chunk_id in zip(row_scores, row_ids) if score > 0]
+            for row_scores, row_ids in zip(best_scores, best_ids)
+        ]
+
+    def search(self, queries: List[str], embedder: BaseEmbedder, top_k: int = 5) -> List[List[Tuple[float, Dict[str, str]]]]:
+        """
+        Embeds the queries in one batch and finds their top-k chunks.
+
+        Args:
+            queries (List[str]): Questions to search for.
+            embedder (BaseEmbedder): Embedder the store was built with.
+            top_k (int, optional): Number of chunks returned per query. Default is 5.
+
+        Returns:
+            List[List[Tuple[float, Dict[str, str]]]]: For every query, (score, chunk) pairs sorted by descending score.
+        """
+        return self.search_vectors(embedder.embed(queries), top_k=top_k)
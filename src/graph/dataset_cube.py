@@ -0,0 +1,132 @@
+import re
+import itertools
+import pandas as pd
+from typing import Dict, List, Tuple
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype, is_object_dtype
+
+TIME_BUCKET_NAMES = {"D": "day", "W": "week", "M": "month", "Q": "quarter", "Y": "year"}
+TIME_COLUMN_PATTERN = re.compile(r"date|time|day|week|month|period", re.IGNORECASE)
+# How each stored statistic is merged when rows are added.
+MERGE_FUNCTIONS = {"sum": "sum", "min": "min", "max": "max", "count": "sum", "": "sum"}
+
+class Aggregate:
+    def __init__(self, name: str, columns: Tuple[str, ...], time_bucket: str = None) -> None:
+        """
+        One pre-computed group-by of a dataset.
+
+        Args:
+            name (str): Key of the aggregate in `DatasetCube.aggregates`, e.g. "Region", "Region, Lead Source" or "Date by month".
+            columns (Tuple[str, ...]): Grouping columns.
+            time_bucket (str, optional): Pandas period frequency the single time column is bucketed by ("D", "W", "M", "Q", "Y").
+        """
+        self.name: str = name
+        self.columns: Tuple[str, ...] = columns
+        self.time_bucket: str = time_bucket
+
+def find_time_columns(df: pd.DataFrame, sample_size: int = 20) -> List[str]:
+    """Returns datetime columns, and text columns whose name suggests a date and whose sample values all parse as dates."""
+    time_columns = []
+    for column in df.columns:
+        if is_datetime64_any_dtype(df[column]):
+            time_columns.append(column)
+        elif is_object_dtype(df[column]) and TIME_COLUMN_PATTERN.search(str(column)):
+            sample = df[column].dropna().head(sample_size)
+            if len(sample) and pd.to_datetime(sample, errors="coerce", format="mixed").notna().all():
+                time_columns.append(column)
+    return time_columns
+
+class DatasetCube:
+    def __init__(self, df: pd.DataFrame, max_categories: int = 50, max_pair_cells: int = 2500,
+                 time_buckets: Tuple[str, ...] = ("D", "W", "M", "Q", "Y"), states: Dict[str, pd.DataFrame] = None,
+                 aggregates: List[Aggregate] = None, measures: List[str] = None) -> None:
+        """
+        Pre-computed aggregates of a graph dataset, so plot code can group a few hundred rows instead of the full table:
+        one per categorical column, one per time column and bucket, and one per pair of categorical columns whose
+        combinations stay below `max_pair_cells`. Each aggregate holds the row count and the sum, mean, min and max
+        of every numeric column.
+
+        Aggregates are stored as sums, minima, maxima and counts, which merge exactly, so `extend` updates them
+        with new rows only. A cube is never modified after creation, since requests share it.
+
+        Args:
+            df (pd.DataFrame): The dataset.
+            max_categories (int, optional): Text columns with more distinct values are not grouped by. Default is 50.
+            max_pair_cells (int, optional): Maximum product of the cardinalities of a pair of grouped columns. Default is 2500.
+            time_buckets (Tuple[str, ...], optional): Buckets of every time column. Default is day, week, month, quarter and year.
+            states (Dict[str, pd.DataFrame], optional): Already computed states, used by `extend`.
+            aggregates (List[Aggregate], optional): Layout of `states`, used by `extend`.
+            measures (List[str], optional): Aggregated numeric columns, used by `extend`.
+        """
+        self.rows: int = len(df)
+        if states is not None:
+            self.measures: List[str] = measures
+            self.layout: List[Aggregate] = aggregates
+            self.states: Dict[str, pd.DataFrame] = states
+        else:
+            time_columns = find_time_columns(df)
+            self.measures = [column for column in df.columns if is_numeric_dtype(df[column]) and not is_bool_dtype(df[column])]
+            categories = {column: df[column].nunique() for column in df.columns
+                          if column not in time_columns and column not in self.measures}
+            categories = {column: count for column, count in categories.items() if 0 < count <= max_categories and count < len(df)}
+            self.layout = [Aggregate(str(column), (column,)) for column in categories]
+            self.layout += [Aggregate(f"{column} by {TIME_BUCKET_NAMES[bucket]}", (column,), bucket)
+                            for column in time_columns for bucket in time_buckets]
+            self.layout += [Aggregate(f"{first}, {second}", (first, second)) for first, second in itertools.combinations(categories, 2)
+                            if categories[first] * categories[second] <= max_pair_cells]
+            self.states = {aggregate.name: self._partial(df, aggregate) for aggregate in self.layout}
+        self.aggregates: Dict[str, pd.DataFrame] = {aggregate.name: self._view(aggregate) for aggregate in self.layout}
+
+    def _partial(self, df: pd.DataFrame, aggregate: Aggregate) -> pd.DataFrame:
+        """Computes the mergeable state of an aggregate over the given rows."""
+        if aggregate.time_bucket is not None:
+            column = aggregate.columns[0]
+            keys = [pd.to_datetime(df[column], errors="coerce", format="mixed").dt.to_period(aggregate.time_bucket).rename(column)]
+        else:
+            keys = [df[column] for column in aggregate.columns]
+        rows = pd.Series(1, index=df.index).groupby(keys, observed=True).sum()
+        if not self.measures:
+            return pd.DataFrame({("rows", ""): rows})
+        state = df[self.measures].groupby(keys, observed=True).agg(["sum", "min", "max", "count"])
+        state[("rows", "")] = rows
+        return state
+
+    def _view(self, aggregate: Aggregate) -> pd.DataFrame:
+        """Turns a stored state into the frame exposed to plot code: rows plus <measure>_sum/_mean/_min/_max columns."""
+        state = self.states[aggregate.name]
+        view = pd.DataFrame({"rows": state[("rows", "")]}, index=state.index)
+        for measure in self.measures:
+            view[f"{measure}_sum"] = state[(measure, "sum")]
+            view[f"{measure}_mean"] = state[(measure, "sum")] / state[(measure, "count")].where(state[(measure, "count")] > 0)
+            view[f"{measure}_min"] = state[(measure, "min")]
+            view[f"{measure}_max"] = state[(measure, "max")]
+        if aggregate.time_bucket is not None:
+            view.index = view.index.to_timestamp()
+        return view
+
+    def extend(self, new_rows: pd.DataFrame) -> "DatasetCube":
+        """
+        Returns the cube of the dataset with `new_rows` appended, merging aggregates of the new rows only.
+
+        Args:
+            new_rows (pd.DataFrame): Appended rows, with the columns of the original dataset.
+
+        Returns:
+            DatasetCube: The updated cube. This cube is left unchanged.
+        """
+        states = {}
+        for aggregate in self.layout:
+            combined = pd.concat([self.states[aggregate.name], self._partial(new_rows, aggregate)])
+            merge = {column: MERGE_FUNCTIONS[column[1]] for column in combined.columns}
+            states[aggregate.name] = combined.groupby(level=list(range(combined.index.nlevels)), observed=True).agg(merge)
+        cube = DatasetCube(new_rows, states=states, aggregates=self.layout, measures=self.measures)
+        cube.rows = self.rows + len(new_rows)
+        return cube
+
+    def describe(self, max_listed: int = 30) -> str:
+        """Describes the aggregates for the plot prompt."""
+        if not self.layout:
+            return ""
+        names = "\n".join(f"- aggregates[{aggregate.name!r}]" for aggregate in self.layout[:max_listed])
+        return ("Pre-computed aggregates of df are available in the dict `aggregates`; prefer them over grouping df yourself. "
+                "Each is a DataFrame indexed by the grouping columns (time buckets by their start date) with a `rows` column "
+                "and `<column>_sum`, `<column>_mean`, `<column>_min` and `<column>_max` columns for every numeric column:\n" + names)
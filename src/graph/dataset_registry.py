@@ -0,0 +1,144 @@
+import io
+import os
+import hashlib
+import threading
+import pandas as pd
+from typing import Dict, Tuple
+from src.graph.dataset_cube import DatasetCube
+from src.config.logging_config import logger
+
+# Bytes at the end of a loaded CSV file that must be unchanged for a grown file to count as appended to.
+TAIL_BYTES = 1024
+
+class Dataset:
+    def __init__(self, csv_file: str, description_file: str, df: pd.DataFrame, description: str, signature: Tuple[int, ...],
+                 cube: DatasetCube = None, tail: bytes = b"") -> None:
+        """
+        Holds a parsed graph dataset and its description.
+
+        Args:
+            csv_file (str): Path to the CSV file.
+            description_file (str): Path to the description file.
+            df (pd.DataFrame): Parsed CSV data. Must be treated as read-only since it is shared across requests.
+            description (str): Content of the description file.
+            signature (Tuple[int, ...]): mtime and size of both files when they were loaded.
+            cube (DatasetCube, optional): Pre-computed aggregates of `df`. Shared and read-only like `df`.
+            tail (bytes, optional): Last bytes of the CSV file when it was loaded, used to detect appended rows.
+        """
+        self.csv_file: str = csv_file
+        self.description_file: str = description_file
+        self.df: pd.DataFrame = df
+        self.description: str = description
+        self.signature: Tuple[int, ...] = signature
+        self.cube: DatasetCube = cube
+        self.tail: bytes = tail
+        self.version: str = hashlib.sha1(repr((csv_file, description_file, signature)).encode("utf-8")).hexdigest()[:16]
+
+class DatasetRegistry:
+    def __init__(self, build_cubes: bool = True, max_categories: int = 50, max_pair_cells: int = 2500) -> None:
+        """
+        Initializes a process-wide registry of parsed graph datasets.
+        Entries are reloaded only when the CSV or description file changes on disk (mtime or size). When rows were
+        only appended to the CSV file, just the new rows are parsed and merged into the data and its aggregates.
+
+        Args:
+            build_cubes (bool, optional): Whether to pre-compute the aggregates of every dataset. Default is True.
+            max_categories (int, optional): Cardinality limit of grouped text columns, see `DatasetCube`. Default is 50.
+            max_pair_cells (int, optional): Size limit of grouped column pairs, see `DatasetCube`. Default is 2500.
+        """
+        self.datasets: Dict[str, Dataset] = {}
+        self.lock = threading.Lock()
+        self.build_cubes: bool = build_cubes
+        self.max_categories: int = max_categories
+        self.max_pair_cells: int = max_pair_cells
+
+    @staticmethod
+    def _signature(csv_file: str, description_file: str) -> Tuple[int, ...]:
+        csv_stat = os.stat(csv_file)
+        description_stat = os.stat(description_file)
+        return (csv_stat.st_mtime_ns, csv_stat.st_size, description_stat.st_mtime_ns, description_stat.st_size)
+
+    def get(self, csv_file: str, description_file: str) -> Dataset:
+        """
+        Returns the dataset for the given files, parsing them only if they are not cached or changed.
+
+        Args:
+            csv_file (str): Path to the CSV file.
+            description_file (str): Path to the description file.
+
+        Returns:
+            Dataset: The up to date dataset.
+
+        Raises:
+            OSError: If one of the files cannot be read.
+        """
+        key = os.path.abspath(csv_file)
+        signature = self._signature(csv_file, description_file)
+        dataset = self.datasets.get(key)
+        if dataset is not None and dataset.signature == signature and dataset.description_file == description_file:
+            return dataset
+        with self.lock:
+            dataset = self.datasets.get(key)
+            if dataset is not None and dataset.signature == signature and dataset.description_file == description_file:
+                return dataset
+            if dataset is not None and dataset.description_file == description_file:
+                appended = self._load_appended(dataset, csv_file, signature)
+                if appended is not None:
+                    self.datasets[key] = appended
+                    return appended
+            df = pd.read_csv(csv_file)
+            with open(description_file, "r", encoding="utf-8") as file:
+                description = file.read()
+            cube = DatasetCube(df, max_categories=self.max_categories, max_pair_cells=self.max_pair_cells) if self.build_cubes else None
+            dataset = Dataset(csv_file, description_file, df, description, signature, cube, self._read_tail(csv_file, signature[1]))
+            self.datasets[key] = dataset
+            logger.info(f"Dataset loaded into registry from {csv_file}")
+            return dataset
+
+    @staticmethod
+    def _read_tail(csv_file: str, size: int) -> bytes:
+        with open(csv_file, "rb") as file:
+            file.seek(max(size - TAIL_BYTES, 0))
+            return file.read(size - file.tell())
+
+    def _load_appended(self, dataset: Dataset, csv_file: str, signature: Tuple[int, ...]) -> Dataset:
+        """
+        Returns the dataset with the rows appended to its CSV file since it was loaded, parsing only those rows.
+
+        Returns:
+            Dataset: The extended dataset, or None if the file changed in another way (or the new rows do not fit
+                the column types), in which case it has to be reloaded.
+        """
+        old_size, new_size = dataset.signature[1], signature[1]
+        if new_size <= old_size or signature[2:] != dataset.signature[2:] or not dataset.tail.endswith(b"\n"):
+            return None
+        with open(csv_file, "rb") as file:
+            file.seek(old_size - len(dataset.tail))
+            if file.read(len(dataset.tail)) != dataset.tail:
+                return None
+            appended = file.read(new_size - old_size)
+        if not appended.endswith(b"\n"):
+            return None
+        try:
+            new_rows = pd.read_csv(io.BytesIO(appended), header=None, names=list(dataset.df.columns), dtype=dataset.df.dtypes.to_dict())
+        except (ValueError, pd.errors.ParserError) as e:
+            logger.info(f"Appended rows of {csv_file} do not fit the loaded data, reloading: {e}")
+            return None
+        df = pd.concat([dataset.df, new_rows], ignore_index=True)
+        cube = dataset.cube.extend(new_rows) if dataset.cube is not None else None
+        tail = (dataset.tail + appended)[-TAIL_BYTES:]
+        logger.info(f"Appended {len(new_rows)} rows to dataset {csv_file}")
+        return Dataset(csv_file, dataset.description_file, df, dataset.description, signature, cube, tail)
+
+    def invalidate(self, csv_file: str = None) -> None:
+        """
+        Drops a cached dataset, or all of them if no file is given.
+
+        Args:
+            csv_file (str, optional): Path to the CSV file of the dataset to drop.
+        """
+        with self.lock:
+            if csv_file is None:
+                self.datasets.clear()
+            else:
+                self.datasets.pop(os.path.abspath(csv_file), None)
@@ -0,0 +1,176 @@
+import os
+import re
+import csv
+import asyncio
+import threading
+from typing import Dict, List, Tuple
+from src.context.bm25_index import BM25Index
+from src.context.corpus_snapshot import CorpusSnapshot, CorpusWatcher
+from src.llm.base_llm import BaseLLM
+from src.config.logging_config import logger
+from src.metrics.metrics import REGISTRY
+from src.metrics.tracing import span
+
+DESCRIPTION_SUFFIX = "_csv_description.txt"
+
+DATASET_SELECTIONS = REGISTRY.counter("ai_agent_dataset_selections_total", "Graph dataset selections by how they were decided.", ("decided_by",))
+
+class DatasetCandidate:
+    def __init__(self, name: str, csv_file: str, description_file: str, description: str) -> None:
+        """
+        A dataset of the graph data directory: `<name>.csv` and its `<name>_csv_description.txt`.
+
+        Args:
+            name (str): Dataset name, the CSV file name without extension.
+            csv_file (str): Path of the CSV file.
+            description_file (str): Path of the description file.
+            description (str): Description text.
+        """
+        self.name: str = name
+        self.csv_file: str = csv_file
+        self.description_file: str = description_file
+        self.description: str = description
+
+def read_csv_sample(csv_path: str, sample_rows: int) -> Tuple[List[str], List[List[str]]]:
+    """Reads the header and the first `sample_rows` rows of a CSV file without pandas."""
+    with open(csv_path, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        rows = [row for _, row in zip(range(sample_rows), reader)]
+    return header, rows
+
+def dataset_document(candidate: DatasetCandidate, header: List[str], rows: List[List[str]], max_values_per_column: int = 10) -> str:
+    """
+    Text indexed for a dataset: its name, column names (twice, so they weigh more than prose), description
+    and the distinct non-numeric sample values of every column.
+    """
+    values: List[str] = []
+    for column in range(len(header)):
+        distinct: List[str] = []
+        for row in rows:
+            value = row[column].strip() if column < len(row) else ""
+            if value and not re.fullmatch(r"[-+$%.,\d\s]+", value) and value not in distinct:
+                distinct.append(value)
+            if len(distinct) >= max_values_per_column:
+                break
+        values.extend(distinct)
+    columns = " ".join(header)
+    return "\n".join([candidate.name.replace("_", " "), columns, columns, candidate.description, " ".join(values)])
+
+class DatasetSelector:
+    def __init__(self, graph_data_directory: str, corpus_watcher: CorpusWatcher = None, sample_rows: int = 50,
+                 margin: float = 1.2, tie_candidates: int = 3) -> None:
+        """
+        Picks the dataset for a graph question in-process with a BM25 index over the descriptions, column names and
+        sample values of every CSV in the graph data directory. The LLM is asked only to break ties between the top
+        few candidates, so the cost of a selection does not grow with the number of datasets.
+
+        Args:
+            graph_data_directory (str): Directory holding `<name>.csv` and `<name>_csv_description.txt` files. CSV files
+                without a description are ignored.
+            corpus_watcher (CorpusWatcher, optional): Source of directory snapshots. Default is a watcher without a poller.
+            sample_rows (int, optional): CSV rows read for sample values. Default is 50.
+            margin (float, optional): The best candidate wins without the LLM when its score is at least this many
+                times the second best. Default is 1.2.
+            tie_candidates (int, optional): Candidates shown to the LLM when it breaks a tie. Default is 3.
+        """
+        self.graph_data_directory: str = graph_data_directory
+        self.corpus_watcher: CorpusWatcher = corpus_watcher or CorpusWatcher([graph_data_directory], text_extensions=(".txt",))
+        self.sample_rows: int = sample_rows
+        self.margin: float = margin
+        self.tie_candidates: int = tie_candidates
+        self.candidates: Dict[str, DatasetCandidate] = {}
+        self.index: BM25Index = None
+        self.signature: Dict[str, List[int]] = None
+        self.lock = threading.Lock()
+
+    def _graph_files(self, snapshot: CorpusSnapshot) -> List[str]:
+        return [self.graph_data_directory + "/" + name for name in snapshot.listdir(self.graph_data_directory)]
+
+    def _build(self, snapshot: CorpusSnapshot) -> None:
+        """Rebuilds the candidates and their index from the snapshot."""
+        candidates: Dict[str, DatasetCandidate] = {}
+        chunks: List[Dict[str, str]] = []
+        for file_name in snapshot.listdir(self.graph_data_directory):
+            if not file_name.endswith(".csv"):
+                continue
+            name = file_name[:-len(".csv")]
+            csv_file = self.graph_data_directory + "/" + file_name
+            description_file = self.graph_data_directory + "/" + name + DESCRIPTION_SUFFIX
+            if not snapshot.exists(description_file):
+                # Plots need the description, so undescribed CSV files are never selected.
+                continue
+            candidate = DatasetCandidate(name, csv_file, description_file, snapshot.read(description_file))
+            try:
+                header, rows = read_csv_sample(csv_file, self.sample_rows)
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                logger.warning(f"Could not sample {csv_file}: {e}")
+                header, rows = [], []
+            candidates[name] = candidate
+            chunks.append({"source": name, "text": dataset_document(candidate, header, rows)})
+        self.candidates = candidates
+        self.index = BM25Index(chunks)
+        logger.info(f"Dataset selection index built over {len(candidates)} datasets.")
+
+    def _current_index(self) -> Tuple[BM25Index, Dict[str, DatasetCandidate]]:
+        snapshot = self.corpus_watcher.snapshot()
+        signature = snapshot.signature(self._graph_files(snapshot))
+        with self.lock:
+            if self.index is None or signature != self.signature:
+                self._build(snapshot)
+                self.signature = signature
+            return self.index, self.candidates
+
+    def rank(self, question: str, top_k: int = None) -> List[Tuple[float, DatasetCandidate]]:
+        """
+        Ranks the datasets for a question.
+
+        Args:
+            question (str): The user question.
+            top_k (int, optional): Number of candidates to return. Default is all.
+
+        Returns:
+            List[Tuple[float, DatasetCandidate]]: (score, candidate) pairs by descending score. Datasets sharing no term
+                with the question are appended with score 0.0, in name order.
+        """
+        with span("graph.rank_datasets"):
+            index, candidates = self._current_index()
+            ranked = [(score, candidates[chunk["source"]]) for score, chunk in index.search(question, top_k=len(candidates))]
+            matched = {candidate.name for _, candidate in ranked}
+            ranked.extend((0.0, candidates[name]) for name in sorted(candidates) if name not in matched)
+            return ranked[:top_k] if top_k else ranked
+
+    def is_decisive(self, ranked: List[Tuple[float, DatasetCandidate]]) -> bool:
+        """Whether the best candidate wins without the LLM: it is the only one, or it scores clearly above the second."""
+        if len(ranked) == 1:
+            return True
+        return ranked[0][0] > 0 and ranked[0][0] >= self.margin * ranked[1][0]
+
+    async def aselect(self, question: str, llm: BaseLLM) -> DatasetCandidate:
+        """
+        Selects the dataset for a question, asking the LLM only when the top candidates are too close to call.
+
+        Args:
+            question (str): The user question.
+            llm (BaseLLM): LLM breaking ties between the top `tie_candidates` candidates.
+
+        Returns:
+            DatasetCandidate: The selected dataset, or None if the directory holds no described CSV files.
+        """
+        ranked = await asyncio.to_thread(self.rank, question)
+        if not ranked:
+            return None
+        if self.is_decisive(ranked):
+            DATASET_SELECTIONS.inc(decided_by="index")
+            return ranked[0][1]
+
+        finalists = [candidate for _, candidate in ranked[:self.tie_candidates]]
+        file_descriptions = "\n\n".join(os.path.basename(candidate.description_file) + "\n" + candidate.description
+                                        for candidate in finalists)
+        answer = await llm.aselect_relevant_csv_file(file_descriptions=file_descriptions, user_question=question)
+        DATASET_SELECTIONS.inc(decided_by="llm")
+        for candidate in finalists:
+            if os.path.basename(candidate.description_file) in answer or os.path.basename(candidate.csv_file) in answer:
+                return candidate
+        logger.info(f"LLM tie-break answer {answer!r} names no candidate, using the best ranked dataset.")
+        return finalists[0]
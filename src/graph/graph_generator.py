@@ -1,67 +1,251 @@
+import asyncio
+import threading
 import pandas as pd
-import numpy as np
-from typing import Any
-import matplotlib.pyplot as plt
+from types import CodeType
+from typing import Any, Dict, Tuple
+from src.graph.plot_renderer import PlotImageCache, RenderedPlot, code_hash, run_plot_code
+from src.graph.plot_worker_pool import PlotWorkerPool
+from src.llm.base_llm import BaseLLM
 from src.llm.openai_llm import OpenaiLLM
 from src.llm.bedrock_llm import BedrockLlamaLLM
+from src.llm.client_pool import ClientPool
+from src.graph.dataset_registry import Dataset, DatasetRegistry
+from src.graph.plot_code_cache import PlotCodeCache
 from src.config.logging_config import logger
+from src.metrics.tracing import span
+
+# matplotlib keeps global figure state, so generated plotting code must not run concurrently.
+PLOT_LOCK = threading.Lock()
 
 class GraphGenerator:
-    def __init__(self, csv_file: str, description_file: str, llm_type: str, retry_limit: int = 3) -> None:
+    def __init__(self, csv_file: str, description_file: str, llm_type: str = None, retry_limit: int = 3, llm: BaseLLM = None,
+                 dataset_registry: DatasetRegistry = None, plot_code_cache: PlotCodeCache = None,
+                 image_cache: PlotImageCache = None, client_pool: ClientPool = None, worker_pool: PlotWorkerPool = None) -> None:
         """
         Initializes the GraphGenerator class for generating plots based on user queries.
 
         Args:
             csv_file (str): Path to the CSV file containing the data.
             description_file (str): Path to the file containing the description of the data.
-            llm_type (str): Type of LLM to use, either "openai" or "llama".
+            llm_type (str, optional): Type of LLM to create, either "openai" or "llama". Ignored when `llm` is given.
             retry_limit (int, optional): Number of retries for generating the plot. Default is 3.
+            llm (BaseLLM, optional): Already initialised LLM client to reuse.
+            dataset_registry (DatasetRegistry, optional): Shared registry of parsed datasets. A private one is used if not set.
+            plot_code_cache (PlotCodeCache, optional): Shared cache of validated plot code. No caching if not set.
+            image_cache (PlotImageCache, optional): Shared cache of rendered images. No caching if not set.
+            client_pool (ClientPool, optional): Registry of shared API clients used when the LLM is created from `llm_type`.
+            worker_pool (PlotWorkerPool, optional): Worker processes running the generated code. It runs in this process if not set.
         """
         self.csv_file: str = csv_file
         self.description_file: str = description_file
         self.retry_limit: int = retry_limit
+        self.dataset_registry: DatasetRegistry = dataset_registry or DatasetRegistry()
+        self.plot_code_cache: PlotCodeCache = plot_code_cache
+        self.image_cache: PlotImageCache = image_cache
+        self.worker_pool: PlotWorkerPool = worker_pool
+        self.dataset: Dataset = None
         self.df: pd.DataFrame = None
         self.df_description: str = None
+        self.aggregates: Dict[str, pd.DataFrame] = {}
+        self.plot_description: str = None
         self.load_data()
         self.load_description()
         self.code_block: Any = None
         self.code_blocks: list = []
-        
-        if llm_type == "openai":
-            self.llm = OpenaiLLM()
+        self.rendered_plot: RenderedPlot = None
+
+        if llm is not None:
+            self.llm = llm
+        elif llm_type == "openai":
+            self.llm = OpenaiLLM(client_pool=client_pool)
         elif llm_type == "llama":
-            self.llm = BedrockLlamaLLM()
+            self.llm = BedrockLlamaLLM(client_pool=client_pool)
 
     def load_data(self) -> None:
         """
-        Loads the sales data from the specified CSV file.
+        Loads the data from the specified CSV file through the dataset registry.
 
         Raises:
             Exception: If there is an error loading the data from the CSV file.
         """
         try:
-            self.df = pd.read_csv(self.csv_file)
+            with span("graph.load_dataset"):
+                self.dataset = self.dataset_registry.get(self.csv_file, self.description_file)
+            self.df = self.dataset.df
+            self.aggregates = self.dataset.cube.aggregates if self.dataset.cube is not None else {}
             logger.info(f"Data loaded successfully from {self.csv_file}")
         except Exception as e:
             logger.error(f"Error loading data: {e}")
 
     def load_description(self) -> None:
         """
-        Loads the description from the specified text file.
+        Loads the description from the specified text file through the dataset registry.
 
         Raises:
             Exception: If there is an error loading the description from the file.
         """
         try:
-            with open(self.description_file, 'r') as file:
-                self.df_description = file.read()
+            if self.dataset is None:
+                self.dataset = self.dataset_registry.get(self.csv_file, self.description_file)
+            self.df_description = self.dataset.description
+            # The LLM is told about the pre-computed aggregates so its code can group them instead of the full table.
+            cube_description = self.dataset.cube.describe() if self.dataset.cube is not None else ""
+            self.plot_description = self.df_description + "\n\n" + cube_description if cube_description else self.df_description
             logger.info(f"Description loaded successfully from {self.description_file}")
         except Exception as e:
             logger.error(f"Error loading description: {e}")
 
+    @staticmethod
+    def clean_code(generated_code: str) -> str:
+        """
+        Removes markdown fences from the code returned by the LLM.
+
+        Args:
+            generated_code (str): Code returned by the LLM.
+
+        Returns:
+            str: Code ready to be compiled.
+        """
+        tmp_code: str = ""
+        for line in generated_code.split("\n"):
+            if not line.startswith("```"):
+                tmp_code += line.strip() + "\n"
+        return tmp_code.replace("python", "").strip()
+
+    def _run_code(self, source: str, code: CodeType, image_format: str = "png") -> bytes:
+        """
+        Executes plot code and renders the resulting figure into memory, in a worker process if a pool is set.
+
+        Args:
+            source (str): Plot source code, sent to the worker process.
+            code (CodeType): The compiled source, run in this process.
+            image_format (str, optional): Either "png" or "svg". Default is "png".
+
+        Returns:
+            bytes: The encoded image.
+
+        Raises:
+            ValueError: If the code did not create a figure.
+        """
+        if self.worker_pool is not None:
+            with span("graph.render"):
+                return self.worker_pool.render(source, self.csv_file, self.description_file, image_format)
+        with span("graph.render"), PLOT_LOCK:
+            return run_plot_code(code, self.df, self.aggregates, image_format)
+
+    def _render_code(self, source: str, code: CodeType, image_format: str) -> RenderedPlot:
+        """
+        Returns the image for the given code, from the image cache when the same code already ran against the same dataset version.
+        """
+        image_key = (code_hash(source), self.dataset.version, image_format) if self.image_cache is not None else None
+        if image_key is not None:
+            content = self.image_cache.get(image_key)
+            if content is not None:
+                logger.info("Plot image served from cache.")
+                return RenderedPlot(content, image_format, cached=True)
+        content = self._run_code(source, code, image_format)
+        if image_key is not None:
+            self.image_cache.put(image_key, content)
+        return RenderedPlot(content, image_format)
+
+    def _lookup_cached_code(self, plot_question: str) -> Tuple[str, Tuple[str, CodeType]]:
+        """Returns the plot code cache key for the question and the cached entry, if any."""
+        if self.plot_code_cache is None or self.df is None:
+            return None, None
+        cache_key = self.plot_code_cache.make_key(plot_question, self.df, self.plot_description)
+        return cache_key, self.plot_code_cache.get(cache_key)
+
+    def _render_cached_code(self, cache_key: str, entry: Tuple[str, CodeType], image_format: str) -> RenderedPlot:
+        """
+        Renders cached, pre-compiled code. Returns None if it fails so the caller falls back to the LLM.
+        """
+        try:
+            rendered = self._render_code(entry[0], entry[1], image_format)
+            logger.info(f"Plot code served from cache (hit rate {self.plot_code_cache.hit_rate:.2f}).")
+            return rendered
+        except Exception as e:
+            logger.warning(f"Cached plot code failed, regenerating: {e}")
+            self.plot_code_cache.discard(cache_key)
+            return None
+
+    def _render_generated_code(self, generated_code: str, cache_key: str, image_format: str) -> RenderedPlot:
+        """
+        Cleans, compiles and renders the generated code. Code that runs successfully is stored in the plot code cache.
+
+        Args:
+            generated_code (str): Code returned by the LLM.
+            cache_key (str): Plot code cache key of the question, or None.
+            image_format (str): Either "png" or "svg".
+
+        Returns:
+            RenderedPlot: The rendered plot.
+
+        Raises:
+            ValueError: If the LLM returned no code or the code did not create a figure.
+        """
+        if not generated_code:
+            raise ValueError("No valid code generated for plot.")
+        tmp_code = self.clean_code(generated_code)
+        code = compile(tmp_code, "<generated_plot>", "exec")
+        rendered = self._render_code(tmp_code, code, image_format)
+        if cache_key is not None:
+            self.plot_code_cache.put(cache_key, tmp_code, code)
+        return rendered
+
+    def render_plot(self, plot_question: str, image_format: str = "png") -> RenderedPlot:
+        """
+        Generate a plot based on the user query and render it into memory.
+
+        Args:
+            plot_question (str): The question related to the plot to be generated.
+            image_format (str, optional): Either "png" or "svg". Default is "png".
+
+        Returns:
+            RenderedPlot: The rendered plot.
+
+        Raises:
+            Exception: If no plot could be generated.
+        """
+        cache_key, cached = self._lookup_cached_code(plot_question)
+        if cached is not None:
+            rendered = self._render_cached_code(cache_key, cached, image_format)
+            if rendered is not None:
+                return rendered
+        generated_code = self.llm.generate_plot_creation_code(plot_question, self.df, self.plot_description)
+        return self._render_generated_code(generated_code, cache_key, image_format)
+
+    async def arender_plot(self, plot_question: str, image_format: str = "png") -> RenderedPlot:
+        """
+        Async variant of `render_plot`. The LLM call is awaited and the plotting code runs in a worker thread.
+
+        Args:
+            plot_question (str): The question related to the plot to be generated.
+            image_format (str, optional): Either "png" or "svg". Default is "png".
+
+        Returns:
+            RenderedPlot: The rendered plot.
+
+        Raises:
+            Exception: If no plot could be generated.
+        """
+        cache_key, cached = self._lookup_cached_code(plot_question)
+        if cached is not None:
+            rendered = await self._run_in_render_thread(self._render_cached_code, cache_key, cached, image_format)
+            if rendered is not None:
+                return rendered
+        generated_code = await self.llm.agenerate_plot_creation_code(plot_question, self.df, self.plot_description)
+        return await self._run_in_render_thread(self._render_generated_code, generated_code, cache_key, image_format)
+
+    async def _run_in_render_thread(self, fn, *args):
+        """Runs a rendering step in a worker thread, waiting in the event loop (not in the thread) for a free plot worker."""
+        if self.worker_pool is None:
+            return await asyncio.to_thread(fn, *args)
+        async with self.worker_pool.slot():
+            return await asyncio.to_thread(fn, *args)
+
     def generate_plot(self, plot_question: str) -> str:
         """
-        Generate a plot based on the user query.
+        Generate a plot based on the user query. The rendered image is kept in `self.rendered_plot`.
 
         Args:
             plot_question (str): The question related to the plot to be generated.
@@ -69,17 +253,26 @@ class GraphGenerator:
         Returns:
             str: A message indicating whether the plot was generated successfully or an error occurred.
         """
-        generated_code = self.llm.generate_plot_creation_code(plot_question, self.df, self.df_description)
-        if generated_code:
-            try:
-                tmp_code: str = ""
-                for line in generated_code.split("\n"):
-                    if not line.startswith("```"):
-                        tmp_code += line.strip() + "\n"
-                tmp_code = tmp_code.replace("python", "").strip()
-                exec(tmp_code, {"df": self.df, "pd": pd, "np": np, "plt": plt})
-                return "Plot generated successfully."
-            except Exception as e:
-                logger.error(f"Error generating plot: {e}")
-                return f"Error generating plot: {e}"
-        return "No valid code generated for plot."
+        try:
+            self.rendered_plot = self.render_plot(plot_question)
+            return "Plot generated successfully."
+        except Exception as e:
+            logger.error(f"Error generating plot: {e}")
+            return f"Error generating plot: {e}"
+
+    async def agenerate_plot(self, plot_question: str) -> str:
+        """
+        Async variant of `generate_plot`.
+
+        Args:
+            plot_question (str): The question related to the plot to be generated.
+
+        Returns:
+            str: A message indicating whether the plot was generated successfully or an error occurred.
+        """
+        try:
+            self.rendered_plot = await self.arender_plot(plot_question)
+            return "Plot generated successfully."
+        except Exception as e:
+            logger.error(f"Error generating plot: {e}")
+            return f"Error generating plot: {e}"
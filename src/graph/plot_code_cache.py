@@ -0,0 +1,104 @@
+import re
+import hashlib
+import threading
+import pandas as pd
+from collections import OrderedDict
+from types import CodeType
+from typing import Dict, Tuple
+
+def normalize_question(question: str) -> str:
+    """
+    Normalise a plot question so trivially different phrasings share a cache entry.
+
+    Args:
+        question (str): The user question.
+
+    Returns:
+        str: Lowercased question with collapsed whitespace and no trailing punctuation.
+    """
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?.!")
+
+def schema_fingerprint(df: pd.DataFrame, df_description: str) -> str:
+    """
+    Fingerprint the dataset schema (column names and dtypes) together with its description.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+        df_description (str): Description of the dataset.
+
+    Returns:
+        str: SHA-1 hex digest of the schema.
+    """
+    schema = [(str(col), str(dtype)) for col, dtype in df.dtypes.items()]
+    return hashlib.sha1(repr((schema, df_description)).encode("utf-8")).hexdigest()
+
+class PlotCodeCache:
+    def __init__(self, max_entries: int = 256) -> None:
+        """
+        Initializes an LRU cache of validated, pre-compiled plot code.
+        Keys combine the normalised question with the dataset schema fingerprint, so entries stop matching
+        as soon as the dataset columns, dtypes or description change.
+
+        Args:
+            max_entries (int, optional): Maximum number of cached snippets. Default is 256.
+        """
+        self.max_entries: int = max_entries
+        self.entries: "OrderedDict[str, Tuple[str, CodeType]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def make_key(question: str, df: pd.DataFrame, df_description: str) -> str:
+        """Builds the cache key for a question against a dataset."""
+        return hashlib.sha1(f"{normalize_question(question)}\n{schema_fingerprint(df, df_description)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Tuple[str, CodeType]:
+        """
+        Looks up cached code.
+
+        Args:
+            key (str): Key built with `make_key`.
+
+        Returns:
+            Tuple[str, CodeType]: Cleaned source and its compiled code object, or None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, source: str, code: CodeType) -> None:
+        """
+        Stores code that executed successfully.
+
+        Args:
+            key (str): Key built with `make_key`.
+            source (str): Cleaned source code.
+            code (CodeType): Compiled code object.
+        """
+        with self.lock:
+            self.entries[key] = (source, code)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        """Removes an entry, e.g. when cached code fails against the current data."""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters, hit rate and current size."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate, "size": len(self.entries)}
@@ -0,0 +1,178 @@
+import io
+import uuid
+import hashlib
+import threading
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pandas as pd
+import numpy as np
+from types import CodeType
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+class RenderedPlot:
+    def __init__(self, content: bytes, image_format: str = "png", plot_id: str = None, cached: bool = False) -> None:
+        """
+        Holds a plot rendered in memory.
+
+        Args:
+            content (bytes): Encoded image.
+            image_format (str, optional): Either "png" or "svg". Default is "png".
+            plot_id (str, optional): Identifier of the request that produced the plot. A new one is generated if not set.
+            cached (bool, optional): Whether the image was served from the image cache. Default is False.
+        """
+        self.content: bytes = content
+        self.image_format: str = image_format
+        self.media_type: str = IMAGE_MEDIA_TYPES[image_format]
+        self.plot_id: str = plot_id or uuid.uuid4().hex
+        self.cached: bool = cached
+
+class PyplotProxy:
+    """
+    Stands in for `matplotlib.pyplot` inside generated code. Calls are forwarded to pyplot, except `savefig`
+    and `show`, which only remember the figure so it can be rendered into memory instead of a shared file.
+    """
+    def __init__(self) -> None:
+        self.saved_figure = None
+
+    def savefig(self, *args, **kwargs) -> None:
+        self.saved_figure = plt.gcf()
+
+    def show(self, *args, **kwargs) -> None:
+        self.saved_figure = plt.gcf()
+
+    def __getattr__(self, name: str):
+        return getattr(plt, name)
+
+def render_figure(figure, image_format: str = "png") -> bytes:
+    """
+    Encode a figure into an in-memory image.
+
+    Args:
+        figure (matplotlib.figure.Figure): Figure to render.
+        image_format (str, optional): Either "png" or "svg". Default is "png".
+
+    Returns:
+        bytes: Encoded image.
+    """
+    if image_format not in IMAGE_MEDIA_TYPES:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=image_format, bbox_inches="tight")
+    return buffer.getvalue()
+
+def referenced_names(code: CodeType) -> set:
+    """Returns the global and attribute names used by compiled code, including its nested functions and comprehensions."""
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            names |= referenced_names(constant)
+    return names
+
+def run_plot_code(code: CodeType, df: pd.DataFrame, aggregates: Dict[str, pd.DataFrame], image_format: str = "png") -> bytes:
+    """
+    Executes compiled plot code and renders the resulting figure into memory. pyplot keeps global figure state,
+    so the caller must make sure no other thread of the process is plotting at the same time.
+
+    Args:
+        code (CodeType): Compiled plot code.
+        df (pd.DataFrame): The dataset. Not modified, the code gets a copy.
+        aggregates (Dict[str, pd.DataFrame]): Pre-computed aggregates of the dataset. Not modified either.
+        image_format (str, optional): Either "png" or "svg". Default is "png".
+
+    Returns:
+        bytes: The encoded image.
+
+    Raises:
+        ValueError: If the code did not create a figure.
+    """
+    plt.close("all")
+    try:
+        proxy = PyplotProxy()
+        # Datasets are shared across requests, so generated code gets its own copies. The full table is only
+        # copied when the code uses it; code working on the aggregates stays cheap on large datasets.
+        namespace = {"aggregates": {name: frame.copy() for name, frame in aggregates.items()}, "pd": pd, "np": np, "plt": proxy}
+        if "df" in referenced_names(code):
+            namespace["df"] = df.copy()
+        exec(code, namespace)
+        figure = proxy.saved_figure
+        if figure is None and plt.get_fignums():
+            figure = plt.gcf()
+        if figure is None:
+            raise ValueError("Generated code did not create a figure.")
+        return render_figure(figure, image_format)
+    finally:
+        plt.close("all")
+
+def code_hash(source: str) -> str:
+    """Returns the SHA-1 hex digest of plot source code."""
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+class PlotImageCache:
+    def __init__(self, max_entries: int = 128, max_bytes: int = 64 * 1024 * 1024) -> None:
+        """
+        Initializes a bounded LRU cache of rendered images keyed on (code hash, dataset version, format).
+
+        Args:
+            max_entries (int, optional): Maximum number of cached images. Default is 128.
+            max_bytes (int, optional): Maximum total size of cached images. Default is 64 MiB.
+        """
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.entries: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self.total_bytes: int = 0
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: Tuple[str, str, str]) -> bytes:
+        """
+        Looks up a rendered image.
+
+        Args:
+            key (Tuple[str, str, str]): (code hash, dataset version, image format).
+
+        Returns:
+            bytes: The encoded image, or None on a miss.
+        """
+        with self.lock:
+            content = self.entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def put(self, key: Tuple[str, str, str], content: bytes) -> None:
+        """
+        Stores a rendered image, evicting the least recently used ones to stay within the bounds.
+
+        Args:
+            key (Tuple[str, str, str]): (code hash, dataset version, image format).
+            content (bytes): The encoded image.
+        """
+        if len(content) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous)
+            self.entries[key] = content
+            self.total_bytes += len(content)
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters, current size and total bytes."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                    "size": len(self.entries), "bytes": self.total_bytes}
@@ -0,0 +1,223 @@
+import os
+import queue
+import asyncio
+import weakref
+import threading
+import multiprocessing
+from typing import Any, Dict, List, Tuple
+from src.config.logging_config import logger
+from src.metrics.metrics import REGISTRY
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, where workers run without a memory cap.
+    resource = None
+
+# Imported once by the fork server, so workers start with pandas, numpy and headless matplotlib already loaded.
+PRELOADED_MODULES = ["src.graph.plot_renderer", "src.graph.dataset_registry"]
+
+PLOT_WORKER_RESTARTS = REGISTRY.counter("ai_agent_plot_worker_restarts_total", "Plot worker processes replaced, by reason.", ("reason",))
+
+def _worker_main(conn, preload: List[Tuple[str, str]], registry_options: Dict[str, Any], memory_limit: int) -> None:
+    """Entry point of a worker process: loads the hot datasets, then renders plot jobs received on `conn` until it gets None."""
+    from src.graph.dataset_registry import DatasetRegistry
+    from src.graph.plot_renderer import run_plot_code
+    if resource is not None and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    registry = DatasetRegistry(**registry_options)
+    for csv_file, description_file in preload:
+        try:
+            registry.get(csv_file, description_file)
+        except Exception as e:
+            logger.warning(f"Plot worker could not preload {csv_file}: {e}")
+    conn.send(("ready", os.getpid()))
+    while True:
+        job = conn.recv()
+        if job is None:
+            return
+        source, csv_file, description_file, image_format = job
+        try:
+            dataset = registry.get(csv_file, description_file)
+            aggregates = dataset.cube.aggregates if dataset.cube is not None else {}
+            code = compile(source, "<generated_plot>", "exec")
+            conn.send(("ok", run_plot_code(code, dataset.df, aggregates, image_format)))
+        except Exception as e:
+            conn.send(("error", type(e).__name__, str(e)))
+
+class PlotWorker:
+    def __init__(self, process: multiprocessing.Process, conn) -> None:
+        """
+        A worker process of a `PlotWorkerPool` and the parent end of its pipe.
+
+        Args:
+            process (multiprocessing.Process): The started worker process.
+            conn (multiprocessing.connection.Connection): Pipe to the worker.
+        """
+        self.process: multiprocessing.Process = process
+        self.conn = conn
+        self.ready: bool = False
+        self.jobs: int = 0
+
+    def stop(self, timeout: float = 1.0) -> None:
+        """Asks the worker to exit and kills it if it does not within `timeout` seconds."""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+class PlotWorkerPool:
+    def __init__(self, size: int = None, timeout: float = 30.0, memory_limit: int = 2 * 1024 ** 3, max_jobs: int = 100,
+                 preload: List[Tuple[str, str]] = None, registry_options: Dict[str, Any] = None, start_timeout: float = 120.0) -> None:
+        """
+        Initializes a pool of long-lived worker processes that run generated plot code, and starts them.
+        Workers are forked from a server that already imported pandas, numpy and matplotlib (or spawned where fork is
+        not available), load the `preload` datasets into their own registry and then wait for jobs, so a job pays
+        neither interpreter start-up nor imports nor CSV parsing. Each worker runs one job at a time, so pyplot state
+        is never shared. A worker is replaced when its job times out, it runs out of memory or crashes, and after
+        `max_jobs` jobs, so leaks of generated code do not accumulate.
+
+        Args:
+            size (int, optional): Number of workers. Default is the number of CPUs.
+            timeout (float, optional): Wall-clock seconds a job may run before its worker is killed, and `render` waits for a
+                free worker. Default is 30.
+            memory_limit (int, optional): Address space limit of a worker in bytes (including the loaded datasets),
+                not enforced on platforms without `resource`. 0 disables it. Default is 2 GiB.
+            max_jobs (int, optional): Jobs after which a worker is replaced. Default is 100.
+            preload (List[Tuple[str, str]], optional): (csv_file, description_file) pairs every worker loads on start.
+            registry_options (Dict[str, Any], optional): Keyword arguments of the `DatasetRegistry` of every worker.
+            start_timeout (float, optional): Seconds to wait for a new worker to import and preload. Default is 120.
+        """
+        self.size: int = size or os.cpu_count() or 1
+        self.timeout: float = timeout
+        self.memory_limit: int = memory_limit
+        self.max_jobs: int = max_jobs
+        self.preload: List[Tuple[str, str]] = list(preload or [])
+        self.registry_options: Dict[str, Any] = dict(registry_options or {})
+        self.start_timeout: float = start_timeout
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            self.context.set_forkserver_preload(PRELOADED_MODULES)
+        self.idle: "queue.Queue[PlotWorker]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed: bool = False
+        self.restarts: Dict[str, int] = {}
+        # Event loop -> semaphore admitting `size` async callers at a time, see `slot`.
+        self.slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        for _ in range(self.size):
+            self.idle.put(self._start_worker())
+
+    def _start_worker(self) -> PlotWorker:
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=_worker_main, args=(child_conn, self.preload, self.registry_options, self.memory_limit),
+                                       name="plot-worker", daemon=True)
+        process.start()
+        child_conn.close()
+        return PlotWorker(process, parent_conn)
+
+    def _replace(self, worker: PlotWorker, reason: str) -> PlotWorker:
+        """Stops a worker and returns its replacement, or None once the pool is closed."""
+        worker.stop(timeout=0 if reason in ("timeout", "startup") else 1.0)
+        with self.lock:
+            self.restarts[reason] = self.restarts.get(reason, 0) + 1
+        PLOT_WORKER_RESTARTS.inc(reason=reason)
+        if reason != "recycled":
+            logger.warning(f"Plot worker {worker.process.pid} replaced ({reason}).")
+        return None if self.closed else self._start_worker()
+
+    def _wait_ready(self, worker: PlotWorker) -> None:
+        if worker.ready:
+            return
+        if not worker.conn.poll(self.start_timeout):
+            raise TimeoutError(f"Plot worker did not start within {self.start_timeout} seconds.")
+        worker.conn.recv()
+        worker.ready = True
+
+    def slot(self) -> asyncio.Semaphore:
+        """
+        Returns a semaphore of the running event loop with one permit per worker. Async callers hold it around the
+        thread that calls `render`, so a burst of plots waits in the event loop instead of blocking executor threads.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            semaphore = self.slots.get(loop)
+            if semaphore is None:
+                semaphore = self.slots[loop] = asyncio.Semaphore(self.size)
+            return semaphore
+
+    def render(self, source: str, csv_file: str, description_file: str, image_format: str = "png") -> bytes:
+        """
+        Runs plot code in the next free worker and returns the rendered image. Waits at most the pool timeout
+        for a worker to become free.
+
+        Args:
+            source (str): Plot source code.
+            csv_file (str): Path to the CSV file of the dataset, loaded as `df` and `aggregates`.
+            description_file (str): Path to the description file of the dataset.
+            image_format (str, optional): Either "png" or "svg". Default is "png".
+
+        Returns:
+            bytes: The encoded image.
+
+        Raises:
+            ValueError: If the code did not create a figure.
+            TimeoutError: If no worker became free or the code did not finish within the pool timeout.
+            RuntimeError: If the code raised another error or the worker died.
+        """
+        if self.closed:
+            raise RuntimeError("Plot worker pool is closed.")
+        try:
+            worker = self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No plot worker became free within {self.timeout} seconds.") from None
+        reason = None
+        try:
+            try:
+                reason = "startup"
+                self._wait_ready(worker)
+                reason = "timeout"
+                worker.conn.send((source, csv_file, description_file, image_format))
+                if not worker.conn.poll(self.timeout):
+                    raise TimeoutError(f"Plot code did not finish within {self.timeout} seconds.")
+                response = worker.conn.recv()
+                reason = None
+            except (EOFError, ConnectionError) as e:
+                reason = "crash"
+                raise RuntimeError(f"Plot worker exited unexpectedly: {e!r}") from e
+            worker.jobs += 1
+            if response[0] == "ok":
+                return response[1]
+            name, message = response[1], response[2]
+            if name == "MemoryError":
+                reason = "memory"
+            raise ValueError(message) if name == "ValueError" else RuntimeError(f"{name}: {message}")
+        finally:
+            if reason is None and worker.jobs >= self.max_jobs:
+                reason = "recycled"
+            if reason is not None:
+                worker = self._replace(worker, reason)
+            if worker is not None:
+                if self.closed:
+                    worker.stop()
+                else:
+                    self.idle.put(worker)
+
+    def stats(self) -> Dict[str, object]:
+        """Returns the number of workers, how many are idle and how often workers were replaced, per reason."""
+        with self.lock:
+            return {"workers": self.size, "idle": self.idle.qsize(), "restarts": dict(self.restarts)}
+
+    def close(self) -> None:
+        """Stops the idle workers; busy ones are stopped when their job finishes."""
+        self.closed = True
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.stop()
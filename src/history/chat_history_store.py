@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List
+from src.config.logging_config import logger
+
+class ChatHistoryStore:
+    def __init__(self, db_path: str) -> None:
+        """
+        Initializes an append-only chat history store backed by SQLite in WAL mode.
+        Messages are keyed by backend and session id, so reading the last turns of a conversation
+        costs the same no matter how long the history grows.
+
+        Args:
+            db_path (str): Path of the SQLite database.
+        """
+        self.db_path: str = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, backend TEXT NOT NULL, session_id TEXT NOT NULL, "
+            "role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (backend, session_id, id)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS imported_files (path TEXT PRIMARY KEY)")
+
+    def append(self, backend: str, session_id: str, messages: List[Dict[str, str]]) -> None:
+        """
+        Appends messages to a conversation in a single transaction.
+
+        Args:
+            backend (str): Name of the LLM backend the conversation belongs to (e.g. "openai", "llama").
+            session_id (str): Conversation id.
+            messages (List[Dict[str, str]]): Messages with "role" and "content" keys.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany(
+                    "INSERT INTO messages (backend, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(backend, session_id, message["role"], message["content"], now) for message in messages]
+                )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def tail(self, backend: str, session_id: str, limit: int = 10) -> List[Dict[str, str]]:
+        """
+        Reads the last messages of a conversation.
+
+        Args:
+            backend (str): Name of the LLM backend the conversation belongs to.
+            session_id (str): Conversation id.
+            limit (int, optional): Maximum number of messages to return. Default is 10.
+
+        Returns:
+            List[Dict[str, str]]: Messages in chronological order.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT role, content FROM messages WHERE backend = ? AND session_id = ? ORDER BY id DESC LIMIT ?",
+                (backend, session_id, limit)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def import_json_history(self, backend: str, json_path: str, session_id: str = "default") -> None:
+        """
+        Imports a legacy chat history JSON file into a conversation. Each file is imported only once.
+
+        Args:
+            backend (str): Name of the LLM backend the file belongs to.
+            json_path (str): Path of the JSON file holding a list of messages.
+            session_id (str, optional): Conversation the messages are imported into. Default is "default".
+        """
+        if not os.path.exists(json_path):
+            return
+        key = os.path.abspath(json_path)
+        with self.lock:
+            if self.connection.execute("SELECT 1 FROM imported_files WHERE path = ?", (key,)).fetchone():
+                return
+        with open(json_path, "r", encoding="utf-8") as file:
+            try:
+                messages = json.load(file)
+            except json.JSONDecodeError:
+                logger.warning(f"Invalid JSON format in {json_path}, skipping chat history import.")
+                messages = []
+        if messages:
+            self.append(backend, session_id, messages)
+        with self.lock:
+            self.connection.execute("INSERT OR IGNORE INTO imported_files (path) VALUES (?)", (key,))
+        logger.info(f"Imported {len(messages)} chat history messages from {json_path}.")
@@ -0,0 +1,224 @@
+import os
+import json
+import math
+import zipfile
+import tempfile
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Tuple
+from src.context.tokenizer import tokenize
+from src.config.logging_config import logger
+
+MODEL_FORMAT_VERSION = 1
+
+def extract_features(text: str) -> List[str]:
+    """
+    Extract unigram and bigram features from text. Stopwords are kept since words such as "how" or "me" carry intent.
+
+    Args:
+        text (str): Text to extract features from.
+
+    Returns:
+        List[str]: List of features.
+    """
+    terms = tokenize(text, remove_stopwords=False)
+    return terms + [f"{first} {second}" for first, second in zip(terms, terms[1:])]
+
+def load_examples(examples_path: str) -> Tuple[List[str], List[str]]:
+    """
+    Load labelled examples from a JSON lines file with "text" and "intent" keys.
+
+    Args:
+        examples_path (str): Path of the examples file.
+
+    Returns:
+        Tuple[List[str], List[str]]: Texts and their intent labels.
+    """
+    texts: List[str] = []
+    labels: List[str] = []
+    with open(examples_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                example = json.loads(line)
+                texts.append(example["text"])
+                labels.append(str(example["intent"]))
+    return texts, labels
+
+class IntentClassifier:
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, weights: np.ndarray, bias: np.ndarray, labels: List[str],
+                 examples_signature: List[int] = None) -> None:
+        """
+        Initializes a TF-IDF + softmax regression intent classifier.
+
+        Args:
+            vocabulary (Dict[str, int]): Mapping of feature to column index.
+            idf (np.ndarray): Inverse document frequency per feature.
+            weights (np.ndarray): Weight matrix of shape (num_features, num_labels).
+            bias (np.ndarray): Bias vector of shape (num_labels,).
+            labels (List[str]): Intent labels matching the weight columns.
+            examples_signature (List[int], optional): [mtime_ns, size] of the examples file the model was trained on.
+        """
+        self.vocabulary: Dict[str, int] = vocabulary
+        self.idf: np.ndarray = idf
+        self.weights: np.ndarray = weights
+        self.bias: np.ndarray = bias
+        self.labels: List[str] = labels
+        self.examples_signature: List[int] = examples_signature or []
+
+    @staticmethod
+    def _vectorize(texts: List[str], vocabulary: Dict[str, int], idf: np.ndarray) -> np.ndarray:
+        matrix = np.zeros((len(texts), len(vocabulary)), dtype=np.float64)
+        for row, text in enumerate(texts):
+            for feature, tf in Counter(extract_features(text)).items():
+                column = vocabulary.get(feature)
+                if column is not None:
+                    matrix[row, column] = (1.0 + math.log(tf)) * idf[column]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    @classmethod
+    def train(cls, texts: List[str], labels: List[str], epochs: int = 500, learning_rate: float = 2.0,
+              l2: float = 1e-3, examples_signature: List[int] = None) -> "IntentClassifier":
+        """
+        Trains the classifier with full-batch gradient descent on the cross-entropy loss.
+
+        Args:
+            texts (List[str]): Example questions.
+            labels (List[str]): Intent label of each example.
+            epochs (int, optional): Number of gradient descent steps. Default is 500.
+            learning_rate (float, optional): Gradient descent step size. Default is 2.0.
+            l2 (float, optional): L2 regularization strength. Default is 1e-3.
+            examples_signature (List[int], optional): Signature of the examples file, stored with the model.
+
+        Returns:
+            IntentClassifier: The trained classifier.
+        """
+        document_frequency: Counter = Counter()
+        for text in texts:
+            document_frequency.update(set(extract_features(text)))
+        vocabulary = {feature: column for column, feature in enumerate(sorted(document_frequency))}
+        idf = np.array([math.log((1 + len(texts)) / (1 + document_frequency[feature])) + 1.0 for feature in sorted(document_frequency)])
+
+        unique_labels = sorted(set(labels))
+        targets = np.zeros((len(texts), len(unique_labels)))
+        targets[np.arange(len(texts)), [unique_labels.index(label) for label in labels]] = 1.0
+
+        features = cls._vectorize(texts, vocabulary, idf)
+        weights = np.zeros((len(vocabulary), len(unique_labels)))
+        bias = np.zeros(len(unique_labels))
+        for _ in range(epochs):
+            error = (cls._softmax(features @ weights + bias) - targets) / len(texts)
+            weights -= learning_rate * (features.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(vocabulary, idf, weights, bias, unique_labels, examples_signature)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """
+        Predicts the intent of a question.
+
+        Args:
+            text (str): The user question.
+
+        Returns:
+            Tuple[str, float]: The most likely intent label and its probability. The probability is 0.0 when
+                the question shares no features with the training examples.
+        """
+        probabilities = self.predict_proba(text)
+        best = max(self.labels, key=lambda label: probabilities[label])
+        return best, probabilities[best]
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """
+        Predicts the probability of every intent.
+
+        Args:
+            text (str): The user question.
+
+        Returns:
+            Dict[str, float]: Probability per intent label, all 0.0 when the question shares no features with the training examples.
+        """
+        features = self._vectorize([text], self.vocabulary, self.idf)
+        if not features.any():
+            return {label: 0.0 for label in self.labels}
+        probabilities = self._softmax(features @ self.weights + self.bias)[0]
+        return {label: float(probability) for label, probability in zip(self.labels, probabilities)}
+
+    def save(self, model_path: str) -> None:
+        """
+        Persists the model to a .npz file.
+
+        Args:
+            model_path (str): Path of the model file.
+        """
+        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+        metadata = {
+            "version": MODEL_FORMAT_VERSION,
+            "vocabulary": self.vocabulary,
+            "labels": self.labels,
+            "examples_signature": self.examples_signature,
+        }
+        # A unique temporary file per writer, so workers training at the same time do not collide.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(model_path), prefix=os.path.basename(model_path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(file, idf=self.idf, weights=self.weights, bias=self.bias, metadata=np.array(json.dumps(metadata)))
+            os.replace(tmp_path, model_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, model_path: str) -> "IntentClassifier":
+        """
+        Loads a model previously written with `save`.
+
+        Args:
+            model_path (str): Path of the model file.
+
+        Returns:
+            IntentClassifier: The loaded model, or None if the file is missing, unreadable or has an incompatible format.
+        """
+        if not os.path.exists(model_path):
+            return None
+        try:
+            with np.load(model_path) as data:
+                metadata = json.loads(str(data["metadata"]))
+                if metadata.get("version") != MODEL_FORMAT_VERSION:
+                    return None
+                return cls(metadata["vocabulary"], data["idf"], data["weights"], data["bias"], metadata["labels"],
+                           metadata["examples_signature"])
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            logger.warning(f"Could not read intent classifier model {model_path}: {e!r}")
+            return None
+
+    @classmethod
+    def load_or_train(cls, examples_path: str, model_path: str) -> "IntentClassifier":
+        """
+        Loads the persisted model, retraining it when it is missing or unreadable or the examples file changed since it was trained.
+
+        Args:
+            examples_path (str): Path of the labelled examples file.
+            model_path (str): Path of the model file.
+
+        Returns:
+            IntentClassifier: Model trained on the current examples.
+        """
+        stat = os.stat(examples_path)
+        signature = [stat.st_mtime_ns, stat.st_size]
+        classifier = cls.load(model_path)
+        if classifier is None or classifier.examples_signature != signature:
+            logger.info(f"Training intent classifier from {examples_path}...")
+            texts, labels = load_examples(examples_path)
+            classifier = cls.train(texts, labels, examples_signature=signature)
+            classifier.save(model_path)
+        return classifier
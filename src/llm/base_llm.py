@@ -1,30 +1,75 @@
 from abc import ABC, abstractmethod
 
 class BaseLLM(ABC):
+    # Name used for metrics and latency tracking, e.g. "openai" or "llama".
+    backend: str = None
+
     @abstractmethod
-    def load_chat_history(self):
+    def load_chat_history(self, session_id: str = "default", limit: int = 10) -> list:
         """
-        Abstract method to load chat history.
+        Abstract method to load the last messages of a session's chat history.
         """
         pass
 
     @abstractmethod
-    def save_chat_history(self):
+    def save_chat_history(self, session_id: str, messages: list) -> None:
         """
-        Abstract method to save chat history.
+        Abstract method to append messages to a session's chat history.
         """
         pass
 
     @abstractmethod
-    def generate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100) -> str:
+    def generate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> str:
         """
         Abstract method to generate an answer based on a question and context.
         """
         pass
 
+    @abstractmethod
+    async def agenerate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> str:
+        """
+        Abstract async method to generate an answer without blocking the event loop.
+        """
+        pass
+
+    @abstractmethod
+    async def agenerate_from_history(self, question: str, question_type: str, context: str, chat_history: list, max_tokens: int = 100) -> str:
+        """
+        Abstract async method to generate an answer for already loaded chat history, without touching the history store.
+        """
+        pass
+
+    @abstractmethod
+    def astream_answer(self, question: str, context: str = "", max_tokens: int = 100, session_id: str = "default"):
+        """
+        Abstract async generator streaming a general answer as text deltas.
+        """
+        pass
+
     @abstractmethod
     def generate_plot_creation_code(self, user_question: str, df, df_description) -> str:
         """
         Abstract method to generate plot creation code based on a dataframe and user question.
         """
         pass
+
+    @abstractmethod
+    async def agenerate_plot_creation_code(self, user_question: str, df, df_description) -> str:
+        """
+        Abstract async method to generate plot creation code without blocking the event loop.
+        """
+        pass
+
+    @abstractmethod
+    def select_relevant_csv_file(self, file_descriptions: list, user_question: str) -> str:
+        """
+        Abstract method to select the CSV file most relevant to the user question.
+        """
+        pass
+
+    @abstractmethod
+    async def aselect_relevant_csv_file(self, file_descriptions: list, user_question: str) -> str:
+        """
+        Abstract async method to select the most relevant CSV file without blocking the event loop.
+        """
+        pass
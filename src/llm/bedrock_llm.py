@@ -1,149 +1,373 @@
 import os
-import boto3
 import json
-import pandas as pd
-from src.api.constants import CHAT_HISTORY_DIR
+import asyncio
+import functools
+import threading
+import contextvars
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from src.api.constants import CHAT_HISTORY_DIR, CHAT_HISTORY_DB_PATH, CHAT_HISTORY_TAIL_MESSAGES, PROMPT_MAX_TOKENS, PROMPT_HISTORY_SHARE
+from src.history.chat_history_store import ChatHistoryStore
 from src.llm.base_llm import BaseLLM
+from src.llm.client_pool import ClientPool
+from src.llm.coalescing import INTENT_ANSWERS, SingleFlight, MicroBatcher, format_batch_inputs, parse_batched_answers
+from src.llm.response_cache import ResponseCache, make_cache_key
+from src.llm.prompt_assembler import PromptAssembler
+from src.metrics.tracing import span, record_llm_usage
 from src.config.logging_config import logger
-from src.prompts.prompts import SYSTEM_PROMPT, CONTEXT_PROMPT, SYSTEM_PROMPT_PLOT, CONTEXT_PROMPT_PLOT, SYSTEM_PROMPT_INTENT, CONTEXT_PROMPT_INTENT, SYSTEM_PROMPT_CSV_SELECTION, CONTEXT_PROMPT_CSV_SELECTION
+from src.prompts.prompts import SYSTEM_PROMPT, CONTEXT_PROMPT, SYSTEM_PROMPT_PLOT, CONTEXT_PROMPT_PLOT, SYSTEM_PROMPT_INTENT, CONTEXT_PROMPT_INTENT, SYSTEM_PROMPT_INTENT_BATCH, CONTEXT_PROMPT_INTENT_BATCH, SYSTEM_PROMPT_CSV_SELECTION, CONTEXT_PROMPT_CSV_SELECTION
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 load_dotenv()
 
 class BedrockLlamaLLM(BaseLLM):
-    def __init__(self, model_name: str = "meta.llama3-8b-instruct-v1:0") -> None:
+    backend: str = "llama"
+
+    def __init__(self, model_name: str = "meta.llama3-8b-instruct-v1:0", max_workers: int = 16, response_cache: ResponseCache = None,
+                 history_store: ChatHistoryStore = None, prompt_assembler: PromptAssembler = None, client_pool: ClientPool = None,
+                 single_flight: bool = True, intent_batch_window: float = None, intent_batch_max_size: int = 16) -> None:
         """
         Initializes the LLM class with AWS Bedrock using credentials from environment variables.
 
         Args:
             model_name (str): Name of the Bedrock model to use. Default is "meta.llama3-8b-instruct-v1:0".
+            max_workers (int, optional): Size of the thread pool (and HTTP connection pool) used by the async methods. Default is 16.
+            response_cache (ResponseCache, optional): Cache consulted before calling Bedrock. No caching if not set.
+            history_store (ChatHistoryStore, optional): Store holding chat history. Default opens the store at CHAT_HISTORY_DB_PATH.
+            prompt_assembler (PromptAssembler, optional): Fits prompts into a token budget and renders the Llama format.
+                Default uses PROMPT_MAX_TOKENS.
+            client_pool (ClientPool, optional): Registry of shared API clients. Default creates a private one.
+            single_flight (bool, optional): Concurrent async calls with the same formatted prompt share one Bedrock call. Default is True.
+            intent_batch_window (float, optional): Seconds async intent calls are collected to be classified with one batched
+                prompt. Default is None (no batching).
+            intent_batch_max_size (int, optional): Maximum number of intent calls per batched prompt. Default is 16.
         """
-        self.client = boto3.client(
-            service_name="bedrock-runtime",
-            region_name=os.getenv("AWS_REGION"),
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-            aws_session_token=os.getenv("AWS_SESSION_TOKEN")
-        )
+        self.client = (client_pool or ClientPool()).bedrock_runtime(max_pool_connections=max_workers)
         self.model_name: str = model_name
+        self.response_cache: ResponseCache = response_cache
+        self.prompt_assembler: PromptAssembler = prompt_assembler or PromptAssembler(PROMPT_MAX_TOKENS, PROMPT_HISTORY_SHARE)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bedrock")
+
+        self.history_store: ChatHistoryStore = history_store or ChatHistoryStore(CHAT_HISTORY_DB_PATH)
+        self.history_store.import_json_history("llama", os.path.join(CHAT_HISTORY_DIR, "llama.json"))
+        self.single_flight: SingleFlight = SingleFlight("llama") if single_flight else None
+        self.intent_batcher: MicroBatcher = MicroBatcher(self._aclassify_intents, self._aclassify_intent, intent_batch_window,
+                                                         intent_batch_max_size, "llama") if intent_batch_window else None
+
+    def load_chat_history(self, session_id: str = "default", limit: int = CHAT_HISTORY_TAIL_MESSAGES) -> List[Dict[str, str]]:
+        """Loads the last `limit` chat history messages of a session."""
+        with span("history.load"):
+            return self.history_store.tail("llama", session_id, limit)
+
+    def save_chat_history(self, session_id: str, messages: List[Dict[str, str]]) -> None:
+        """Appends messages to the chat history of a session."""
+        with span("history.save"):
+            self.history_store.append("llama", session_id, messages)
 
-        self.history_file = os.path.join(CHAT_HISTORY_DIR, "llama.json")
-        self.chat_history = self.load_chat_history()
-
-    def load_chat_history(self):
-        """Loads chat history from a JSON file."""
-        if not os.path.exists(CHAT_HISTORY_DIR):
-            os.makedirs(CHAT_HISTORY_DIR)
-        
-        if os.path.exists(self.history_file):
-            with open(self.history_file, "r", encoding="utf-8") as file:
-                try:
-                    return json.load(file)
-                except json.JSONDecodeError:
-                    logger.warning(f"Invalid JSON format in {self.history_file}, resetting chat history.")
-                    return []
-        return []
-    
-    def save_chat_history(self):
-        """Saves chat history to a JSON file."""
-        with open(self.history_file, "w", encoding="utf-8") as file:
-            json.dump(self.chat_history, file, ensure_ascii=False, indent=4)
-    
-    def generate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100) -> str:
+    def _invoke(self, formatted_prompt: str, call_type: str, max_tokens: int = None) -> str:
         """
-        Generates an answer to a given question based on the question type using the AWS Bedrock Llama model.
+        Sends a formatted prompt to the Bedrock model and returns the generated text, answering from the response cache when possible.
+
+        Args:
+            formatted_prompt (str): Prompt in the Llama chat format.
+            call_type (str): Kind of call ("intent", "general", "plot", "csv_selection"), used by the cache.
+            max_tokens (int, optional): The maximum number of tokens to generate. Model default if not set.
+
+        Returns:
+            str: The generated text.
+        """
+        key = make_cache_key(self.model_name, formatted_prompt, max_tokens) if self.response_cache else None
+        if key:
+            cached = self.response_cache.get(key, call_type)
+            if cached is not None:
+                logger.info(f"Bedrock Llama answer for type {call_type} served from cache.")
+                return cached
+        response_text = self._invoke_model(formatted_prompt, max_tokens, call_type)
+        if key:
+            self.response_cache.set(key, call_type, response_text)
+        return response_text
+
+    def _run_in_executor(self, fn, *args):
+        """Runs fn on the Bedrock thread pool, carrying over the context so spans still reach the request trace."""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, functools.partial(contextvars.copy_context().run, fn, *args))
+
+    def _invoke_model(self, formatted_prompt: str, max_tokens: int = None, call_type: str = "general") -> str:
+        """Calls Bedrock invoke_model with the Llama native request body and records its token usage."""
+        native_request = {
+            "prompt": formatted_prompt
+        }
+        if max_tokens is not None:
+            native_request["max_gen_len"] = max_tokens
+
+        request = json.dumps(native_request)
+        with span(f"llm.llama.{call_type}") as timing:
+            response = self.client.invoke_model(modelId=self.model_name, body=request)
+            model_response = json.loads(response["body"].read())
+        record_llm_usage("llama", call_type, model_response.get("prompt_token_count"), model_response.get("generation_token_count"), timing.seconds)
+
+        response_text = model_response.get("generation", "No generation returned.")
+        logger.info("Bedrock Llama answer retrieved.")
+        return response_text
+
+    async def _ainvoke(self, formatted_prompt: str, call_type: str, max_tokens: int = None, batch_item: str = None) -> str:
+        """
+        Async variant of `_invoke` running the Bedrock call on the thread pool so the event loop is not blocked.
+        Concurrent calls with the same prompt share one Bedrock call, and with a `batch_item` the call goes through
+        the intent batcher (if enabled).
+        """
+        key = make_cache_key(self.model_name, formatted_prompt, max_tokens)
+        if self.response_cache:
+            cached = await self.response_cache.aget(key, call_type)
+            if cached is not None:
+                logger.info(f"Bedrock Llama answer for type {call_type} served from cache.")
+                return cached
+        # Batched answers depend on the other questions of the batch, so they are never stored in the response cache.
+        batched = batch_item is not None and self.intent_batcher is not None
+        if batched:
+            call = lambda: self.intent_batcher.submit(batch_item)
+        else:
+            call = lambda: self._run_in_executor(self._invoke_model, formatted_prompt, max_tokens, call_type)
+        response_text = await (self.single_flight.run(key, call_type, call) if self.single_flight else call())
+        if self.response_cache and not batched:
+            await self.response_cache.aset(key, call_type, response_text)
+        return response_text
+
+    async def _aclassify_intent(self, question: str) -> str:
+        """Classifies the intent of one question, as sent by the intent batcher."""
+        return await self._run_in_executor(self._invoke_model, self._build_answer_prompt(question, "intent", "", []), 100, "intent")
+
+    async def _aclassify_intents(self, questions: List[str]) -> List[str]:
+        """
+        Classifies the intents of several questions with one batched prompt.
+
+        Raises:
+            ValueError: If the answer does not hold one valid intent per question.
+        """
+        formatted_prompt = self.prompt_assembler.assemble(SYSTEM_PROMPT_INTENT_BATCH, CONTEXT_PROMPT_INTENT_BATCH,
+                                                          format_batch_inputs(questions)).to_llama_prompt()
+        response_text = await self._run_in_executor(self._invoke_model, formatted_prompt, 8 * len(questions) + 16, "intent_batch")
+        return parse_batched_answers(response_text, len(questions), allowed=INTENT_ANSWERS)
+
+    def _stream_model(self, formatted_prompt: str, max_tokens: int, emit, cancelled: threading.Event = None) -> None:
+        """
+        Calls Bedrock invoke_model_with_response_stream and passes every generated text delta to `emit`.
+        Runs on the Bedrock thread pool; `emit(None)` marks the end of the stream and exceptions are passed to `emit` too.
+        Once `cancelled` is set, the response stream is closed at the next chunk, so no more tokens are read (or paid for).
+        """
+        try:
+            native_request = {
+                "prompt": formatted_prompt,
+                "max_gen_len": max_tokens
+            }
+            metrics = {}
+            with span("llm.llama.general_stream"):
+                response = self.client.invoke_model_with_response_stream(modelId=self.model_name, body=json.dumps(native_request))
+                for event in response["body"]:
+                    if cancelled is not None and cancelled.is_set():
+                        close = getattr(response["body"], "close", None)
+                        if close is not None:
+                            close()
+                        logger.info("Bedrock Llama stream closed, the client went away.")
+                        return
+                    chunk = event.get("chunk")
+                    if chunk:
+                        payload = json.loads(chunk["bytes"])
+                        # The last chunk carries the token counts of the whole invocation.
+                        metrics = payload.get("amazon-bedrock-invocationMetrics", metrics)
+                        generation = payload.get("generation")
+                        if generation:
+                            emit(generation)
+            record_llm_usage("llama", "general", metrics.get("inputTokenCount"), metrics.get("outputTokenCount"))
+            emit(None)
+        except Exception as e:
+            emit(e)
+
+    async def astream_answer(self, question: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> AsyncIterator[str]:
+        """
+        Streams a general answer as it is generated using the Bedrock response stream API.
+        The full answer is appended to chat history once the stream is complete.
 
         Args:
             question (str): The question for which the answer is to be generated.
-            question_type (str): The type of the question, which determines the prompt format.
             context (str, optional): The context to be used in the prompt. Default is an empty string.
             max_tokens (int, optional): The maximum number of tokens for the generated answer. Default is 100.
+            session_id (str, optional): Conversation whose chat history is used and extended. Default is "default".
+
+        Yields:
+            str: Text deltas as they arrive.
+        """
+        chat_history = await asyncio.to_thread(self.load_chat_history, session_id)
+        formatted_prompt = self._build_answer_prompt(question, "general", context, chat_history)
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        emit = lambda item: loop.call_soon_threadsafe(queue.put_nowait, item)
+        # Set when the consumer stops early (e.g. the SSE client disconnected), which ends the Bedrock stream too.
+        cancelled = threading.Event()
+        self._run_in_executor(self._stream_model, formatted_prompt, max_tokens, emit, cancelled)
+
+        logger.info("Streaming Bedrock Llama answer...")
+        parts: List[str] = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                parts.append(item)
+                yield item
+        finally:
+            cancelled.set()
+        logger.info("Bedrock Llama answer streamed.")
+        await asyncio.to_thread(self._record_answer, session_id, question, "".join(parts))
+
+    def _build_answer_prompt(self, question: str, question_type: str, context: str, chat_history: List[Dict[str, str]]) -> str:
+        """
+        Builds the Llama formatted prompt for a question, including chat history for non-intent questions.
+        Context and history are cut to fit the prompt token budget.
+
+        Args:
+            question (str): The question for which the answer is to be generated.
+            question_type (str): The type of the question, which determines the prompt format.
+            context (str): The context to be used in the prompt.
+            chat_history (List[Dict[str, str]]): Previous chat messages.
 
         Returns:
-            str: The generated answer.
+            str: The formatted prompt, or None if the question type is not supported.
         """
         if question_type == "general":
-            prompt = SYSTEM_PROMPT + "\n\n" + CONTEXT_PROMPT.format(context=context, question=question)
+            prompt = self.prompt_assembler.assemble(SYSTEM_PROMPT, CONTEXT_PROMPT, question, context=context, chat_history=chat_history)
         elif question_type == "intent":
-            prompt = SYSTEM_PROMPT_INTENT + "\n\n" + CONTEXT_PROMPT_INTENT.format(question=question)
+            prompt = self.prompt_assembler.assemble(SYSTEM_PROMPT_INTENT, CONTEXT_PROMPT_INTENT, question)
         else:
+            return None
+        return prompt.to_llama_prompt()
+
+    def _record_answer(self, session_id: str, question: str, answer: str) -> None:
+        """Appends the question and answer to the chat history of a session."""
+        self.save_chat_history(session_id, [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer},
+        ])
+
+    def generate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> str:
+        """
+        Generates an answer to a given question based on the question type using the AWS Bedrock Llama model.
+
+        Args:
+            question (str): The question for which the answer is to be generated.
+            question_type (str): The type of the question, which determines the prompt format.
+            context (str, optional): The context to be used in the prompt. Default is an empty string.
+            max_tokens (int, optional): The maximum number of tokens for the generated answer. Default is 100.
+            session_id (str, optional): Conversation whose chat history is used and extended. Default is "default".
+
+        Returns:
+            str: The generated answer.
+        """
+        chat_history = self.load_chat_history(session_id) if question_type != "intent" else []
+        formatted_prompt = self._build_answer_prompt(question, question_type, context, chat_history)
+        if formatted_prompt is None:
             return "Could not provide answer."
-        
+
+        response_text = self._invoke(formatted_prompt, question_type, max_tokens=max_tokens)
         if question_type == "intent":
-            history_text = ""
-        else:
-            self.chat_history = self.load_chat_history()
-            history_text = ""
-            for chat in self.chat_history:
-                history_text += f"<|start_header_id|>{chat['role']}<|end_header_id|>\n{chat['content']}\n<|eot_id|>\n"
-                history_text += f"<|start_header_id|>{chat['role']}<|end_header_id|>\n{chat['content']}\n<|eot_id|>\n"
-                
-        formatted_prompt = f"""
-            <|begin_of_text|>
-            {history_text}
-            <|start_header_id|>user<|end_header_id|>\n{prompt}\n<|eot_id|>
-            <|start_header_id|>assistant<|end_header_id|>
+            return response_text
+        self._record_answer(session_id, question, response_text)
+        return response_text
+
+    async def agenerate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> str:
         """
-        native_request = {
-            "prompt": formatted_prompt,
-            "max_gen_len": max_tokens
-        }
+        Async variant of `generate_answer`. The Bedrock call and chat history I/O run on worker threads.
 
-        request = json.dumps(native_request)
-        response = self.client.invoke_model(modelId=self.model_name, body=request)
-        model_response = json.loads(response["body"].read())
+        Args:
+            question (str): The question for which the answer is to be generated.
+            question_type (str): The type of the question, which determines the prompt format.
+            context (str, optional): The context to be used in the prompt. Default is an empty string.
+            max_tokens (int, optional): The maximum number of tokens for the generated answer. Default is 100.
+            session_id (str, optional): Conversation whose chat history is used and extended. Default is "default".
 
-        response_text = model_response.get("generation", "No generation returned.")
-        logger.info("Bedrock Llama answer retrieved.")
+        Returns:
+            str: The generated answer.
+        """
+        chat_history = await asyncio.to_thread(self.load_chat_history, session_id) if question_type != "intent" else []
+        response_text = await self.agenerate_from_history(question, question_type, context, chat_history, max_tokens)
+        if response_text is None:
+            return "Could not provide answer."
         if question_type == "intent":
             return response_text
-        self.chat_history.append({"role": "user", "content": question})
-        self.chat_history.append({"role": "assistant", "content": response_text})
-        self.save_chat_history()
+        await asyncio.to_thread(self._record_answer, session_id, question, response_text)
         return response_text
-    
-    def generate_plot_creation_code(self, user_question: str, df: pd.DataFrame, df_description: str) -> str:
+
+    async def agenerate_from_history(self, question: str, question_type: str, context: str, chat_history: List[Dict[str, str]], max_tokens: int = 100) -> str:
         """
-        Generates code for creating a plot based on the user's question and the DataFrame description using the AWS Bedrock Llama model.
+        Generates an answer for already loaded chat history without reading or writing the history store.
 
         Args:
-            user_question (str): The question asked by the user.
-            df (pd.DataFrame): The DataFrame containing the data to be visualized.
-            df_description (str): A description of the DataFrame and its contents.
+            question (str): The question for which the answer is to be generated.
+            question_type (str): The type of the question, which determines the prompt format.
+            context (str): The context to be used in the prompt.
+            chat_history (List[Dict[str, str]]): Previous chat messages.
+            max_tokens (int, optional): The maximum number of tokens for the generated answer. Default is 100.
 
         Returns:
-            str: The generated code for creating a plot.
+            str: The generated answer, or None if the question type is not supported.
         """
+        formatted_prompt = self._build_answer_prompt(question, question_type, context, chat_history)
+        if formatted_prompt is None:
+            return None
+        return await self._ainvoke(formatted_prompt, question_type, max_tokens=max_tokens,
+                                   batch_item=question if question_type == "intent" else None)
+
+    def _build_plot_prompt(self, user_question: str, df: "pd.DataFrame", df_description: str) -> str:
+        """Builds the Llama formatted prompt asking for plot creation code."""
         rows_num: int = len(df)
         cols_num: int = len(df.columns)
-        cols_description: str = ""
-        for col in df.columns:
-            col_type = df.dtypes[col]
-            cols_description += f"{col} ({col_type})\n"
+        cols_description: str = "".join(f"{col} ({col_type})\n" for col, col_type in df.dtypes.items())
 
         system_message: str = SYSTEM_PROMPT_PLOT.format(
             rows_num=rows_num, cols_num=cols_num, df_description=df_description, cols_description=cols_description)
         prompt_problem: str = CONTEXT_PROMPT_PLOT.format(user_question=user_question)
+        return self.prompt_assembler.assemble(system_message, "{question}", prompt_problem).to_llama_prompt()
 
-        formatted_prompt = f"""
-            <|begin_of_text|><|start_header_id|>user<|end_header_id|>
-            {system_message}\n\n{prompt_problem}
-            <|eot_id|>
-            <|start_header_id|>assistant<|end_header_id|>
-            """
-        native_request = {
-            "prompt": formatted_prompt
-        }
+    def generate_plot_creation_code(self, user_question: str, df: "pd.DataFrame", df_description: str) -> str:
+        """
+        Generates code for creating a plot based on the user's question and the DataFrame description using the AWS Bedrock Llama model.
 
-        request = json.dumps(native_request)
+        Args:
+            user_question (str): The question asked by the user.
+            df (pd.DataFrame): The DataFrame containing the data to be visualized.
+            df_description (str): A description of the DataFrame and its contents.
 
-        response = self.client.invoke_model(modelId=self.model_name, body=request)
-        model_response = json.loads(response["body"].read())
+        Returns:
+            str: The generated code for creating a plot.
+        """
+        return self._invoke(self._build_plot_prompt(user_question, df, df_description), "plot")
+
+    async def agenerate_plot_creation_code(self, user_question: str, df: "pd.DataFrame", df_description: str) -> str:
+        """
+        Async variant of `generate_plot_creation_code` running the Bedrock call on the thread pool.
+
+        Args:
+            user_question (str): The question asked by the user.
+            df (pd.DataFrame): The DataFrame containing the data to be visualized.
+            df_description (str): A description of the DataFrame and its contents.
+
+        Returns:
+            str: The generated code for creating a plot.
+        """
+        return await self._ainvoke(self._build_plot_prompt(user_question, df, df_description), "plot")
+
+    def _build_csv_selection_prompt(self, file_descriptions: list, user_question: str) -> str:
+        """Builds the Llama formatted prompt asking for the most relevant CSV file."""
+        system_message: str = SYSTEM_PROMPT_CSV_SELECTION
+        prompt_problem: str = CONTEXT_PROMPT_CSV_SELECTION.format(file_descriptions=file_descriptions, user_question=user_question)
+        return self.prompt_assembler.assemble(system_message, "{question}", prompt_problem).to_llama_prompt()
 
-        response_text = model_response.get("generation", "No generation returned.")
-        logger.info("Bedrock Llama answer retrieved.")
-        return response_text
-    
     def select_relevant_csv_file(self, file_descriptions: list, user_question: str) -> str:
         """
         Selects the most relevant CSV file from a list based on the user's question.
@@ -155,23 +379,17 @@ class BedrockLlamaLLM(BaseLLM):
         Returns:
             str: The filename of the most relevant CSV file, or "No relevant file found" if none match.
         """
-        system_message: str = SYSTEM_PROMPT_CSV_SELECTION
-        prompt_problem: str = CONTEXT_PROMPT_CSV_SELECTION.format(file_descriptions=file_descriptions, user_question=user_question)
-        formatted_prompt = f"""
-            <|begin_of_text|><|start_header_id|>user<|end_header_id|>
-            {system_message}\n\n{prompt_problem}
-            <|eot_id|>
-            <|start_header_id|>assistant<|end_header_id|>
-            """
-        native_request = {
-            "prompt": formatted_prompt
-        }
+        return self._invoke(self._build_csv_selection_prompt(file_descriptions, user_question), "csv_selection").strip()
 
-        request = json.dumps(native_request)
+    async def aselect_relevant_csv_file(self, file_descriptions: list, user_question: str) -> str:
+        """
+        Async variant of `select_relevant_csv_file` running the Bedrock call on the thread pool.
 
-        response = self.client.invoke_model(modelId=self.model_name, body=request)
-        model_response = json.loads(response["body"].read())
+        Args:
+            file_descriptions (list): Descriptions of the available CSV files.
+            user_question (str): The question asked by the user.
 
-        response_text = model_response.get("generation", "No generation returned.")
-        logger.info("Bedrock Llama answer retrieved.")
-        return response_text.strip()
\ No newline at end of file
+        Returns:
+            str: The filename of the most relevant CSV file, or "No relevant file found" if none match.
+        """
+        return (await self._ainvoke(self._build_csv_selection_prompt(file_descriptions, user_question), "csv_selection")).strip()
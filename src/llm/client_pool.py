@@ -0,0 +1,92 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Tuple
+from src.config.logging_config import logger
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI, AsyncOpenAI
+
+# The openai, httpx and boto3 packages are imported when the first client of their backend is created,
+# so processes that never use a backend do not pay for importing it.
+
+class ClientPool:
+    def __init__(self, max_connections: int = 64, max_keepalive_connections: int = 32, keepalive_expiry: float = 30.0,
+                 timeout: float = 60.0, max_retries: int = 2) -> None:
+        """
+        Registry owning one pooled API client per backend and endpoint, so every component talking to the same
+        backend shares its keep-alive connections and settings instead of opening its own pool.
+
+        Args:
+            max_connections (int, optional): Connections per client. Default is 64.
+            max_keepalive_connections (int, optional): Idle connections kept open per client. Default is 32.
+            keepalive_expiry (float, optional): Seconds an idle connection is kept open. Default is 30.
+            timeout (float, optional): Request timeout in seconds. Default is 60.
+            max_retries (int, optional): Retries on connection errors and retryable status codes. Default is 2.
+        """
+        self.max_connections: int = max_connections
+        self.max_keepalive_connections: int = max_keepalive_connections
+        self.keepalive_expiry: float = keepalive_expiry
+        self.timeout: float = timeout
+        self.max_retries: int = max_retries
+        self.clients: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+
+    def _limits(self) -> "httpx.Limits":
+        import httpx
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+    def _get_or_create(self, key: Tuple[str, ...], factory):
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = factory()
+                logger.info(f"Created pooled {key[0]} client.")
+            return client
+
+    def openai(self, api_key: str = None, base_url: str = None) -> "OpenAI":
+        """
+        Returns the shared synchronous OpenAI client for the key and endpoint.
+
+        Args:
+            api_key (str, optional): API key. Default reads OPENAI_API_KEY.
+            base_url (str, optional): API endpoint. Default reads OPENAI_BASE_URL, falling back to the OpenAI API.
+        """
+        from openai import OpenAI, DefaultHttpxClient
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        return self._get_or_create(("openai", api_key or "", base_url or ""), lambda: OpenAI(
+            api_key=api_key, base_url=base_url, timeout=self.timeout, max_retries=self.max_retries,
+            http_client=DefaultHttpxClient(limits=self._limits())))
+
+    def async_openai(self, api_key: str = None, base_url: str = None) -> "AsyncOpenAI":
+        """Returns the shared async OpenAI client for the key and endpoint. Same arguments as `openai`."""
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        return self._get_or_create(("async_openai", api_key or "", base_url or ""), lambda: AsyncOpenAI(
+            api_key=api_key, base_url=base_url, timeout=self.timeout, max_retries=self.max_retries,
+            http_client=DefaultAsyncHttpxClient(limits=self._limits())))
+
+    def bedrock_runtime(self, region_name: str = None, max_pool_connections: int = None):
+        """
+        Returns the shared Bedrock runtime client for the region, with credentials from the environment.
+
+        Args:
+            region_name (str, optional): AWS region. Default reads AWS_REGION.
+            max_pool_connections (int, optional): Minimum connection pool size. The pool is never smaller than max_connections.
+        """
+        import boto3
+        from botocore.config import Config
+        region_name = region_name or os.getenv("AWS_REGION")
+        pool_size = max(self.max_connections, max_pool_connections or 0)
+        return self._get_or_create(("bedrock-runtime", region_name or ""), lambda: boto3.client(
+            service_name="bedrock-runtime",
+            region_name=region_name,
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
+            config=Config(max_pool_connections=pool_size, tcp_keepalive=True, connect_timeout=10, read_timeout=self.timeout,
+                          retries={"max_attempts": self.max_retries + 1, "mode": "standard"})
+        ))
@@ -0,0 +1,149 @@
+import re
+import json
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Tuple
+from src.metrics.metrics import REGISTRY
+from src.config.logging_config import logger
+
+LLM_COALESCED_CALLS = REGISTRY.counter("ai_agent_llm_coalesced_calls_total", "LLM calls answered by an identical call already in flight.", ("backend", "call_type"))
+LLM_BATCH_SIZE = REGISTRY.histogram("ai_agent_llm_batch_size", "Number of calls sent to the LLM as one batched prompt.", ("backend", "call_type"),
+                                    buckets=(1, 2, 4, 8, 16, 32, 64))
+LLM_BATCH_FALLBACKS = REGISTRY.counter("ai_agent_llm_batch_fallbacks_total", "Batched prompts whose answer could not be used and were sent one by one.",
+                                       ("backend", "call_type"))
+
+class SingleFlight:
+    def __init__(self, backend: str) -> None:
+        """
+        Shares one in-flight call between concurrent callers asking for the same key (e.g. the same rendered prompt).
+        The call runs as its own task, so a caller that is cancelled does not cancel it for the others; it is only
+        cancelled once every caller waiting for it is gone.
+
+        Args:
+            backend (str): Backend name used in metrics.
+        """
+        self.backend: str = backend
+        # Key -> (task, number of callers waiting for it).
+        self.in_flight: Dict[str, List] = {}
+
+    async def run(self, key: str, call_type: str, call: Callable[[], Awaitable[str]]) -> str:
+        """
+        Returns the result of `call()`, or of the identical call already in flight.
+
+        Args:
+            key (str): Identity of the call. Calls with equal keys must return the same result.
+            call_type (str): Kind of call, used in metrics.
+            call (Callable[[], Awaitable[str]]): Starts the call when none with this key is in flight.
+        """
+        entry = self.in_flight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(call())
+            entry = self.in_flight[key] = [task, 0]
+            task.add_done_callback(lambda _: self._forget(key, entry))
+        else:
+            LLM_COALESCED_CALLS.inc(backend=self.backend, call_type=call_type)
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                task.cancel()
+                self._forget(key, entry)
+
+    def _forget(self, key: str, entry: List) -> None:
+        if self.in_flight.get(key) is entry:
+            del self.in_flight[key]
+
+# Valid answers of a batched intent prompt. Anything else (e.g. steered by another question of the batch) is rejected.
+INTENT_ANSWERS = ("1", "2", "3")
+
+def parse_batched_answers(text: str, count: int, allowed: Tuple[str, ...] = None) -> List[str]:
+    """
+    Parses the answer to a batched prompt: a JSON array with one item per input, in input order.
+
+    Raises:
+        ValueError: If the text holds no JSON array of `count` items, or an item is not one of `allowed` (if given).
+    """
+    match = re.search(r"\[.*\]", text, re.DOTALL)
+    if match is None:
+        raise ValueError(f"No JSON array in batched answer {text!r}.")
+    items = json.loads(match.group(0))
+    if not isinstance(items, list) or len(items) != count:
+        raise ValueError(f"Expected {count} batched answers, got {text!r}.")
+    answers = [str(item).strip() for item in items]
+    if allowed is not None and any(answer not in allowed for answer in answers):
+        raise ValueError(f"Unexpected batched answer in {text!r}.")
+    return answers
+
+class MicroBatcher:
+    def __init__(self, batch_call: Callable[[List[str]], Awaitable[List[str]]], single_call: Callable[[str], Awaitable[str]],
+                 window: float = 0.005, max_batch_size: int = 16, backend: str = None, call_type: str = "intent") -> None:
+        """
+        Collects short calls submitted within `window` seconds and sends them as one batched prompt, fanning the
+        answers back out to the callers. A batch of one, or a batch whose answer cannot be parsed, is sent
+        item by item with `single_call`.
+
+        Args:
+            batch_call (Callable[[List[str]], Awaitable[List[str]]]): Answers several items with one LLM call, in order.
+                Raises ValueError if the answer does not hold one item per input.
+            single_call (Callable[[str], Awaitable[str]]): Answers one item.
+            window (float, optional): Seconds the first item of a batch waits for others. Default is 0.005.
+            max_batch_size (int, optional): A batch is sent as soon as it holds this many items. Default is 16.
+            backend (str, optional): Backend name used in metrics.
+            call_type (str, optional): Kind of the batched calls, used in metrics. Default is "intent".
+        """
+        self.batch_call = batch_call
+        self.single_call = single_call
+        self.window: float = window
+        self.max_batch_size: int = max_batch_size
+        self.backend: str = backend
+        self.call_type: str = call_type
+        self.pending: List[Tuple[str, asyncio.Future]] = []
+        self.flush_handle: asyncio.TimerHandle = None
+
+    async def submit(self, item: str) -> str:
+        """Adds an item to the current batch and returns its answer."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((item, future))
+        if len(self.pending) >= self.max_batch_size:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch = [(item, future) for item, future in self.pending if not future.done()]
+        self.pending = []
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        items = [item for item, _ in batch]
+        LLM_BATCH_SIZE.observe(len(items), backend=self.backend, call_type=self.call_type)
+        try:
+            if len(items) == 1:
+                answers = [await self.single_call(items[0])]
+            else:
+                try:
+                    answers = await self.batch_call(items)
+                except ValueError as e:
+                    logger.warning(f"Batched {self.call_type} answer unusable, sending {len(items)} calls one by one: {e}")
+                    LLM_BATCH_FALLBACKS.inc(backend=self.backend, call_type=self.call_type)
+                    answers = await asyncio.gather(*(self.single_call(item) for item in items))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(answer)
+
+def format_batch_inputs(items: List[str]) -> str:
+    """Renders batched inputs as a numbered list, one input per line."""
+    return "\n".join(f"{number}. {' '.join(item.split())}" for number, item in enumerate(items, start=1))
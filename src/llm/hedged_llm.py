@@ -0,0 +1,134 @@
+import time
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, List, Sequence
+from src.llm.base_llm import BaseLLM
+from src.metrics.latency import LatencyTracker
+from src.metrics.metrics import REGISTRY
+from src.metrics.tracing import LLM_LATENCY
+from src.config.logging_config import logger
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+LLM_HEDGES = REGISTRY.counter("ai_agent_llm_hedges_total", "Hedged LLM requests by call type and winning backend.", ("backend", "call_type", "winner"))
+
+class HedgedLLM(BaseLLM):
+    def __init__(self, primary: BaseLLM, secondary: BaseLLM, percentile: float = 95.0, default_delay: float = 2.0,
+                 min_delay: float = 0.05, max_delay: float = 10.0, min_samples: int = 20,
+                 call_types: Sequence[str] = ("intent", "general", "plot", "csv_selection"), latency_tracker: LatencyTracker = None) -> None:
+        """
+        Sends async requests to the primary backend and, if it has not answered within its recent p95 latency,
+        fires the same request at the secondary backend and returns whichever answers first. The other request is cancelled.
+        Only the slowest few percent of calls are sent twice, so the tail latency drops without doubling spend.
+        Chat history always lives with the primary backend; streaming and sync calls are not hedged.
+
+        Args:
+            primary (BaseLLM): Backend every request is sent to.
+            secondary (BaseLLM): Backend used for hedges.
+            percentile (float, optional): Percentile of the primary API latency used as hedging delay. Default is 95.
+            default_delay (float, optional): Delay used until min_samples latencies were observed. Default is 2 seconds.
+            min_delay (float, optional): Lower bound of the delay. Default is 0.05 seconds.
+            max_delay (float, optional): Upper bound of the delay. Default is 10 seconds.
+            min_samples (int, optional): Observed latencies needed before the percentile is used. Default is 20.
+            call_types (Sequence[str], optional): Call types that are hedged; others only go to the primary. Default is all.
+            latency_tracker (LatencyTracker, optional): Source of the primary latencies. Default is LLM_LATENCY, fed by the backends.
+        """
+        self.primary: BaseLLM = primary
+        self.secondary: BaseLLM = secondary
+        self.backend: str = primary.backend
+        self.percentile: float = percentile
+        self.default_delay: float = default_delay
+        self.min_delay: float = min_delay
+        self.max_delay: float = max_delay
+        self.min_samples: int = min_samples
+        self.call_types: frozenset = frozenset(call_types)
+        self.latency_tracker: LatencyTracker = latency_tracker or LLM_LATENCY
+
+    def hedge_delay(self, call_type: str) -> float:
+        """Returns how long to wait for the primary backend before hedging a call of this type."""
+        delay = self.latency_tracker.percentile((self.primary.backend, call_type), self.percentile, self.min_samples)
+        if delay is None:
+            delay = self.default_delay
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    async def _hedged(self, call_type: str, call: Callable[[BaseLLM], Awaitable[str]]) -> str:
+        """
+        Runs call(primary) and, after the hedging delay, call(secondary), returning the first successful result.
+
+        Raises:
+            Exception: The primary's error if it fails before the hedge, or if both backends fail.
+        """
+        if call_type not in self.call_types:
+            return await call(self.primary)
+        start = time.perf_counter()
+        primary_task = asyncio.ensure_future(call(self.primary))
+        pending = {primary_task}
+        secondary_task = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay(call_type))
+            if done:
+                return primary_task.result()
+
+            logger.info(f"Hedging {call_type} request to {self.primary.backend} with {self.secondary.backend}.")
+            secondary_task = asyncio.ensure_future(call(self.secondary))
+            pending = {primary_task, secondary_task}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = "primary" if task is primary_task else "secondary"
+                        LLM_HEDGES.inc(backend=self.primary.backend, call_type=call_type, winner=winner)
+                        return task.result()
+                    logger.warning(f"Hedged {call_type} request failed on one backend: {task.exception()}")
+            raise primary_task.exception()
+        finally:
+            # Also runs when the caller is cancelled (e.g. the client disconnected), so no call is left running unowned.
+            for task in pending:
+                task.cancel()
+            if secondary_task is not None and primary_task in pending:
+                # The cancelled primary took at least this long, which keeps the percentile from drifting down.
+                self.latency_tracker.record((self.primary.backend, call_type), time.perf_counter() - start)
+
+    def load_chat_history(self, session_id: str = "default", limit: int = 10) -> List[Dict[str, str]]:
+        return self.primary.load_chat_history(session_id, limit)
+
+    def save_chat_history(self, session_id: str, messages: List[Dict[str, str]]) -> None:
+        self.primary.save_chat_history(session_id, messages)
+
+    def generate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> str:
+        return self.primary.generate_answer(question, question_type, context, max_tokens, session_id)
+
+    async def agenerate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> str:
+        """
+        Hedged variant of `agenerate_answer`. History is loaded from and saved to the primary backend,
+        whichever backend produced the answer.
+        """
+        chat_history = await asyncio.to_thread(self.primary.load_chat_history, session_id) if question_type != "intent" else []
+        answer = await self.agenerate_from_history(question, question_type, context, chat_history, max_tokens)
+        if answer is None:
+            return "Could not provide answer."
+        if question_type == "intent":
+            return answer
+        await asyncio.to_thread(self.primary.save_chat_history, session_id, [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer},
+        ])
+        return answer
+
+    async def agenerate_from_history(self, question: str, question_type: str, context: str, chat_history: List[Dict[str, str]], max_tokens: int = 100) -> str:
+        return await self._hedged(question_type, lambda llm: llm.agenerate_from_history(question, question_type, context, chat_history, max_tokens))
+
+    def astream_answer(self, question: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> AsyncIterator[str]:
+        return self.primary.astream_answer(question, context, max_tokens, session_id)
+
+    def generate_plot_creation_code(self, user_question: str, df: "pd.DataFrame", df_description: str) -> str:
+        return self.primary.generate_plot_creation_code(user_question, df, df_description)
+
+    async def agenerate_plot_creation_code(self, user_question: str, df: "pd.DataFrame", df_description: str) -> str:
+        return await self._hedged("plot", lambda llm: llm.agenerate_plot_creation_code(user_question, df, df_description))
+
+    def select_relevant_csv_file(self, file_descriptions: list, user_question: str) -> str:
+        return self.primary.select_relevant_csv_file(file_descriptions, user_question)
+
+    async def aselect_relevant_csv_file(self, file_descriptions: list, user_question: str) -> str:
+        return await self._hedged("csv_selection", lambda llm: llm.aselect_relevant_csv_file(file_descriptions, user_question))
@@ -1,48 +1,180 @@
 import os
-import json
-from openai import OpenAI
-import pandas as pd
-from src.api.constants import CHAT_HISTORY_DIR
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List
+from src.api.constants import CHAT_HISTORY_DIR, CHAT_HISTORY_DB_PATH, CHAT_HISTORY_TAIL_MESSAGES, PROMPT_MAX_TOKENS, PROMPT_HISTORY_SHARE
+from src.history.chat_history_store import ChatHistoryStore
 from src.llm.base_llm import BaseLLM
+from src.llm.client_pool import ClientPool
+from src.llm.coalescing import INTENT_ANSWERS, SingleFlight, MicroBatcher, format_batch_inputs, parse_batched_answers
+from src.llm.response_cache import ResponseCache, make_cache_key
+from src.llm.prompt_assembler import PromptAssembler
+from src.metrics.tracing import span, record_llm_usage
 from src.config.logging_config import logger
-from src.prompts.prompts import SYSTEM_PROMPT, CONTEXT_PROMPT, SYSTEM_PROMPT_PLOT, CONTEXT_PROMPT_PLOT, SYSTEM_PROMPT_INTENT, CONTEXT_PROMPT_INTENT, SYSTEM_PROMPT_CSV_SELECTION, CONTEXT_PROMPT_CSV_SELECTION
+from src.prompts.prompts import SYSTEM_PROMPT, CONTEXT_PROMPT, SYSTEM_PROMPT_PLOT, CONTEXT_PROMPT_PLOT, SYSTEM_PROMPT_INTENT, CONTEXT_PROMPT_INTENT, SYSTEM_PROMPT_INTENT_BATCH, CONTEXT_PROMPT_INTENT_BATCH, SYSTEM_PROMPT_CSV_SELECTION, CONTEXT_PROMPT_CSV_SELECTION
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 load_dotenv()
 
 class OpenaiLLM(BaseLLM):
-    def __init__(self, model_name: str = "gpt-4o-mini") -> None:
+    backend: str = "openai"
+
+    def __init__(self, model_name: str = "gpt-4o-mini", response_cache: ResponseCache = None, history_store: ChatHistoryStore = None,
+                 prompt_assembler: PromptAssembler = None, client_pool: ClientPool = None, single_flight: bool = True,
+                 intent_batch_window: float = None, intent_batch_max_size: int = 16) -> None:
         """
         Initializes the LLM class with the OpenAI API.
 
         Args:
             model_name (str): Name of the model to use. Default is "gpt-4o-mini".
+            response_cache (ResponseCache, optional): Cache consulted before calling the API. No caching if not set.
+            history_store (ChatHistoryStore, optional): Store holding chat history. Default opens the store at CHAT_HISTORY_DB_PATH.
+            prompt_assembler (PromptAssembler, optional): Fits answer prompts into a token budget. Default uses PROMPT_MAX_TOKENS.
+            client_pool (ClientPool, optional): Registry of shared API clients. Default creates a private one.
+            single_flight (bool, optional): Concurrent async calls with the same rendered prompt share one API call. Default is True.
+            intent_batch_window (float, optional): Seconds async intent calls are collected to be classified with one batched
+                prompt. Default is None (no batching).
+            intent_batch_max_size (int, optional): Maximum number of intent calls per batched prompt. Default is 16.
         """
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        client_pool = client_pool or ClientPool()
+        self.client = client_pool.openai()
+        self.async_client = client_pool.async_openai()
         self.model_name: str = model_name
-        self.history_file = os.path.join(CHAT_HISTORY_DIR, "openai.json")
-        self.chat_history = self.load_chat_history()
-
-    def load_chat_history(self):
-        """Loads chat history from a JSON file."""
-        if not os.path.exists(CHAT_HISTORY_DIR):
-            os.makedirs(CHAT_HISTORY_DIR)
-        
-        if os.path.exists(self.history_file):
-            with open(self.history_file, "r", encoding="utf-8") as file:
-                try:
-                    return json.load(file)
-                except json.JSONDecodeError:
-                    logger.warning(f"Invalid JSON format in {self.history_file}, resetting chat history.")
-                    return []
-        return []
-
-    def save_chat_history(self):
-        """Saves chat history to a JSON file."""
-        with open(self.history_file, "w", encoding="utf-8") as file:
-            json.dump(self.chat_history, file, ensure_ascii=False, indent=4)
+        self.response_cache: ResponseCache = response_cache
+        self.prompt_assembler: PromptAssembler = prompt_assembler or PromptAssembler(PROMPT_MAX_TOKENS, PROMPT_HISTORY_SHARE)
+        self.history_store: ChatHistoryStore = history_store or ChatHistoryStore(CHAT_HISTORY_DB_PATH)
+        self.history_store.import_json_history("openai", os.path.join(CHAT_HISTORY_DIR, "openai.json"))
+        self.single_flight: SingleFlight = SingleFlight("openai") if single_flight else None
+        self.intent_batcher: MicroBatcher = MicroBatcher(self._aclassify_intents, self._aclassify_intent, intent_batch_window,
+                                                         intent_batch_max_size, "openai") if intent_batch_window else None
+
+    def load_chat_history(self, session_id: str = "default", limit: int = CHAT_HISTORY_TAIL_MESSAGES) -> List[Dict[str, str]]:
+        """Loads the last `limit` chat history messages of a session."""
+        with span("history.load"):
+            return self.history_store.tail("openai", session_id, limit)
+
+    def save_chat_history(self, session_id: str, messages: List[Dict[str, str]]) -> None:
+        """Appends messages to the chat history of a session."""
+        with span("history.save"):
+            self.history_store.append("openai", session_id, messages)
     
-    def generate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100) -> str:
+    def _completion_kwargs(self, messages: List[Dict[str, str]], max_tokens: int = None, temperature: float = None) -> dict:
+        kwargs = {"messages": messages, "model": self.model_name}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        return kwargs
+
+    @staticmethod
+    def _record_usage(call_type: str, usage, seconds: float = None) -> None:
+        """Counts the call, the tokens reported in the API `usage` field and the call latency."""
+        record_llm_usage("openai", call_type, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None), seconds)
+
+    def _complete(self, messages: List[Dict[str, str]], call_type: str, max_tokens: int = None, temperature: float = None) -> str:
+        """
+        Sends chat messages to the model, answering from the response cache when possible.
+
+        Args:
+            messages (List[Dict[str, str]]): Fully rendered chat messages.
+            call_type (str): Kind of call ("intent", "general", "plot", "csv_selection"), used by the cache.
+            max_tokens (int, optional): The maximum number of tokens to generate. API default if not set.
+            temperature (float, optional): Sampling temperature. API default if not set.
+
+        Returns:
+            str: The generated message content.
+        """
+        key = make_cache_key(self.model_name, messages, max_tokens, temperature) if self.response_cache else None
+        if key:
+            cached = self.response_cache.get(key, call_type)
+            if cached is not None:
+                logger.info(f"Openai LLM answer for type {call_type} served from cache.")
+                return cached
+        with span(f"llm.openai.{call_type}") as timing:
+            chat_completion = self.client.chat.completions.create(**self._completion_kwargs(messages, max_tokens, temperature))
+        self._record_usage(call_type, chat_completion.usage, timing.seconds)
+        answer = chat_completion.choices[0].message.content
+        if key:
+            self.response_cache.set(key, call_type, answer)
+        return answer
+
+    async def _acomplete(self, messages: List[Dict[str, str]], call_type: str, max_tokens: int = None, temperature: float = None,
+                         batch_item: str = None) -> str:
+        """
+        Async variant of `_complete` using the async OpenAI client. Concurrent calls with the same messages share one
+        API call, and with a `batch_item` the call goes through the intent batcher (if enabled).
+        """
+        key = make_cache_key(self.model_name, messages, max_tokens, temperature)
+        if self.response_cache:
+            cached = await self.response_cache.aget(key, call_type)
+            if cached is not None:
+                logger.info(f"Openai LLM answer for type {call_type} served from cache.")
+                return cached
+        # Batched answers depend on the other questions of the batch, so they are never stored in the response cache.
+        batched = batch_item is not None and self.intent_batcher is not None
+        if batched:
+            call = lambda: self.intent_batcher.submit(batch_item)
+        else:
+            call = lambda: self._acall(messages, call_type, max_tokens, temperature)
+        answer = await (self.single_flight.run(key, call_type, call) if self.single_flight else call())
+        if self.response_cache and not batched:
+            await self.response_cache.aset(key, call_type, answer)
+        return answer
+
+    async def _acall(self, messages: List[Dict[str, str]], call_type: str, max_tokens: int = None, temperature: float = None) -> str:
+        """Sends chat messages to the model with the async client and records the usage, without caching or coalescing."""
+        with span(f"llm.openai.{call_type}") as timing:
+            chat_completion = await self.async_client.chat.completions.create(**self._completion_kwargs(messages, max_tokens, temperature))
+        self._record_usage(call_type, chat_completion.usage, timing.seconds)
+        return chat_completion.choices[0].message.content
+
+    async def _aclassify_intent(self, question: str) -> str:
+        """Classifies the intent of one question, as sent by the intent batcher."""
+        return await self._acall(self._build_answer_messages(question, "intent", "", []), "intent", max_tokens=100, temperature=0.1)
+
+    async def _aclassify_intents(self, questions: List[str]) -> List[str]:
+        """
+        Classifies the intents of several questions with one batched prompt.
+
+        Raises:
+            ValueError: If the answer does not hold one valid intent per question.
+        """
+        prompt = self.prompt_assembler.assemble(SYSTEM_PROMPT_INTENT_BATCH, CONTEXT_PROMPT_INTENT_BATCH, format_batch_inputs(questions))
+        answer = await self._acall(prompt.to_chat_messages(), "intent_batch", max_tokens=8 * len(questions) + 16, temperature=0.1)
+        return parse_batched_answers(answer, len(questions), allowed=INTENT_ANSWERS)
+
+    def _build_answer_messages(self, question: str, question_type: str, context: str, chat_history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Builds the chat messages for a question, including recent chat history for non-intent questions.
+        Context and history are cut to fit the prompt token budget.
+
+        Args:
+            question (str): The question for which the answer is to be generated.
+            question_type (str): The type of the question, which determines the prompt template.
+            context (str): The context to be used in the prompt.
+            chat_history (List[Dict[str, str]]): Previous chat messages.
+
+        Returns:
+            List[Dict[str, str]]: Messages to send, or None if the question type is not supported.
+        """
+        if question_type == "general":
+            prompt = self.prompt_assembler.assemble(SYSTEM_PROMPT, CONTEXT_PROMPT, question, context=context, chat_history=chat_history)
+        elif question_type == "intent":
+            prompt = self.prompt_assembler.assemble(SYSTEM_PROMPT_INTENT, CONTEXT_PROMPT_INTENT, question)
+        else:
+            return None
+        return prompt.to_chat_messages()
+
+    def _record_answer(self, session_id: str, question: str, answer: str) -> None:
+        """Appends the question and answer to the chat history of a session."""
+        self.save_chat_history(session_id, [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer},
+        ])
+
+    def generate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> str:
         """
         Generates an answer to a given question based on the question type.
 
@@ -51,74 +183,158 @@ class OpenaiLLM(BaseLLM):
             question_type (str): The type of the question, which determines the prompt template.
             context (str, optional): The context to be used in the prompt. Default is an empty string.
             max_tokens (int, optional): The maximum number of tokens for the generated answer. Default is 100.
+            session_id (str, optional): Conversation whose chat history is used and extended. Default is "default".
 
         Returns:
             str: The generated answer.
         """
-        self.chat_history = self.load_chat_history()
-        if question_type == "general":
-            system = SYSTEM_PROMPT
-            prompt = CONTEXT_PROMPT.format(context=context, question=question)
-        elif question_type == "intent":
-            system = SYSTEM_PROMPT_INTENT
-            prompt = CONTEXT_PROMPT_INTENT.format(question=question)
-        else:
+        chat_history = self.load_chat_history(session_id) if question_type != "intent" else []
+        messages = self._build_answer_messages(question, question_type, context, chat_history)
+        if messages is None:
             return "Could not provide answer."
-        
+
         logger.info(f"Getting Openai LLM answer for type {question_type}...")
-        messages = [{"role": "system", "content": system}]
-        if question_type != "intent":
-            messages += self.chat_history[-10:]
-        messages.append({"role": "user", "content": prompt})
-        
-        chat_completion = self.client.chat.completions.create(
-            messages=messages,
-            model=self.model_name,
-            max_tokens=max_tokens,
-            temperature=0.1
-        )
-        answer = chat_completion.choices[0].message.content
+        answer = self._complete(messages, question_type, max_tokens=max_tokens, temperature=0.1)
         logger.info(f"Openai LLM answer retrieved.")
         if question_type == "intent":
             return answer
-        self.chat_history.append({"role": "user", "content": question})
-        self.chat_history.append({"role": "assistant", "content": answer})
-        self.save_chat_history()
+        self._record_answer(session_id, question, answer)
         return answer
-    
-    def generate_plot_creation_code(self, user_question: str, df: pd.DataFrame, df_description: str) -> str:
+
+    async def agenerate_answer(self, question: str, question_type: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> str:
         """
-        Generates code for creating a plot based on the user's question and the DataFrame description.
+        Async variant of `generate_answer` using the async OpenAI client. Chat history I/O runs in a worker thread.
 
         Args:
-            user_question (str): The question asked by the user.
-            df (pd.DataFrame): The DataFrame containing the data to be visualized.
-            df_description (str): A description of the DataFrame and its contents.
+            question (str): The question for which the answer is to be generated.
+            question_type (str): The type of the question, which determines the prompt template.
+            context (str, optional): The context to be used in the prompt. Default is an empty string.
+            max_tokens (int, optional): The maximum number of tokens for the generated answer. Default is 100.
+            session_id (str, optional): Conversation whose chat history is used and extended. Default is "default".
 
         Returns:
-            str: The generated code for creating a plot.
+            str: The generated answer.
         """
+        chat_history = await asyncio.to_thread(self.load_chat_history, session_id) if question_type != "intent" else []
+        answer = await self.agenerate_from_history(question, question_type, context, chat_history, max_tokens)
+        if answer is None:
+            return "Could not provide answer."
+        if question_type == "intent":
+            return answer
+        await asyncio.to_thread(self._record_answer, session_id, question, answer)
+        return answer
+
+    async def agenerate_from_history(self, question: str, question_type: str, context: str, chat_history: List[Dict[str, str]], max_tokens: int = 100) -> str:
+        """
+        Generates an answer for already loaded chat history without reading or writing the history store.
+
+        Args:
+            question (str): The question for which the answer is to be generated.
+            question_type (str): The type of the question, which determines the prompt template.
+            context (str): The context to be used in the prompt.
+            chat_history (List[Dict[str, str]]): Previous chat messages.
+            max_tokens (int, optional): The maximum number of tokens for the generated answer. Default is 100.
+
+        Returns:
+            str: The generated answer, or None if the question type is not supported.
+        """
+        messages = self._build_answer_messages(question, question_type, context, chat_history)
+        if messages is None:
+            return None
+
+        logger.info(f"Getting Openai LLM answer for type {question_type}...")
+        answer = await self._acomplete(messages, question_type, max_tokens=max_tokens, temperature=0.1,
+                                       batch_item=question if question_type == "intent" else None)
+        logger.info(f"Openai LLM answer retrieved.")
+        return answer
+
+    async def astream_answer(self, question: str, context: str = "", max_tokens: int = 100, session_id: str = "default") -> AsyncIterator[str]:
+        """
+        Streams a general answer token by token using the OpenAI streaming API.
+        The full answer is appended to chat history once the stream is complete; if the consumer stops early,
+        the response is closed and nothing is saved.
+
+        Args:
+            question (str): The question for which the answer is to be generated.
+            context (str, optional): The context to be used in the prompt. Default is an empty string.
+            max_tokens (int, optional): The maximum number of tokens for the generated answer. Default is 100.
+            session_id (str, optional): Conversation whose chat history is used and extended. Default is "default".
+
+        Yields:
+            str: Text deltas as they arrive.
+        """
+        chat_history = await asyncio.to_thread(self.load_chat_history, session_id)
+        messages = self._build_answer_messages(question, "general", context, chat_history)
+
+        logger.info("Streaming Openai LLM answer...")
+        parts: List[str] = []
+        usage = None
+        with span("llm.openai.general_stream"):
+            stream = await self.async_client.chat.completions.create(
+                **self._completion_kwargs(messages, max_tokens, 0.1), stream=True, stream_options={"include_usage": True}
+            )
+            try:
+                async for chunk in stream:
+                    # With include_usage the last chunk carries the token counts and no choices.
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            finally:
+                # Releases the HTTP response, so generation is not read to the end after the client left.
+                await stream.close()
+        self._record_usage("general", usage)
+        logger.info("Openai LLM answer streamed.")
+        await asyncio.to_thread(self._record_answer, session_id, question, "".join(parts))
+
+    def _build_plot_messages(self, user_question: str, df: "pd.DataFrame", df_description: str) -> List[Dict[str, str]]:
+        """Builds the chat messages asking for plot creation code."""
         rows_num: int = len(df)
         cols_num: int = len(df.columns)
-        cols_description: str = ""
-        for col in df.columns:
-            col_type = df.dtypes[col]
-            cols_description += f"{col} ({col_type})\n"
+        cols_description: str = "".join(f"{col} ({col_type})\n" for col, col_type in df.dtypes.items())
 
         system_message: str = SYSTEM_PROMPT_PLOT.format(
             rows_num=rows_num, cols_num=cols_num, df_description=df_description, cols_description=cols_description)
         prompt_problem: str = CONTEXT_PROMPT_PLOT.format(user_question=user_question)
 
-        messages = [
+        return [
             {"role": "system", "content": system_message},
             {"role": "user", "content": prompt_problem},
         ]
 
-        chat_completion = self.client.chat.completions.create(
-            messages=messages,
-            model=self.model_name,
-        )
-        return chat_completion.choices[0].message.content.strip()
+    def generate_plot_creation_code(self, user_question: str, df: "pd.DataFrame", df_description: str) -> str:
+        """
+        Generates code for creating a plot based on the user's question and the DataFrame description.
+
+        Args:
+            user_question (str): The question asked by the user.
+            df (pd.DataFrame): The DataFrame containing the data to be visualized.
+            df_description (str): A description of the DataFrame and its contents.
+
+        Returns:
+            str: The generated code for creating a plot.
+        """
+        messages = self._build_plot_messages(user_question, df, df_description)
+        return self._complete(messages, "plot").strip()
+
+    async def agenerate_plot_creation_code(self, user_question: str, df: "pd.DataFrame", df_description: str) -> str:
+        """
+        Async variant of `generate_plot_creation_code` using the async OpenAI client.
+
+        Args:
+            user_question (str): The question asked by the user.
+            df (pd.DataFrame): The DataFrame containing the data to be visualized.
+            df_description (str): A description of the DataFrame and its contents.
+
+        Returns:
+            str: The generated code for creating a plot.
+        """
+        messages = self._build_plot_messages(user_question, df, df_description)
+        return (await self._acomplete(messages, "plot")).strip()
     
     def select_relevant_csv_file(self, file_descriptions: list, user_question: str) -> str:
         """
@@ -131,15 +347,28 @@ class OpenaiLLM(BaseLLM):
         Returns:
             str: The filename of the most relevant CSV file, or "No relevant file found" if none match.
         """
+        messages = self._build_csv_selection_messages(file_descriptions, user_question)
+        return self._complete(messages, "csv_selection").strip()
+
+    async def aselect_relevant_csv_file(self, file_descriptions: list, user_question: str) -> str:
+        """
+        Async variant of `select_relevant_csv_file` using the async OpenAI client.
+
+        Args:
+            file_descriptions (list): Descriptions of the available CSV files.
+            user_question (str): The question asked by the user.
+
+        Returns:
+            str: The filename of the most relevant CSV file, or "No relevant file found" if none match.
+        """
+        messages = self._build_csv_selection_messages(file_descriptions, user_question)
+        return (await self._acomplete(messages, "csv_selection")).strip()
+
+    def _build_csv_selection_messages(self, file_descriptions: list, user_question: str) -> List[Dict[str, str]]:
+        """Builds the chat messages asking for the most relevant CSV file."""
         system_message: str = SYSTEM_PROMPT_CSV_SELECTION
         prompt_problem: str = CONTEXT_PROMPT_CSV_SELECTION.format(file_descriptions=file_descriptions, user_question=user_question)
-        messages = [
+        return [
             {"role": "system", "content": system_message},
             {"role": "user", "content": prompt_problem},
         ]
-        
-        chat_completion = self.client.chat.completions.create(
-            messages=messages,
-            model=self.model_name,
-        )
-        return chat_completion.choices[0].message.content.strip()
@@ -0,0 +1,159 @@
+import re
+from typing import Dict, List
+from src.config.logging_config import logger
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Approximates BPE splitting: long words and numbers take several tokens, every punctuation mark takes one.
+_FALLBACK_TOKEN_PATTERN = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]")
+# Role headers and separators added around every message by the chat and Llama formats.
+MESSAGE_OVERHEAD_TOKENS = 4
+TRUNCATION_MARKER = "\n[...]"
+
+class TokenCounter:
+    def __init__(self, encoding_name: str = "o200k_base") -> None:
+        """
+        Initializes a local token counter. Uses `tiktoken` when it is installed and the encoding can be loaded,
+        otherwise a regex approximation that needs no extra dependency.
+
+        Args:
+            encoding_name (str, optional): tiktoken encoding to use. Default is "o200k_base" (gpt-4o family).
+        """
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"Could not load tiktoken encoding {encoding_name}, using approximate token counts: {e}")
+
+    def count(self, text: str) -> int:
+        """Returns the number of tokens in text."""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return sum(1 for _ in _FALLBACK_TOKEN_PATTERN.finditer(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cuts text to at most max_tokens tokens, keeping its beginning.
+
+        Args:
+            text (str): Text to cut.
+            max_tokens (int): Maximum number of tokens to keep.
+
+        Returns:
+            str: The text itself if it fits, otherwise its first max_tokens tokens.
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        for i, match in enumerate(_FALLBACK_TOKEN_PATTERN.finditer(text)):
+            if i == max_tokens:
+                return text[:match.start()].rstrip()
+        return text
+
+_default_counter: TokenCounter = None
+
+def default_token_counter() -> TokenCounter:
+    """Returns the process-wide token counter."""
+    global _default_counter
+    if _default_counter is None:
+        _default_counter = TokenCounter()
+    return _default_counter
+
+class AssembledPrompt:
+    def __init__(self, system: str, history: List[Dict[str, str]], user: str, tokens: int) -> None:
+        """
+        Holds the parts of a prompt that fit into the token budget.
+
+        Args:
+            system (str): System prompt.
+            history (List[Dict[str, str]]): Chat history messages kept, in chronological order.
+            user (str): Final user message.
+            tokens (int): Number of prompt tokens, including per-message overhead.
+        """
+        self.system: str = system
+        self.history: List[Dict[str, str]] = history
+        self.user: str = user
+        self.tokens: int = tokens
+
+    def to_chat_messages(self) -> List[Dict[str, str]]:
+        """Renders the prompt as OpenAI chat messages."""
+        return [{"role": "system", "content": self.system}, *self.history, {"role": "user", "content": self.user}]
+
+    def to_llama_prompt(self) -> str:
+        """Renders the prompt with Llama 3 header tokens, ending with the assistant header."""
+        parts = ["<|begin_of_text|>"]
+        for message in self.to_chat_messages():
+            parts.append(f"<|start_header_id|>{message['role']}<|end_header_id|>\n\n{message['content']}<|eot_id|>")
+        parts.append("<|start_header_id|>assistant<|end_header_id|>\n\n")
+        return "".join(parts)
+
+class PromptAssembler:
+    def __init__(self, max_prompt_tokens: int = 4000, history_share: float = 0.25, token_counter: TokenCounter = None) -> None:
+        """
+        Initializes the prompt assembler shared by the LLM backends.
+
+        Parts are fitted into the budget in priority order: the system prompt and the question are always kept,
+        the context is truncated to what is left after reserving `history_share` of the budget for chat history,
+        and history fills the remaining space newest message first.
+
+        Args:
+            max_prompt_tokens (int, optional): Token budget of the whole prompt. Default is 4000.
+            history_share (float, optional): Share of the budget reserved for chat history. Default is 0.25.
+            token_counter (TokenCounter, optional): Counter used for budgeting. Default is the process-wide one.
+        """
+        self.max_prompt_tokens: int = max_prompt_tokens
+        self.history_share: float = history_share
+        self.token_counter: TokenCounter = token_counter or default_token_counter()
+
+    def assemble(self, system: str, user_template: str, question: str, context: str = None,
+                 chat_history: List[Dict[str, str]] = None) -> AssembledPrompt:
+        """
+        Fits the prompt parts into the token budget.
+
+        Args:
+            system (str): System prompt.
+            user_template (str): Template of the user message with a `{question}` and, if context is given, a `{context}` field.
+            question (str): The user question.
+            context (str, optional): Context inserted into the template, truncated if it does not fit.
+            chat_history (List[Dict[str, str]], optional): Previous messages in chronological order; the oldest are dropped first.
+
+        Returns:
+            AssembledPrompt: The parts that fit.
+        """
+        count = self.token_counter.count
+        fields = {"question": question}
+        if context is not None:
+            fields["context"] = ""
+        used = count(system) + count(user_template.format(**fields)) + 2 * MESSAGE_OVERHEAD_TOKENS
+        remaining = max(self.max_prompt_tokens - used, 0)
+
+        history_costs = [count(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in chat_history or []]
+        if context is not None:
+            context_tokens = count(context)
+            history_reserve = min(sum(history_costs), int(self.max_prompt_tokens * self.history_share))
+            context_budget = max(remaining - history_reserve, 0)
+            if context_tokens > context_budget:
+                logger.info(f"Context truncated from {context_tokens} to {context_budget} tokens.")
+                context = self.token_counter.truncate(context, context_budget - count(TRUNCATION_MARKER)) + TRUNCATION_MARKER
+                context_tokens = count(context)
+            fields["context"] = context
+            remaining -= context_tokens
+            used += context_tokens
+
+        kept = 0
+        for cost in reversed(history_costs):
+            if cost > remaining:
+                break
+            remaining -= cost
+            used += cost
+            kept += 1
+        history = list(chat_history[len(history_costs) - kept:]) if kept else []
+        return AssembledPrompt(system, history, user_template.format(**fields), used)
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Tuple
+
+def make_cache_key(model_name: str, prompt: Any, max_tokens: int = None, temperature: float = None) -> str:
+    """
+    Build a content-addressed key for an LLM call.
+
+    Args:
+        model_name (str): Name of the model.
+        prompt (Any): Fully rendered chat messages or prompt string.
+        max_tokens (int, optional): Maximum number of generated tokens.
+        temperature (float, optional): Sampling temperature.
+
+    Returns:
+        str: SHA-256 hex digest of the call parameters.
+    """
+    payload = json.dumps(
+        {"model": model_name, "prompt": prompt, "max_tokens": max_tokens, "temperature": temperature},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, sqlite_path: str = None, memory_size: int = 1024, ttl_seconds: float = 86400,
+                 max_entries: int = 100000, enabled_call_types: Iterable[str] = ("intent", "csv_selection", "plot")) -> None:
+        """
+        Initializes a two-tier LLM response cache: an in-process LRU in front of a persistent SQLite table.
+
+        Args:
+            sqlite_path (str, optional): Path of the SQLite database. Only the in-memory tier is used if not set.
+            memory_size (int, optional): Maximum number of entries kept in memory. Default is 1024.
+            ttl_seconds (float, optional): Time after which entries expire. Default is one day.
+            max_entries (int, optional): Maximum number of entries kept in SQLite. Default is 100000.
+            enabled_call_types (Iterable[str], optional): Call types that are cached ("intent", "general",
+                "csv_selection", "plot"). Default is all but "general".
+        """
+        self.sqlite_path: str = sqlite_path
+        self.memory_size: int = memory_size
+        self.ttl_seconds: float = ttl_seconds
+        self.max_entries: int = max_entries
+        # Eviction trims this many entries below max_entries, so the table is only counted every eviction_batch inserts.
+        self.eviction_batch: int = max(1, max_entries // 100)
+        self.sqlite_entries: int = 0
+        self.enabled_call_types: set = set(enabled_call_types)
+        self.memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.connection = None
+        if sqlite_path:
+            if os.path.dirname(sqlite_path):
+                os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
+            self.connection = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, call_type TEXT, value TEXT, created_at REAL, accessed_at REAL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self.sqlite_entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def is_enabled(self, call_type: str) -> bool:
+        """Returns True if responses of the given call type are cached."""
+        return call_type in self.enabled_call_types
+
+    def _count(self, call_type: str, counter: str) -> None:
+        call_stats = self.stats.setdefault(call_type, {"memory_hits": 0, "sqlite_hits": 0, "misses": 0})
+        call_stats[counter] += 1
+
+    def _get_memory(self, key: str) -> str:
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self.memory[key]
+                return None
+            self.memory.move_to_end(key)
+            return value
+
+    def _set_memory(self, key: str, value: str, expires_at: float) -> None:
+        with self.lock:
+            self.memory[key] = (value, expires_at)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def _get_sqlite(self, key: str) -> Tuple[str, float]:
+        if self.connection is None:
+            return None
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl_seconds < now:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0], row[1] + self.ttl_seconds
+
+    def _set_sqlite(self, key: str, call_type: str, value: str) -> None:
+        if self.connection is None:
+            return
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, call_type, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, call_type, value, now, now)
+            )
+            # Approximate: replaced keys and expired deletions are not tracked, the exact count is taken before evicting.
+            self.sqlite_entries += 1
+            if self.sqlite_entries <= self.max_entries:
+                return
+            count = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            excess = count - (self.max_entries - self.eviction_batch)
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+            self.sqlite_entries = count - max(excess, 0)
+
+    def get(self, key: str, call_type: str) -> str:
+        """
+        Looks up a cached response, promoting SQLite hits into the in-memory tier.
+
+        Args:
+            key (str): Key built with `make_cache_key`.
+            call_type (str): Call type used for the enable switch and counters.
+
+        Returns:
+            str: The cached response, or None on a miss or if the call type is not cached.
+        """
+        if not self.is_enabled(call_type):
+            return None
+        value = self._get_memory(key)
+        if value is not None:
+            self._count(call_type, "memory_hits")
+            return value
+        entry = self._get_sqlite(key)
+        if entry is not None:
+            self._set_memory(key, entry[0], entry[1])
+            self._count(call_type, "sqlite_hits")
+            return entry[0]
+        self._count(call_type, "misses")
+        return None
+
+    def set(self, key: str, call_type: str, value: str) -> None:
+        """
+        Stores a response in both tiers.
+
+        Args:
+            key (str): Key built with `make_cache_key`.
+            call_type (str): Call type used for the enable switch.
+            value (str): The LLM response.
+        """
+        if not self.is_enabled(call_type) or value is None:
+            return
+        self._set_memory(key, value, time.time() + self.ttl_seconds)
+        self._set_sqlite(key, call_type, value)
+
+    async def aget(self, key: str, call_type: str) -> str:
+        """
+        Async variant of `get`; the SQLite lookup runs in a worker thread on an in-memory miss.
+        """
+        if not self.is_enabled(call_type):
+            return None
+        value = self._get_memory(key)
+        if value is not None:
+            self._count(call_type, "memory_hits")
+            return value
+        return await asyncio.to_thread(self.get, key, call_type)
+
+    async def aset(self, key: str, call_type: str, value: str) -> None:
+        """
+        Async variant of `set`; the SQLite write runs in a worker thread.
+        """
+        if not self.is_enabled(call_type) or value is None:
+            return
+        await asyncio.to_thread(self.set, key, call_type, value)
+
+    def clear(self) -> None:
+        """Removes all entries from both tiers."""
+        with self.lock:
+            self.memory.clear()
+            if self.connection is not None:
+                self.connection.execute("DELETE FROM responses")
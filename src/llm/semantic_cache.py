@@ -0,0 +1,138 @@
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from src.context.embedders import BaseEmbedder
+from src.context.tokenizer import tokenize
+
+def question_terms(question: str) -> frozenset:
+    """Returns the content terms of a question (stopwords removed), which must match for a cache hit."""
+    return frozenset(tokenize(question))
+
+class SemanticAnswerCache:
+    def __init__(self, embedder: BaseEmbedder, threshold: float = 0.9, max_entries: int = 1024, ttl_seconds: float = 3600.0) -> None:
+        """
+        Initializes an LRU cache of general answers looked up by question similarity.
+        Entries live in scopes (backend, chat session, collection set and corpus version); a lookup only compares
+        the question with prior questions of the same scope, and a scope is dropped as soon as a newer corpus
+        version of the same backend, session and collections is seen, so answers never outlive the data they were built from.
+        Answers depend on the chat history of the session they were generated in, so they are not shared across sessions.
+        Besides reaching the similarity threshold, a hit needs the same content terms as the stored question: hashed
+        embeddings of near-identical wording score high even when an entity or number differs ("north" vs "south",
+        "2023" vs "2024"), and those questions need their own answer.
+
+        Args:
+            embedder (BaseEmbedder): Embeds questions into L2 normalized vectors.
+            threshold (float, optional): Minimum cosine similarity for a hit. Default is 0.9.
+            max_entries (int, optional): Maximum number of cached answers over all scopes. Default is 1024.
+            ttl_seconds (float, optional): Seconds an answer is served after it was stored. Default is one hour.
+        """
+        self.embedder: BaseEmbedder = embedder
+        self.threshold: float = threshold
+        self.max_entries: int = max_entries
+        self.ttl_seconds: float = ttl_seconds
+        # Scope -> question -> (embedding, content terms, answer, expiry time); `lru` orders all entries by last use.
+        self.scopes: Dict[str, Dict[str, Tuple[np.ndarray, frozenset, str, float]]] = {}
+        self.lru: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        # (backend, session, collections) -> scope of the newest corpus version seen, and back.
+        self.current_scopes: Dict[Tuple[str, str, str], str] = {}
+        self.scope_sets: Dict[str, Tuple[str, str, str]] = {}
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def _scope(backend: str, session_id: str, collections_names: List[str], corpus_version: str) -> Tuple[Tuple[str, str, str], str]:
+        """Returns the (backend, session, collections) triple and the scope key that adds the corpus version to it."""
+        collections = ",".join(sorted(set(collections_names)))
+        scope = hashlib.sha1(json.dumps([backend, session_id, collections, corpus_version]).encode("utf-8")).hexdigest()
+        return (backend, session_id, collections), scope
+
+    def _drop(self, scope: str, question: str) -> None:
+        self.scopes[scope].pop(question, None)
+        self.lru.pop((scope, question), None)
+        if not self.scopes[scope]:
+            del self.scopes[scope]
+            # Forget the scope of an idle session too, so sessions do not accumulate.
+            collection_set = self.scope_sets.pop(scope, None)
+            if collection_set is not None and self.current_scopes.get(collection_set) == scope:
+                del self.current_scopes[collection_set]
+
+    def _use_scope(self, collection_set: Tuple[str, str, str], scope: str, storing: bool = False) -> None:
+        """Drops the entries of an older corpus version when a new one is seen. Only scopes holding answers are tracked."""
+        previous = self.current_scopes.get(collection_set)
+        if previous is not None and previous != scope:
+            for question in list(self.scopes.get(previous, ())):
+                self._drop(previous, question)
+        if storing or scope in self.scopes:
+            self.current_scopes[collection_set] = scope
+            self.scope_sets[scope] = collection_set
+
+    def get(self, question: str, backend: str, collections_names: List[str], corpus_version: str, session_id: str = None) -> str:
+        """
+        Returns the answer stored for the most similar prior question of the same scope.
+
+        Args:
+            question (str): The user question.
+            backend (str): Backend generating the answers.
+            collections_names (List[str]): Collections the answer is based on, in any order.
+            corpus_version (str): Version of the collection files, e.g. from `ContextLoader.collections_version`.
+            session_id (str, optional): Chat session the answer is for. Answers are only shared between requests without one.
+
+        Returns:
+            str: The cached answer, or None if no stored question of the scope with the same content terms reaches the threshold.
+        """
+        collection_set, scope_key = self._scope(backend, session_id, collections_names, corpus_version)
+        embedding = self.embedder.embed([question])[0]
+        terms = question_terms(question)
+        now = time.time()
+        with self.lock:
+            self._use_scope(collection_set, scope_key)
+            for stored_question, (_, _, _, expires) in list(self.scopes.get(scope_key, {}).items()):
+                if expires <= now:
+                    self._drop(scope_key, stored_question)
+            entries = self.scopes.get(scope_key, {})
+            questions = [stored_question for stored_question, entry in entries.items() if entry[1] == terms]
+            if questions:
+                similarities = np.stack([entries[q][0] for q in questions]) @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.lru.move_to_end((scope_key, questions[best]))
+                    self.hits += 1
+                    return entries[questions[best]][2]
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: str, backend: str, collections_names: List[str], corpus_version: str, session_id: str = None) -> None:
+        """
+        Stores the answer to a question. Same scope arguments as `get`.
+
+        Args:
+            question (str): The user question.
+            answer (str): The generated answer.
+        """
+        collection_set, scope_key = self._scope(backend, session_id, collections_names, corpus_version)
+        embedding = self.embedder.embed([question])[0]
+        terms = question_terms(question)
+        with self.lock:
+            self._use_scope(collection_set, scope_key, storing=True)
+            self.scopes.setdefault(scope_key, {})[question] = (embedding, terms, answer, time.time() + self.ttl_seconds)
+            self.lru[(scope_key, question)] = None
+            self.lru.move_to_end((scope_key, question))
+            while len(self.lru) > self.max_entries:
+                oldest_scope, oldest_question = next(iter(self.lru))
+                self._drop(oldest_scope, oldest_question)
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters, hit rate and current size."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate, "size": len(self.lru)}
@@ -0,0 +1,45 @@
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, Hashable
+
+class LatencyTracker:
+    def __init__(self, window: int = 500) -> None:
+        """
+        Keeps the most recent latencies per key for percentile estimates.
+
+        Args:
+            window (int, optional): Samples kept per key. Default is 500.
+        """
+        self.window: int = window
+        self.samples: Dict[Hashable, Deque[float]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, key: Hashable, seconds: float) -> None:
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None:
+                samples = self.samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def count(self, key: Hashable) -> int:
+        return len(self.samples.get(key, ()))
+
+    def percentile(self, key: Hashable, q: float, min_samples: int = 1) -> float:
+        """
+        Returns the q-th percentile (nearest rank) of the recent latencies of a key.
+
+        Args:
+            key (Hashable): Series to look at.
+            q (float): Percentile between 0 and 100.
+            min_samples (int, optional): Below this many samples the estimate is not trusted. Default is 1.
+
+        Returns:
+            float: The percentile in seconds, or None if there are fewer than min_samples samples.
+        """
+        with self.lock:
+            values = sorted(self.samples.get(key, ()))
+        if not values or len(values) < min_samples:
+            return None
+        rank = max(math.ceil(q / 100 * len(values)), 1)
+        return values[rank - 1]
@@ -0,0 +1,156 @@
+import math
+import threading
+from typing import Callable, Dict, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# A sample is (metric name suffix, labels, value); a family is (name, type, help, samples).
+Sample = Tuple[str, Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (key + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for key, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    metric_type: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> None:
+        self.name: str = name
+        self.documentation: str = documentation
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.label_names)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def collect(self) -> Family:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> None:
+        """Monotonically increasing value per label set."""
+        super().__init__(name, documentation, label_names)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def collect(self) -> Family:
+        with self.lock:
+            samples = [("", self._labels(key), value) for key, value in self.values.items()]
+        return self.name, self.metric_type, self.documentation, samples
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Distribution of observed values per label set, with cumulative buckets."""
+        super().__init__(name, documentation, label_names)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets)) + (math.inf,)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            # Per-bucket counts followed by the sum and the count of observations.
+            series = self.series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels: str) -> float:
+        series = self.series.get(self._key(labels))
+        return series[-1] if series else 0.0
+
+    def collect(self) -> Family:
+        samples: List[Sample] = []
+        with self.lock:
+            for key, series in self.series.items():
+                labels = self._labels(key)
+                cumulative = 0.0
+                for bound, bucket_count in zip(self.buckets, series):
+                    cumulative += bucket_count
+                    samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+                samples.append(("_sum", labels, series[-2]))
+                samples.append(("_count", labels, series[-1]))
+        return self.name, self.metric_type, self.documentation, samples
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        """
+        Process-wide collection of metrics rendered in the Prometheus text exposition format.
+        Collectors are callables returning metric families computed at scrape time, e.g. from cache statistics.
+        """
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], List[Family]]] = []
+        self.lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def register_collector(self, collector: Callable[[], List[Family]]) -> None:
+        with self.lock:
+            self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        families: List[Family] = [metric.collect() for metric in list(self.metrics.values())]
+        for collector in list(self.collectors):
+            families.extend(collector())
+        lines: List[str] = []
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram("ai_agent_stage_duration_seconds", "Duration of request stages.", ("stage",))
+REQUEST_DURATION = REGISTRY.histogram("ai_agent_request_duration_seconds", "Duration of HTTP requests.", ("endpoint", "intent"))
+REQUESTS_TOTAL = REGISTRY.counter("ai_agent_requests_total", "HTTP requests handled.", ("endpoint", "status"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("ai_agent_requests_in_flight", "HTTP requests currently being handled.", ("endpoint",))
+LLM_CALLS = REGISTRY.counter("ai_agent_llm_calls_total", "LLM API calls (cache hits excluded).", ("backend", "call_type"))
+LLM_TOKENS = REGISTRY.counter("ai_agent_llm_tokens_total", "Prompt and completion tokens reported by the LLM APIs.", ("backend", "call_type", "kind"))
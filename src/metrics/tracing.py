@@ -0,0 +1,111 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Tuple
+from src.metrics.metrics import STAGE_DURATION, LLM_CALLS, LLM_TOKENS
+from src.metrics.latency import LatencyTracker
+
+class RequestTrace:
+    def __init__(self, endpoint: str) -> None:
+        """
+        Collects the stage timings and token usage of one request for its structured log line.
+
+        Args:
+            endpoint (str): Path of the handled endpoint.
+        """
+        self.endpoint: str = endpoint
+        self.start: float = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.tokens: Dict[str, int] = {"prompt": 0, "completion": 0}
+        self.attributes: Dict[str, str] = {}
+        # Stages may finish on worker threads (asyncio.to_thread copies the context, and with it this trace).
+        self.lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.stages.append((stage, seconds))
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with self.lock:
+            self.tokens["prompt"] += prompt_tokens
+            self.tokens["completion"] += completion_tokens
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def to_log_dict(self) -> dict:
+        """Returns the request summary: total time, per-stage breakdown (repeated stages are summed) and tokens."""
+        stages: Dict[str, float] = {}
+        with self.lock:
+            for stage, seconds in self.stages:
+                stages[stage] = stages.get(stage, 0.0) + seconds
+            tokens = dict(self.tokens)
+        return {
+            "event": "request_completed",
+            "endpoint": self.endpoint,
+            **self.attributes,
+            "total_ms": round(self.elapsed() * 1000, 1),
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()},
+            "tokens": tokens,
+        }
+
+current_trace: ContextVar[RequestTrace] = ContextVar("current_trace", default=None)
+
+# Recent API latencies per (backend, call type), e.g. for picking hedging delays. Cache hits are not recorded.
+LLM_LATENCY = LatencyTracker()
+
+class StageTiming:
+    """Duration of a finished span, available after the `with` block."""
+    seconds: float = None
+
+@contextmanager
+def span(stage: str) -> Iterator[StageTiming]:
+    """
+    Times the enclosed block, records it in the stage duration histogram and adds it to the current request trace.
+    Works around `await` too, in which case it measures wall time.
+
+    Args:
+        stage (str): Stage name, e.g. "context.get_context" or "llm.openai.intent".
+
+    Yields:
+        StageTiming: Holds the measured duration once the block is left.
+    """
+    timing = StageTiming()
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing.seconds = seconds = time.perf_counter() - start
+        STAGE_DURATION.observe(seconds, stage=stage)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_stage(stage, seconds)
+
+def record_llm_usage(backend: str, call_type: str, prompt_tokens: int = None, completion_tokens: int = None, seconds: float = None) -> None:
+    """
+    Counts an LLM API call and the tokens it used, if the API reported them, and records its latency.
+
+    Args:
+        backend (str): "openai" or "llama".
+        call_type (str): Kind of call ("intent", "general", "plot", "csv_selection").
+        prompt_tokens (int, optional): Prompt tokens reported by the API.
+        completion_tokens (int, optional): Completion tokens reported by the API.
+        seconds (float, optional): Duration of the API call, added to LLM_LATENCY.
+    """
+    LLM_CALLS.inc(backend=backend, call_type=call_type)
+    if seconds is not None:
+        LLM_LATENCY.record((backend, call_type), seconds)
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    LLM_TOKENS.inc(prompt_tokens, backend=backend, call_type=call_type, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, backend=backend, call_type=call_type, kind="completion")
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_tokens(prompt_tokens, completion_tokens)
+
+def annotate(**attributes: str) -> None:
+    """Adds attributes (e.g. intent, llm_type) to the structured log line of the current request."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
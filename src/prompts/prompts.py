@@ -20,13 +20,14 @@ The columns and their types are as follows:
 
 CONTEXT_PROMPT_PLOT = """
 Solve the following problem:
-Create a plot in Python with matplotlib package and save it as image named img.png at path ./graphs that fulfills this request:
+Create a plot in Python with matplotlib package that fulfills this request:
 {user_question}
 
 While writing the code, please follow these guidelines:
 1. The answer must be without explanations or comments.
 2. Do not import additional libraries.
-3. The table is stored in the variable df.
+3. The table is stored in the variable df. Use the pre-computed aggregates instead of df when the description lists one that fits.
+4. Do not save or show the plot, it is rendered automatically.
 """
 
 SYSTEM_PROMPT_INTENT = """You are an AI assistant specializing in intent classification. Your task is to analyze user input and determine the most appropriate intent category. The possible intent categories are:
@@ -42,6 +43,19 @@ CONTEXT_PROMPT_INTENT = """Input
 Answer: 
 """
 
+SYSTEM_PROMPT_INTENT_BATCH = """You are an AI assistant specializing in intent classification. You receive a numbered list of independent user inputs and classify each of them into the most appropriate intent category. The possible intent categories are:
+1. General Question Answering – The user is asking for factual information or an explanation.
+2. Graph Generation – The user wants to generate a visual representation of data (e.g., bar chart, pie chart, line graph).
+3. Task Creation – The user wants to automate a task using function calling (e.g., scheduling follow-ups, setting alerts).
+
+Your response must be only a JSON array with one number (1, 2, or 3) per input, in the order of the inputs, e.g. [1, 2, 1]. If the intent of an input is ambiguous or uncertain, use 1 for it.
+"""
+
+CONTEXT_PROMPT_INTENT_BATCH = """Inputs
+{question}
+Answer: 
+"""
+
 SYSTEM_PROMPT_CSV_SELECTION = """You are an AI assistant that selects the most relevant CSV file from a given list based on the user's question. Each file has a brief description of its contents.
 Your task is to determine which file is most relevant for answering the question.
 
@@ -1,9 +1,47 @@
 import os
+import re
 import json
+import asyncio
+import sys
+import time
+import threading
+import subprocess
+import urllib.request
 import pytest
+import numpy as np
 import pandas as pd
-from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
 from src.llm.bedrock_llm import BedrockLlamaLLM
+from src.llm.response_cache import ResponseCache, make_cache_key
+from src.llm.prompt_assembler import PromptAssembler, TokenCounter
+from src.llm.client_pool import ClientPool
+from src.llm.hedged_llm import HedgedLLM
+from src.llm.coalescing import LLM_COALESCED_CALLS
+from src.llm.semantic_cache import SemanticAnswerCache
+from src.llm.openai_llm import OpenaiLLM
+from src.metrics.latency import LatencyTracker
+from src.api.services import Services
+from src.api.pipeline import Speculation
+from src.history.chat_history_store import ChatHistoryStore
+from src.graph.dataset_cube import DatasetCube
+from src.graph.dataset_registry import DatasetRegistry
+from src.graph.dataset_selector import DatasetSelector
+from src.graph.graph_generator import GraphGenerator
+from src.graph.plot_code_cache import PlotCodeCache
+from src.graph.plot_renderer import PlotImageCache
+from src.graph.plot_worker_pool import PlotWorkerPool
+from src.intent.intent_classifier import IntentClassifier, load_examples
+from src.api.constants import INTENT_EXAMPLES_PATH
+from src.context.bm25_index import BM25Index, chunk_text
+from src.context.context_loader import ContextLoader
+from src.context.csv_profiler import CsvProfiler, estimate_tokens
+from src.context.corpus_snapshot import CorpusWatcher
+from benchmarks.fake_llm_servers import FakeLLMConfig, FakeLLMServer, PLOT_CODE
+from benchmarks.run_benchmarks import summarize_latencies
+from src.metrics.metrics import MetricsRegistry
+from src.context.embedders import HashingEmbedder
+from src.context.vector_store import VectorStore
 
 @pytest.fixture
 def llm():
@@ -25,3 +63,1069 @@ def test_generate_answer(mock_boto_client, llm):
     }
     response = llm.generate_answer("What is AI?", "general")
     assert response == "Test Answer" 
+
+def test_chunk_text_respects_chunk_size():
+    text = "\n\n".join(" ".join(f"w{p}_{i}" for i in range(30)) for p in range(5))
+    chunks = chunk_text(text, chunk_size=50, chunk_overlap=10)
+    assert all(len(chunk.split()) <= 50 for chunk in chunks)
+    assert " ".join(chunks).split()[0] == "w0_0"
+    assert len(chunks) == 5
+
+def test_bm25_index_ranks_relevant_chunk_first(tmp_path):
+    index = BM25Index([
+        {"source": "a.txt", "text": "Renewal rates fell and expansion revenue decreased."},
+        {"source": "b.txt", "text": "Football is the most popular team sport."},
+        {"source": "c.txt", "text": "Support satisfaction declined and churn increased."},
+    ])
+    results = index.search("Why did churn increase?", top_k=2)
+    assert results[0][1]["source"] == "c.txt"
+    assert len(results) == 1
+
+    index_path = str(tmp_path / "index.json")
+    index.save(index_path)
+    loaded = BM25Index.load(index_path)
+    assert loaded.search("popular sport")[0][1]["source"] == "b.txt"
+
+def test_context_loader_bm25_returns_bounded_context(tmp_path):
+    general_dir = tmp_path / "general"
+    general_dir.mkdir()
+    paragraphs = [f"Paragraph {i} talks about topic{i} in detail." for i in range(50)]
+    (general_dir / "report.txt").write_text("\n\n".join(paragraphs), encoding="utf-8")
+    loader = ContextLoader(str(general_dir), "", "", retrieval_mode="bm25",
+                           index_directory=str(tmp_path / "index"), top_k=2, chunk_size=8, chunk_overlap=0)
+
+    context = loader.get_context(["report"], question="What about topic7?")
+    assert "topic7" in context
+    assert context.count("report.txt") == 2
+    assert (tmp_path / "index" / "bm25" / "report.json").exists()
+
+    full_context = loader.get_context(["report"])
+    assert "topic49" in full_context
+
+def run_concurrently(function, threads=8):
+    barrier = threading.Barrier(threads, timeout=5)
+    errors = []
+
+    def worker():
+        barrier.wait()
+        try:
+            function()
+        except Exception as e:
+            errors.append(e)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return errors
+
+def test_context_loader_builds_bm25_index_once_under_concurrent_requests(tmp_path):
+    general_dir = tmp_path / "general"
+    general_dir.mkdir()
+    (general_dir / "report.txt").write_text("\n\n".join(f"Paragraph about topic{i}." for i in range(200)), encoding="utf-8")
+    loader = ContextLoader(str(general_dir), "", "", retrieval_mode="bm25", index_directory=str(tmp_path / "index"), chunk_size=8)
+
+    with patch("src.context.context_loader.BM25Index.from_files", wraps=BM25Index.from_files) as from_files:
+        assert run_concurrently(lambda: loader.get_context(["report"], question="topic7")) == []
+    assert from_files.call_count == 1
+    assert os.listdir(tmp_path / "index" / "bm25") == ["report.json"]
+
+def test_hashing_embedder_is_normalized_and_deterministic():
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(["sales revenue grew", "sales revenue grew", ""])
+    assert vectors.shape == (3, 64)
+    assert np.allclose(np.linalg.norm(vectors[0]), 1.0)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert not vectors[2].any()
+
+def test_vector_store_batched_search_and_memory_map(tmp_path):
+    source = tmp_path / "notes.txt"
+    source.write_text("Churn increased among enterprise clients.\n\nFootball is popular in England.", encoding="utf-8")
+    embedder = HashingEmbedder(dim=128)
+    store = VectorStore.build(str(tmp_path / "store"), [str(source)], embedder, chunk_size=6, chunk_overlap=0)
+
+    reopened = VectorStore.load(str(tmp_path / "store"))
+    assert isinstance(reopened.embeddings, np.memmap)
+    results = reopened.search(["enterprise churn", "popular football"], embedder, top_k=1)
+    assert "Churn" in results[0][0][1]["text"]
+    assert "Football" in results[1][0][1]["text"]
+    assert not store.is_stale([str(source)], embedder)
+    assert store.is_stale([str(source)], HashingEmbedder(dim=64))
+
+def test_context_loader_vector_mode(tmp_path):
+    general_dir = tmp_path / "general"
+    general_dir.mkdir()
+    (general_dir / "report.txt").write_text("Revenue dropped in the north.\n\nOnboarding adoption slowed.", encoding="utf-8")
+    loader = ContextLoader(str(general_dir), "", "", retrieval_mode="vector", index_directory=str(tmp_path / "index"),
+                           top_k=1, chunk_size=5, chunk_overlap=0, embedder=HashingEmbedder(dim=128))
+    context = loader.get_context(["report"], question="Why did onboarding adoption slow?")
+    assert "Onboarding" in context and "Revenue" not in context
+    assert (tmp_path / "index" / "vector" / "report" / "metadata.json").exists()
+
+def test_context_loader_builds_vector_store_once_under_concurrent_requests(tmp_path):
+    general_dir = tmp_path / "general"
+    general_dir.mkdir()
+    (general_dir / "report.txt").write_text("\n\n".join(f"Paragraph about topic{i}." for i in range(200)), encoding="utf-8")
+    loader = ContextLoader(str(general_dir), "", "", retrieval_mode="vector", index_directory=str(tmp_path / "index"),
+                           chunk_size=8, embedder=HashingEmbedder(dim=64))
+
+    with patch("src.context.context_loader.VectorStore.build", wraps=VectorStore.build) as build:
+        assert run_concurrently(lambda: loader.get_context(["report"], question="topic7")) == []
+    assert build.call_count == 1
+    files = os.listdir(tmp_path / "index" / "vector" / "report")
+    assert len(files) == 2 and "metadata.json" in files
+
+def test_agenerate_answer_runs_bedrock_calls_concurrently(llm):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def invoke_model(modelId, body):
+        barrier.wait()
+        return {"body": MagicMock(read=lambda: json.dumps({"generation": "2"}))}
+
+    llm.client.invoke_model = invoke_model
+
+    async def run():
+        # Distinct questions, since identical concurrent prompts share one call.
+        return await asyncio.gather(*[llm.agenerate_answer(f"Plot sales {i}", "intent") for i in range(3)])
+
+    assert asyncio.run(run()) == ["2", "2", "2"]
+
+def test_agenerate_answer_saves_history(llm, tmp_path):
+    llm.history_store = ChatHistoryStore(str(tmp_path / "history.sqlite3"))
+    answer = asyncio.run(llm.agenerate_answer("What is AI?", "general", context="AI context", session_id="s1"))
+    assert answer == "Test Answer"
+    assert llm.load_chat_history("s1")[-1] == {"role": "assistant", "content": "Test Answer"}
+    assert llm.load_chat_history("s2") == []
+
+def test_response_cache_tiers_and_counters(tmp_path):
+    sqlite_path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(sqlite_path=sqlite_path, memory_size=1)
+    key = make_cache_key("model", [{"role": "user", "content": "hi"}], 100, 0.1)
+    assert key != make_cache_key("model", [{"role": "user", "content": "hi"}], 200, 0.1)
+
+    assert cache.get(key, "intent") is None
+    cache.set(key, "intent", "1")
+    assert cache.get(key, "intent") == "1"
+    cache.set(make_cache_key("model", "other"), "intent", "2")
+    assert cache.get(key, "intent") == "1"
+    assert cache.stats["intent"] == {"memory_hits": 1, "sqlite_hits": 1, "misses": 1}
+
+    reopened = ResponseCache(sqlite_path=sqlite_path)
+    assert reopened.get(key, "intent") == "1"
+
+    cache.set(key, "general", "answer")
+    assert cache.get(key, "general") is None
+
+def test_response_cache_ttl_and_size_eviction(tmp_path):
+    cache = ResponseCache(sqlite_path=str(tmp_path / "cache.sqlite3"), ttl_seconds=-1)
+    cache.set("expired", "intent", "1")
+    assert cache.get("expired", "intent") is None
+
+    cache = ResponseCache(sqlite_path=str(tmp_path / "sized.sqlite3"), memory_size=0, max_entries=2)
+    for i in range(3):
+        cache.set(f"key{i}", "intent", str(i))
+    assert cache.get("key0", "intent") is None
+    assert cache.get("key2", "intent") == "2"
+
+def test_response_cache_counts_entries_only_when_evicting(tmp_path):
+    cache = ResponseCache(sqlite_path=str(tmp_path / "cache.sqlite3"), memory_size=0, max_entries=200)
+    statements = []
+    cache.connection.set_trace_callback(statements.append)
+    for i in range(1000):
+        cache.set(f"key{i}", "intent", str(i))
+    assert sum("COUNT(*)" in statement for statement in statements) <= 1000 // cache.eviction_batch
+    assert cache.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0] <= 200
+    assert cache.get("key999", "intent") == "999" and cache.get("key0", "intent") is None
+
+def test_bedrock_intent_served_from_cache(tmp_path):
+    with patch("boto3.client") as mock_client:
+        mock_client.return_value.invoke_model.return_value = {
+            "body": MagicMock(read=lambda: json.dumps({"generation": "1"}))
+        }
+        llm = BedrockLlamaLLM(response_cache=ResponseCache())
+        assert llm.generate_answer("What are sales?", "intent") == "1"
+        assert asyncio.run(llm.agenerate_answer("What are sales?", "intent")) == "1"
+        assert mock_client.return_value.invoke_model.call_count == 1
+
+def test_intent_classifier_predicts_and_persists(tmp_path):
+    texts, labels = load_examples(INTENT_EXAMPLES_PATH)
+    model_path = str(tmp_path / "intent_model.npz")
+    classifier = IntentClassifier.load_or_train(INTENT_EXAMPLES_PATH, model_path)
+
+    assert classifier.predict("Create a bar chart of revenue by region")[0] == "2"
+    assert classifier.predict("Schedule a follow-up call with the top prospects")[0] == "3"
+    assert classifier.predict("What are the sales trends?")[0] == "1"
+    assert classifier.predict("qwerty zxcv")[1] == 0.0
+
+    reloaded = IntentClassifier.load(model_path)
+    assert reloaded.predict(texts[0]) == classifier.predict(texts[0])
+    assert IntentClassifier.load_or_train(INTENT_EXAMPLES_PATH, model_path).examples_signature == classifier.examples_signature
+
+def test_intent_classifier_retrains_over_a_corrupt_model(tmp_path):
+    model_path = tmp_path / "intent_model.npz"
+    IntentClassifier.load_or_train(INTENT_EXAMPLES_PATH, str(model_path))
+    model_path.write_bytes(model_path.read_bytes()[:100])
+
+    assert IntentClassifier.load(str(model_path)) is None
+    classifier = IntentClassifier.load_or_train(INTENT_EXAMPLES_PATH, str(model_path))
+    assert classifier.predict("Create a bar chart of revenue by region")[0] == "2"
+    assert IntentClassifier.load(str(model_path)) is not None
+    assert run_concurrently(lambda: classifier.save(str(model_path))) == []
+    assert os.listdir(tmp_path) == ["intent_model.npz"]
+
+def test_chat_history_store_tail_is_session_scoped(tmp_path):
+    store = ChatHistoryStore(str(tmp_path / "history.sqlite3"))
+    for i in range(20):
+        store.append("openai", "a", [{"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"}])
+    store.append("openai", "b", [{"role": "user", "content": "other"}])
+    store.append("llama", "a", [{"role": "user", "content": "llama"}])
+
+    tail = store.tail("openai", "a", limit=4)
+    assert [message["content"] for message in tail] == ["q18", "a18", "q19", "a19"]
+    assert store.tail("openai", "b") == [{"role": "user", "content": "other"}]
+
+def test_chat_history_store_imports_legacy_json_once(tmp_path):
+    legacy = tmp_path / "openai.json"
+    legacy.write_text(json.dumps([{"role": "user", "content": "old"}, {"role": "assistant", "content": "answer"}]), encoding="utf-8")
+    store = ChatHistoryStore(str(tmp_path / "history.sqlite3"))
+    store.import_json_history("openai", str(legacy))
+    store.import_json_history("openai", str(legacy))
+    assert len(store.tail("openai", "default", limit=100)) == 2
+
+@pytest.fixture
+def app_module(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    with patch("boto3.client"):
+        import app
+    # Answers cached by earlier tests would skip the LLM call.
+    app.services.instances.pop("semantic_answer_cache", None)
+    return app
+
+def bedrock_stream(*tokens):
+    return {"body": [{"chunk": {"bytes": json.dumps({"generation": token}).encode("utf-8")}} for token in tokens]}
+
+def test_bedrock_astream_answer_yields_tokens_and_saves_history(llm, tmp_path):
+    llm.history_store = ChatHistoryStore(str(tmp_path / "history.sqlite3"))
+    llm.client.invoke_model_with_response_stream = MagicMock(return_value=bedrock_stream("Hel", "lo"))
+
+    async def collect():
+        return [token async for token in llm.astream_answer("Hi?", context="ctx", session_id="s")]
+
+    assert asyncio.run(collect()) == ["Hel", "lo"]
+    assert llm.load_chat_history("s")[-1] == {"role": "assistant", "content": "Hello"}
+
+class EndlessBedrockStream:
+    def __init__(self):
+        self.chunks_read = 0
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        while not self.closed.is_set():
+            self.chunks_read += 1
+            time.sleep(0.01)
+            yield {"chunk": {"bytes": json.dumps({"generation": "token "}).encode("utf-8")}}
+
+    def close(self):
+        self.closed.set()
+
+def test_bedrock_astream_answer_stops_reading_when_consumer_leaves(llm, tmp_path):
+    llm.history_store = ChatHistoryStore(str(tmp_path / "history.sqlite3"))
+    body = EndlessBedrockStream()
+    llm.client.invoke_model_with_response_stream = MagicMock(return_value={"body": body})
+
+    async def read_first_token():
+        stream = llm.astream_answer("Hi?", session_id="s")
+        token = await stream.__anext__()
+        await stream.aclose()
+        return token
+
+    assert asyncio.run(read_first_token()) == "token "
+    assert body.closed.wait(timeout=5)
+    chunks_read = body.chunks_read
+    time.sleep(0.05)
+    assert body.chunks_read == chunks_read < 10
+    assert llm.load_chat_history("s") == []
+
+class EndlessOpenaiStream:
+    def __init__(self):
+        self.chunks_read = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self.chunks_read += 1
+        delta = MagicMock(content="token ")
+        return MagicMock(usage=None, choices=[MagicMock(delta=delta)])
+
+    async def close(self):
+        self.closed = True
+
+def test_openai_astream_answer_closes_stream_when_consumer_leaves(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    openai_llm = OpenaiLLM(history_store=ChatHistoryStore(str(tmp_path / "history.sqlite3")), client_pool=ClientPool())
+    stream = EndlessOpenaiStream()
+    monkeypatch.setattr(openai_llm.async_client.chat.completions, "create", AsyncMock(return_value=stream))
+
+    async def read_first_token():
+        answer = openai_llm.astream_answer("Hi?", session_id="s")
+        token = await answer.__anext__()
+        await answer.aclose()
+        return token
+
+    assert asyncio.run(read_first_token()) == "token "
+    assert stream.closed and stream.chunks_read == 1
+    assert openai_llm.load_chat_history("s") == []
+
+def test_general_answering_stream_endpoint_emits_sse(app_module, tmp_path, monkeypatch):
+    llm = app_module.bedrock_llama_llm
+    monkeypatch.setattr(llm, "history_store", ChatHistoryStore(str(tmp_path / "history.sqlite3")))
+    monkeypatch.setattr(llm.client, "invoke_model_with_response_stream", MagicMock(return_value=bedrock_stream("Sales ", "grew.")))
+    monkeypatch.setattr(app_module.intent_classifier, "predict", lambda question: ("1", 1.0))
+
+    client = TestClient(app_module.app)
+    response = client.post("/general_answering/stream", json={"question": "What are sales?", "collections_names": ["sales"], "llm_type": "llama"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in response.text.split("\n\n") if block]
+    assert events[0] == 'event: token\ndata: {"token": "Sales "}'
+    done = json.loads(events[-1].split("data: ", 1)[1])
+    assert done["answer"] == "Sales grew."
+    assert done["time_to_first_token_ms"] <= done["total_time_ms"]
+
+def write_dataset(directory, rows):
+    csv_file = directory / "sales.csv"
+    description_file = directory / "sales_csv_description.txt"
+    pd.DataFrame(rows).to_csv(csv_file, index=False)
+    description_file.write_text("Sales data", encoding="utf-8")
+    return str(csv_file), str(description_file)
+
+def test_dataset_registry_reuses_and_invalidates_on_change(tmp_path):
+    csv_file, description_file = write_dataset(tmp_path, {"region": ["North", "South"], "revenue": [1, 2]})
+    registry = DatasetRegistry()
+    first = registry.get(csv_file, description_file)
+    assert registry.get(csv_file, description_file) is first
+
+    write_dataset(tmp_path, {"region": ["North", "South", "East"], "revenue": [1, 2, 3]})
+    os.utime(csv_file, ns=(first.signature[0] + 10**9, first.signature[0] + 10**9))
+    second = registry.get(csv_file, description_file)
+    assert second is not first and len(second.df) == 3
+    assert second.version != first.version
+
+def test_graph_generator_reuses_llm_and_registry(tmp_path):
+    csv_file, description_file = write_dataset(tmp_path, {"region": ["North", "South"], "revenue": [1, 2]})
+    registry = DatasetRegistry()
+    llm = MagicMock()
+    llm.generate_plot_creation_code.return_value = "```python\ndf['revenue'] = 0\nplt.bar(df['region'], df['revenue'])\n```"
+
+    generator = GraphGenerator(csv_file, description_file, llm=llm, dataset_registry=registry)
+    assert generator.llm is llm
+    assert generator.df_description == "Sales data"
+    assert generator.generate_plot("Plot revenue") == "Plot generated successfully."
+    assert GraphGenerator(csv_file, description_file, llm=llm, dataset_registry=registry).df is generator.df
+    assert generator.df["revenue"].tolist() == [1, 2]
+
+def test_plot_code_cache_skips_llm_and_tracks_schema(tmp_path):
+    csv_file, description_file = write_dataset(tmp_path, {"region": ["North", "South"], "revenue": [1, 2]})
+    registry = DatasetRegistry()
+    cache = PlotCodeCache()
+    llm = MagicMock()
+    llm.generate_plot_creation_code.return_value = "plt.bar(df['region'], df['revenue'])"
+
+    generator = GraphGenerator(csv_file, description_file, llm=llm, dataset_registry=registry, plot_code_cache=cache)
+    assert generator.generate_plot("Plot revenue by region") == "Plot generated successfully."
+    assert generator.generate_plot("  plot revenue   by region? ") == "Plot generated successfully."
+    assert llm.generate_plot_creation_code.call_count == 1
+    assert cache.stats()["hits"] == 1 and cache.hit_rate == 0.5
+
+    write_dataset(tmp_path, {"region": ["North"], "revenue": [1.5]})
+    os.utime(csv_file, ns=(generator.dataset.signature[0] + 10**9,) * 2)
+    GraphGenerator(csv_file, description_file, llm=llm, dataset_registry=registry, plot_code_cache=cache).generate_plot("Plot revenue by region")
+    assert llm.generate_plot_creation_code.call_count == 2
+
+def test_plot_code_cache_does_not_store_failing_code(tmp_path):
+    csv_file, description_file = write_dataset(tmp_path, {"region": ["North"], "revenue": [1]})
+    cache = PlotCodeCache()
+    llm = MagicMock()
+    llm.generate_plot_creation_code.return_value = "df['missing']"
+    generator = GraphGenerator(csv_file, description_file, llm=llm, plot_code_cache=cache)
+    assert generator.generate_plot("Plot missing").startswith("Error generating plot")
+    assert cache.stats()["size"] == 0
+
+def test_render_plot_in_memory_with_image_cache(tmp_path):
+    csv_file, description_file = write_dataset(tmp_path, {"region": ["North", "South"], "revenue": [1, 2]})
+    image_cache = PlotImageCache()
+    llm = MagicMock()
+    llm.generate_plot_creation_code.return_value = "plt.bar(df['region'], df['revenue'])\nplt.savefig('./graphs/img.png')"
+    generator = GraphGenerator(csv_file, description_file, llm=llm, image_cache=image_cache)
+
+    first = generator.render_plot("Plot revenue")
+    assert first.content.startswith(b"\x89PNG") and first.media_type == "image/png" and not first.cached
+    second = generator.render_plot("Plot revenue")
+    assert second.cached and second.content == first.content and second.plot_id != first.plot_id
+    svg = generator.render_plot("Plot revenue", image_format="svg")
+    assert svg.media_type == "image/svg+xml" and b"<svg" in svg.content
+    assert image_cache.stats()["hits"] == 1
+
+def test_render_plot_requires_a_figure(tmp_path):
+    csv_file, description_file = write_dataset(tmp_path, {"region": ["North"], "revenue": [1]})
+    llm = MagicMock()
+    llm.generate_plot_creation_code.return_value = "total = df['revenue'].sum()"
+    generator = GraphGenerator(csv_file, description_file, llm=llm)
+    assert generator.generate_plot("Sum revenue") == "Error generating plot: Generated code did not create a figure."
+
+def test_plot_image_cache_is_bounded_by_bytes():
+    cache = PlotImageCache(max_entries=10, max_bytes=10)
+    cache.put(("a", "v1", "png"), b"123456")
+    cache.put(("b", "v1", "png"), b"123456")
+    assert cache.get(("a", "v1", "png")) is None
+    assert cache.get(("b", "v1", "png")) == b"123456"
+    assert cache.stats()["bytes"] == 6
+
+@pytest.fixture
+def create_ida_module(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    import create_ida
+    return create_ida
+
+def test_create_ida_skips_unchanged_and_resumes(create_ida_module, tmp_path, monkeypatch):
+    input_folder, output_folder = tmp_path / "input", tmp_path / "output"
+    input_folder.mkdir()
+    (input_folder / "sales.txt").write_text("Sales grew.")
+    (input_folder / "team.txt").write_text("Team hired.")
+    extracted = []
+    def fake_extract(content):
+        extracted.append(content)
+        return None if content == "Team hired." else f"IDA: {content}"
+    monkeypatch.setattr(create_ida_module, "extract_data", fake_extract)
+
+    create_ida_module.process_files(str(input_folder), str(output_folder), max_workers=2)
+    assert (output_folder / "sales_txt_ida.txt").read_text() == "IDA: Sales grew."
+    assert not (output_folder / "team_txt_ida.txt").exists()
+
+    # Only the file that failed is retried; the finished one is skipped thanks to the manifest.
+    extracted.clear()
+    monkeypatch.setattr(create_ida_module, "extract_data", lambda content: f"IDA: {content}")
+    create_ida_module.process_files(str(input_folder), str(output_folder), max_workers=2)
+    assert (output_folder / "team_txt_ida.txt").read_text() == "IDA: Team hired."
+    manifest = json.loads((output_folder / ".ida_manifest.json").read_text())
+    assert set(manifest) == {"sales.txt", "team.txt"}
+
+    (input_folder / "sales.txt").write_text("Sales dropped.")
+    monkeypatch.setattr(create_ida_module, "extract_data", fake_extract)
+    create_ida_module.process_files(str(input_folder), str(output_folder))
+    assert extracted == ["Sales dropped."]
+    assert (output_folder / "sales_txt_ida.txt").read_text() == "IDA: Sales dropped."
+
+def test_create_ida_writes_survive_concurrent_writers_and_failures(create_ida_module, tmp_path):
+    path = str(tmp_path / "sales_txt_ida.txt")
+    assert run_concurrently(lambda: create_ida_module.write_atomically(path, "IDA: " + "x" * 100000)) == []
+    assert (tmp_path / "sales_txt_ida.txt").read_text() == "IDA: " + "x" * 100000
+
+    with pytest.raises(TypeError):
+        create_ida_module.write_atomically(path, None)
+    assert os.listdir(tmp_path) == ["sales_txt_ida.txt"]
+
+def test_create_ida_prunes_outputs_of_removed_and_legacy_inputs(create_ida_module, tmp_path, monkeypatch):
+    input_folder, output_folder = tmp_path / "input", tmp_path / "output"
+    input_folder.mkdir()
+    output_folder.mkdir()
+    (input_folder / "sales.txt").write_text("Sales grew.")
+    (input_folder / "team.txt").write_text("Team hired.")
+    for legacy in ("sales_ida_0.txt", "team_ida_1.txt", "company_ida_2.txt"):
+        (output_folder / legacy).write_text("old")
+    results = {"Sales grew.": "IDA sales", "Team hired.": None}
+    monkeypatch.setattr(create_ida_module, "extract_data", lambda content: results[content])
+
+    create_ida_module.process_files(str(input_folder), str(output_folder))
+    # The legacy output of team.txt stays until its replacement exists; the one of the deleted company.txt goes.
+    assert sorted(os.listdir(output_folder)) == [".ida_manifest.json", "sales_txt_ida.txt", "team_ida_1.txt"]
+
+    (input_folder / "sales.txt").unlink()
+    results["Team hired."] = "IDA team"
+    create_ida_module.process_files(str(input_folder), str(output_folder))
+    assert sorted(os.listdir(output_folder)) == [".ida_manifest.json", "team_txt_ida.txt"]
+    assert set(json.loads((output_folder / ".ida_manifest.json").read_text())) == {"team.txt"}
+
+def test_create_ida_output_names_are_stable_per_source(create_ida_module):
+    assert create_ida_module.output_filename_for("sales.txt") == "sales_txt_ida.txt"
+    assert create_ida_module.output_filename_for("sales.csv") == "sales_csv_ida.txt"
+
+def test_create_ida_text_windows_overlap_and_cover_file(create_ida_module, tmp_path):
+    text = " ".join(f"word{i}" for i in range(500))
+    path = tmp_path / "long.txt"
+    path.write_text(text)
+    windows = list(create_ida_module.iter_text_windows(str(path), window_chars=200, overlap=20))
+    assert all(len(window) <= 200 for window in windows)
+    assert windows[0].startswith("word0 ") and windows[-1].endswith("word499")
+    assert {word for window in windows for word in window.split()} >= set(text.split())
+
+def test_create_ida_chunked_csv_merges_and_dedups(create_ida_module, tmp_path, monkeypatch):
+    input_folder, output_folder = tmp_path / "input", tmp_path / "output"
+    input_folder.mkdir()
+    pd.DataFrame({"rep": [f"rep{i}" for i in range(10)], "revenue": range(10)}).to_csv(input_folder / "sales.csv", index=False)
+    monkeypatch.setattr(create_ida_module, "CSV_CHUNK_ROWS", 3)
+    def fake_extract(content):
+        first_rep = re.search(r"rep\d+", content).group(0)
+        return ("**Insights:**\n- Revenue grows steadily.\n- First rep in chunk is " + first_rep +
+                "\n\n**Direction:**\n- Keep growing.\n\n**Action:**\n1. Review reps.")
+    monkeypatch.setattr(create_ida_module, "extract_data", fake_extract)
+
+    create_ida_module.process_files(str(input_folder), str(output_folder), chunked=True)
+    result = (output_folder / "sales_csv_ida.txt").read_text()
+    sections = create_ida_module.parse_ida_sections(result)
+    assert sections["Insights"][0] == "- Revenue grows steadily."
+    assert [item.split()[-1] for item in sections["Insights"][1:]] == ["rep0", "rep3", "rep6", "rep9"]
+    assert sections["Direction"] == ["- Keep growing."] and sections["Action"] == ["1. Review reps."]
+
+def test_csv_profile_is_budgeted_and_cached_per_version(tmp_path):
+    csv_path = tmp_path / "orders.csv"
+    rows = 5000
+    pd.DataFrame({
+        "date": pd.date_range("2024-01-01", periods=rows, freq="h").strftime("%Y-%m-%d %H:%M"),
+        "region": np.array(["North", "South", "East"])[np.arange(rows) % 3],
+        "revenue": np.arange(rows, dtype=float),
+    }).to_csv(csv_path, index=False)
+    profiler = CsvProfiler(max_tokens=300, cache_directory=str(tmp_path / "profiles"))
+    profile = profiler.profile(str(csv_path))
+    assert estimate_tokens(profile) <= 300
+    assert "Rows: 5,000" in profile and "North (1667)" in profile and "Time series over date" in profile
+
+    with patch("src.context.csv_profiler.pd.read_csv") as read_csv:
+        assert profiler.profile(str(csv_path)) == profile
+        assert CsvProfiler(max_tokens=300, cache_directory=str(tmp_path / "profiles")).profile(str(csv_path)) == profile
+        read_csv.assert_not_called()
+    pd.DataFrame({"region": ["West"], "revenue": [1.0]}).to_csv(csv_path, index=False)
+    assert "Rows: 1" in profiler.profile(str(csv_path))
+
+def test_csv_profile_cache_survives_concurrent_writers(tmp_path):
+    csv_path = tmp_path / "orders.csv"
+    pd.DataFrame({"region": ["North", "South"] * 500, "revenue": np.arange(1000, dtype=float)}).to_csv(csv_path, index=False)
+    profile = lambda: CsvProfiler(cache_directory=str(tmp_path / "profiles")).profile(str(csv_path))
+    assert run_concurrently(profile) == []
+    assert [name for name in os.listdir(tmp_path / "profiles") if name.endswith(".tmp")] == []
+    assert "Rows: 1,000" in profile()
+
+def test_context_loader_uses_profile_for_csv_collections(tmp_path):
+    (tmp_path / "notes.txt").write_text("Revenue grew in the north region.")
+    pd.DataFrame({"region": ["North", "South"] * 50, "revenue": np.arange(100) % 7 * 10.0}).to_csv(tmp_path / "orders.csv", index=False)
+    loader = ContextLoader(str(tmp_path), str(tmp_path), str(tmp_path), retrieval_mode="bm25")
+    context = loader.get_context(["orders", "notes"], question="north revenue")
+    assert context.startswith("orders.csv\n\nRows: 100")
+    assert "Grouped by region" in context and "Revenue grew in the north region." in context
+
+def test_prompt_assembler_keeps_question_and_fits_budget():
+    counter = TokenCounter()
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * 40} for i in range(10)]
+    context = "fact " * 5000
+    assembler = PromptAssembler(max_prompt_tokens=600, history_share=0.25, token_counter=counter)
+    prompt = assembler.assemble("System.", "Context:\n{context}\nQuestion: {question}", "What grew?", context=context, chat_history=history)
+    messages = prompt.to_chat_messages()
+    assert prompt.tokens <= 600
+    assert messages[0] == {"role": "system", "content": "System."}
+    assert messages[-1]["content"].endswith("Question: What grew?") and "[...]" in messages[-1]["content"]
+    # The newest turns are kept, in chronological order.
+    assert messages[1:-1] == history[-len(messages[1:-1]):] and len(messages) > 2
+
+    small = assembler.assemble("System.", "Context:\n{context}\nQuestion: {question}", "What grew?", context="Sales grew.", chat_history=history)
+    assert "Sales grew." in small.user and "[...]" not in small.user
+
+def test_bedrock_prompt_emits_each_history_turn_once(llm):
+    history = [{"role": "user", "content": "Hi there"}, {"role": "assistant", "content": "Hello friend"}]
+    prompt = llm._build_answer_prompt("How are sales?", "general", "Sales grew.", history)
+    assert prompt.count("Hi there") == 1 and prompt.count("Hello friend") == 1
+    assert prompt.startswith("<|begin_of_text|><|start_header_id|>system<|end_header_id|>")
+    assert prompt.endswith("<|start_header_id|>assistant<|end_header_id|>\n\n")
+    assert prompt.index("Hello friend") < prompt.index("How are sales?")
+
+def test_corpus_watcher_reloads_only_changed_files(tmp_path):
+    (tmp_path / "a.txt").write_text("alpha")
+    (tmp_path / "b.txt").write_text("beta")
+    watcher = CorpusWatcher([str(tmp_path)])
+    first = watcher.snapshot()
+    assert first.listdir(str(tmp_path)) == ["a.txt", "b.txt"]
+    assert watcher.snapshot() is first
+
+    (tmp_path / "b.txt").write_text("beta two")
+    (tmp_path / "c.txt").write_text("gamma")
+    real_open = open
+    opened = []
+    with patch("builtins.open", side_effect=lambda path, *args, **kwargs: opened.append(path) or real_open(path, *args, **kwargs)):
+        second = watcher.snapshot()
+    assert sorted(os.path.basename(path) for path in opened) == ["b.txt", "c.txt"]
+    assert second.version == first.version + 1
+    # Snapshots already handed out keep their view.
+    assert first.read(f"{tmp_path}/b.txt") == "beta" and second.read(f"{tmp_path}/b.txt") == "beta two"
+    assert not first.exists(f"{tmp_path}/c.txt")
+
+def test_context_loader_hot_path_does_no_file_syscalls(tmp_path):
+    (tmp_path / "sales.txt").write_text("Sales grew in the north.")
+    pd.DataFrame({"region": ["North", "South"] * 10, "revenue": np.arange(20) % 3 * 1.5}).to_csv(tmp_path / "orders.csv", index=False)
+    watcher = CorpusWatcher([str(tmp_path)], poll_interval=60)
+    watcher.start()
+    try:
+        loader = ContextLoader(str(tmp_path), str(tmp_path), str(tmp_path), retrieval_mode="bm25", corpus_watcher=watcher)
+        expected = loader.get_context(["sales", "orders"], question="north sales")
+        full = loader.get_context(["sales"])
+        with patch("builtins.open", side_effect=AssertionError("open")), patch("os.stat", side_effect=AssertionError("stat")), \
+             patch("os.scandir", side_effect=AssertionError("scandir")), patch("os.listdir", side_effect=AssertionError("listdir")):
+            assert loader.get_context(["sales", "orders"], question="north sales") == expected
+            assert loader.get_context(["sales"]) == full
+            assert "sales.txt" in loader.get_graph_context()
+    finally:
+        watcher.stop()
+
+def test_summarize_latencies_percentiles():
+    summary = summarize_latencies([i / 1000 for i in range(1, 101)])
+    assert summary["count"] == 100
+    assert summary["p50_ms"] == pytest.approx(50.5) and summary["p99_ms"] == pytest.approx(99.01)
+    assert summarize_latencies([]) == {"count": 0}
+
+def test_fake_llm_server_speaks_openai_and_bedrock(llm):
+    server = FakeLLMServer(FakeLLMConfig(latency_ms=0, jitter_ms=0, response_words=5)).start()
+    try:
+        from openai import OpenAI
+        client = OpenAI(api_key="fake", base_url=server.url + "/v1")
+        completion = client.chat.completions.create(model="gpt-4o-mini", messages=[
+            {"role": "system", "content": "You are an AI assistant specializing in intent classification."},
+            {"role": "user", "content": "Plot revenue per region"}])
+        assert completion.choices[0].message.content == "2"
+
+        prompt = llm._build_answer_prompt("How are sales?", "general", "Sales grew.", [])
+        request = urllib.request.Request(server.url + "/model/meta.llama3-8b-instruct-v1:0/invoke",
+                                         data=json.dumps({"prompt": prompt}).encode("utf-8"), method="POST")
+        with urllib.request.urlopen(request) as response:
+            assert len(json.loads(response.read())["generation"].split()) == 5
+    finally:
+        server.stop()
+
+def test_metrics_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "Calls.", ("kind",)).inc(2, kind='say "hi"')
+    histogram = registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 3.0):
+        histogram.observe(value, stage="llm")
+    registry.register_collector(lambda: [("cache_entries", "gauge", "Entries.", [("", {}, 7)])])
+
+    lines = registry.render().splitlines()
+    assert "# TYPE calls_total counter" in lines
+    assert 'calls_total{kind="say \\"hi\\""} 2' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="llm"} 3' in lines
+    assert "cache_entries 7" in lines
+
+def test_metrics_endpoint_reports_stages_and_tokens(app_module, tmp_path, monkeypatch):
+    llm = app_module.bedrock_llama_llm
+    monkeypatch.setattr(llm, "history_store", ChatHistoryStore(str(tmp_path / "history.sqlite3")))
+    monkeypatch.setattr(llm.client, "invoke_model", MagicMock(return_value={"body": MagicMock(
+        read=lambda: json.dumps({"generation": "Sales grew.", "prompt_token_count": 40, "generation_token_count": 3}))}))
+    monkeypatch.setattr(app_module.intent_classifier, "predict", lambda question: ("1", 1.0))
+
+    client = TestClient(app_module.app)
+    response = client.post("/general_answering", json={"question": "What are sales?", "collections_names": ["sales"], "llm_type": "llama"})
+    assert response.status_code == 200
+
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain")
+    text = metrics.text
+    assert 'ai_agent_stage_duration_seconds_count{stage="context.get_context"}' in text
+    assert 'ai_agent_requests_total{endpoint="/general_answering",status="200"}' in text
+    assert 'ai_agent_requests_in_flight{endpoint="/general_answering"} 0' in text
+    assert re.search(r'ai_agent_llm_tokens_total\{backend="llama",call_type="general",kind="prompt"\} [1-9]', text)
+    assert "# TYPE ai_agent_cache_lookups_total counter" in text
+
+def test_client_pool_shares_one_client_per_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    pool = ClientPool(max_connections=8)
+    store = ChatHistoryStore(str(tmp_path / "history.sqlite3"))
+    first, second = OpenaiLLM(history_store=store, client_pool=pool), OpenaiLLM(model_name="gpt-4o", history_store=store, client_pool=pool)
+    assert first.client is second.client and first.async_client is second.async_client
+    assert pool.openai(base_url="http://localhost:1/v1") is not first.client
+    with patch("boto3.client") as boto_client:
+        assert pool.bedrock_runtime() is pool.bedrock_runtime(max_pool_connections=4)
+    assert boto_client.call_count == 1
+    assert boto_client.call_args.kwargs["config"].max_pool_connections == 8
+
+class DelayedSelector:
+    def __init__(self, backend, delay, answer):
+        self.backend, self.delay, self.answer, self.calls = backend, delay, answer, 0
+
+    async def aselect_relevant_csv_file(self, file_descriptions, user_question):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.answer
+
+def test_hedged_llm_fires_secondary_after_p95_delay():
+    tracker = LatencyTracker()
+    for _ in range(20):
+        tracker.record(("openai", "csv_selection"), 0.02)
+    assert tracker.percentile(("openai", "csv_selection"), 95) == 0.02
+
+    slow_primary, secondary = DelayedSelector("openai", 1.0, "primary.txt"), DelayedSelector("llama", 0.0, "secondary.txt")
+    hedged = HedgedLLM(slow_primary, secondary, min_delay=0.01, min_samples=20, latency_tracker=tracker)
+    assert hedged.hedge_delay("csv_selection") == 0.02
+    assert asyncio.run(hedged.aselect_relevant_csv_file([], "q")) == "secondary.txt"
+    # The cancelled primary's elapsed time is kept as a latency sample.
+    assert tracker.count(("openai", "csv_selection")) == 21
+
+    fast_primary, unused = DelayedSelector("openai", 0.0, "primary.txt"), DelayedSelector("llama", 0.0, "secondary.txt")
+    hedged = HedgedLLM(fast_primary, unused, latency_tracker=tracker)
+    assert asyncio.run(hedged.aselect_relevant_csv_file([], "q")) == "primary.txt"
+    assert unused.calls == 0
+
+def test_hedged_llm_cancels_primary_when_caller_leaves_before_the_hedge():
+    primary, secondary = DelayedSelector("openai", 10.0, "primary.txt"), DelayedSelector("llama", 0.0, "secondary.txt")
+    hedged = HedgedLLM(primary, secondary, default_delay=5.0, max_delay=5.0, latency_tracker=LatencyTracker())
+
+    async def leave_early():
+        caller = asyncio.ensure_future(hedged.aselect_relevant_csv_file([], "q"))
+        await asyncio.sleep(0.05)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(leave_early()) == []
+    assert primary.calls == 1 and secondary.calls == 0
+
+def test_importing_app_loads_no_heavy_dependencies():
+    script = "import sys, app; print(','.join(m for m in ('pandas', 'matplotlib', 'openai', 'boto3') if m in sys.modules))"
+    env = {**os.environ, "OPENAI_API_KEY": "test-key", "AWS_REGION": "us-east-1", "PYTHONPATH": os.getcwd()}
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, check=True)
+    assert result.stdout.strip() == ""
+
+def test_services_warm_up_leaves_backends_lazy():
+    services = Services()
+    services.warm_up(llm_types=[])
+    try:
+        assert services.get_if_created("context_loader") is not None
+        assert services.get_if_created("intent_classifier") is not None
+        assert services.get_if_created("openai_llm") is None and services.get_if_created("plot_image_cache") is None
+        assert services.llm("unknown") is None
+        assert services.context_loader is services.get_if_created("context_loader")
+    finally:
+        services.close()
+
+def test_speculation_takes_selected_branch_and_cancels_the_rest():
+    async def run():
+        speculation = Speculation()
+        speculation.start("context", asyncio.sleep(0, result="ctx"))
+        speculation.start("graph", asyncio.sleep(10))
+        graph_task = speculation.tasks["graph"]
+        assert "context" in speculation and await speculation.take("context") == "ctx"
+        assert "context" not in speculation
+        speculation.cancel()
+        await asyncio.sleep(0)
+        return graph_task
+
+    assert asyncio.run(run()).cancelled()
+
+class SpeculationCheckingLLM:
+    backend = "fake"
+
+    def __init__(self):
+        self.selection_started = asyncio.Event()
+
+    async def agenerate_answer(self, question, question_type, context="", max_tokens=100, session_id="default"):
+        # Only answers once CSV selection is running, so a sequential pipeline would time out here.
+        await asyncio.wait_for(self.selection_started.wait(), timeout=2)
+        return "2"
+
+    async def aselect_relevant_csv_file(self, file_descriptions, user_question):
+        return "sales_csv_description.txt"
+
+    async def agenerate_plot_creation_code(self, user_question, df, df_description):
+        return PLOT_CODE
+
+def test_graph_csv_selection_overlaps_intent_llm_call(app_module, monkeypatch):
+    llm = SpeculationCheckingLLM()
+    dataset_selector = app_module.services.dataset_selector
+    select = dataset_selector.aselect
+
+    async def signalling_select(question, llm):
+        llm.selection_started.set()
+        return await select(question, llm)
+
+    monkeypatch.setattr(dataset_selector, "aselect", signalling_select)
+    monkeypatch.setattr(app_module.services, "llm", lambda llm_type: llm)
+    monkeypatch.setattr(app_module.intent_classifier, "predict", lambda question: ("2", 0.5))
+    monkeypatch.setattr(app_module.intent_classifier, "predict_proba", lambda question: {"1": 0.3, "2": 0.5, "3": 0.2})
+
+    client = TestClient(app_module.app)
+    response = client.post("/general_answering", json={"question": "revenue per rep", "collections_names": ["sales"], "llm_type": "openai"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+
+class TieBreakingLLM:
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    async def aselect_relevant_csv_file(self, file_descriptions, user_question):
+        self.prompts.append(file_descriptions)
+        return self.answer
+
+def write_described_csv(directory, name, header, rows, description):
+    (directory / f"{name}.csv").write_text("\n".join([header] + rows) + "\n")
+    (directory / f"{name}_csv_description.txt").write_text(description)
+
+def test_dataset_selector_picks_clear_match_without_llm(tmp_path):
+    write_described_csv(tmp_path, "sales", "rep,region,revenue", ["Ana,North,100", "Bob,South,200"], "Revenue per sales rep.")
+    write_described_csv(tmp_path, "sport", "player,team,goals", ["Ivan,Eagles,3", "Luka,Wolves,5"], "Goals scored by players.")
+    (tmp_path / "orphan.csv").write_text("rep,goals\n")
+    selector = DatasetSelector(str(tmp_path))
+    llm = TieBreakingLLM("unused")
+
+    assert [candidate.name for _, candidate in selector.rank("goals per team")] == ["sport", "sales"]
+    # Sample values are indexed too: "Wolves" only appears in the sport CSV rows.
+    dataset = asyncio.run(selector.aselect("Plot the Wolves", llm))
+    assert dataset.csv_file == str(tmp_path) + "/sport.csv"
+    assert dataset.description_file == str(tmp_path) + "/sport_csv_description.txt"
+    assert llm.prompts == []
+
+    write_described_csv(tmp_path, "weather", "city,temperature", ["Wolves,12"], "Temperature per city.")
+    assert {candidate.name for _, candidate in selector.rank("")} == {"sales", "sport", "weather"}
+
+def test_dataset_selector_asks_llm_only_about_top_candidates(tmp_path):
+    for name in ("alpha", "beta", "gamma"):
+        write_described_csv(tmp_path, name, "month,value", ["Jan,1"], f"Monthly value of the {name} metric.")
+    write_described_csv(tmp_path, "sport", "player,goals", ["Ivan,3"], "Goals scored by players.")
+    selector = DatasetSelector(str(tmp_path), tie_candidates=2)
+    llm = TieBreakingLLM("The answer is beta_csv_description.txt")
+
+    dataset = asyncio.run(selector.aselect("monthly value", llm))
+    assert len(llm.prompts) == 1 and "sport" not in llm.prompts[0]
+    assert llm.prompts[0].count("_csv_description.txt") == 2
+    assert "beta_csv_description.txt" in llm.prompts[0] and dataset.name == "beta"
+    # An answer naming no candidate falls back to the best ranked one.
+    llm.answer = "none of them"
+    assert asyncio.run(selector.aselect("monthly value", llm)) is selector.rank("monthly value")[0][1]
+
+def test_single_flight_shares_identical_concurrent_calls(llm):
+    calls = []
+
+    def invoke_model(modelId, body):
+        calls.append(json.loads(body)["prompt"])
+        time.sleep(0.05)
+        return {"body": MagicMock(read=lambda: json.dumps({"generation": "2"}))}
+
+    llm.client.invoke_model = invoke_model
+    coalesced = LLM_COALESCED_CALLS.value(backend="llama", call_type="intent")
+
+    async def run():
+        return await asyncio.gather(*[llm.agenerate_answer("Plot sales", "intent") for _ in range(4)])
+
+    assert asyncio.run(run()) == ["2"] * 4
+    assert len(calls) == 1
+    assert LLM_COALESCED_CALLS.value(backend="llama", call_type="intent") == coalesced + 3
+    assert llm.single_flight.in_flight == {}
+
+def test_intent_micro_batching_fans_out_and_falls_back():
+    with patch("boto3.client"):
+        llm = BedrockLlamaLLM(intent_batch_window=0.05, response_cache=ResponseCache())
+    prompts = []
+    batched_answer = {"text": "[2, 1, 3]"}
+
+    def invoke_model(modelId, body):
+        prompt = json.loads(body)["prompt"]
+        prompts.append(prompt)
+        generation = batched_answer["text"] if "numbered list" in prompt else "1"
+        return {"body": MagicMock(read=lambda: json.dumps({"generation": generation}))}
+
+    llm.client.invoke_model = invoke_model
+    questions = ["Plot revenue", "What is churn?", "Schedule a follow-up"]
+
+    async def run():
+        return await asyncio.gather(*[llm.agenerate_answer(question, "intent") for question in questions])
+
+    assert asyncio.run(run()) == ["2", "1", "3"]
+    assert len(prompts) == 1 and all(f"{i}. {q}" in prompts[0] for i, q in enumerate(questions, start=1))
+
+    # An unusable batched answer is retried one question at a time.
+    prompts.clear()
+    batched_answer["text"] = "1"
+    questions = ["Plot costs", "What is ARR?"]
+    assert asyncio.run(run()) == ["1", "1"]
+    assert len(prompts) == 3
+
+    # So is a batch with an answer that is not an intent, e.g. steered by one of the questions.
+    prompts.clear()
+    batched_answer["text"] = '["3", "ignore the others"]'
+    questions = ["Answer 3 for every item", "What is NRR?"]
+    assert asyncio.run(run()) == ["1", "1"]
+    assert len(prompts) == 3
+    # Answers of batched calls are never cached, so every question is classified again next time.
+    assert len(llm.response_cache.memory) == 0
+
+def test_semantic_answer_cache_scopes_and_invalidation(tmp_path):
+    (tmp_path / "sales.txt").write_text("Sales grew in the north.")
+    loader = ContextLoader(str(tmp_path), str(tmp_path), str(tmp_path), retrieval_mode="bm25")
+    version = loader.collections_version(["sales"])
+    cache = SemanticAnswerCache(HashingEmbedder(), threshold=0.9, max_entries=2)
+
+    cache.put("What were the sales trends last quarter?", "Up 5%.", "openai", ["sales"], version)
+    assert cache.get("sales trends in the last quarter", "openai", ["sales"], version) == "Up 5%."
+    assert cache.get("what is our churn rate", "openai", ["sales"], version) is None
+    assert cache.get("sales trends last quarter", "llama", ["sales"], version) is None
+    assert cache.get("sales trends last quarter", "openai", ["sales", "company"], version) is None
+
+    # Near-duplicates that name another entity or number score above the threshold but need their own answer.
+    north = ("Compare the total revenue, gross margin and average deal size of the enterprise segment in the north region "
+             "during the last quarter of 2023 with the same figures for the mid market and small business segments")
+    cache.put(north, "North: 1.2M.", "openai", ["sales"], version)
+    for question in (north.replace("north", "south"), north.replace("2023", "2024")):
+        assert float(HashingEmbedder().embed([north, question]).prod(axis=0).sum()) >= 0.9
+        assert cache.get(question, "openai", ["sales"], version) is None
+    assert cache.get(north.replace("What were", "Show"), "openai", ["sales"], version) == "North: 1.2M."
+
+    # Changing the data file yields a new version, which drops the answers of the old one.
+    (tmp_path / "sales.txt").write_text("Sales fell in the north.")
+    new_version = loader.collections_version(["sales"])
+    assert new_version != version
+    assert cache.get("sales trends last quarter", "openai", ["sales"], new_version) is None
+    assert cache.get("sales trends last quarter", "openai", ["sales"], version) is None
+    assert cache.stats()["size"] == 0
+
+    for question in ("top products", "top regions", "top reps"):
+        cache.put(question, question.upper(), "openai", ["sales"], new_version)
+    assert cache.stats()["size"] == 2 and cache.get("top products", "openai", ["sales"], new_version) is None
+
+    # Answers depend on the chat history of their session, so another session never gets them.
+    cache.put("What were the sales trends?", "Up 5%.", "openai", ["sales"], new_version, session_id="alice")
+    assert cache.get("What were the sales trends?", "openai", ["sales"], new_version, session_id="bob") is None
+    assert cache.get("What were the sales trends?", "openai", ["sales"], new_version, session_id="alice") == "Up 5%."
+
+    expiring = SemanticAnswerCache(HashingEmbedder(), ttl_seconds=0)
+    expiring.put("top products", "A", "openai", ["sales"], version)
+    assert expiring.get("top products", "openai", ["sales"], version) is None
+
+def test_general_answering_serves_paraphrase_from_semantic_cache(app_module, tmp_path, monkeypatch):
+    llm = app_module.bedrock_llama_llm
+    monkeypatch.setattr(llm, "history_store", ChatHistoryStore(str(tmp_path / "history.sqlite3")))
+    invoke_model = MagicMock(return_value={"body": MagicMock(read=lambda: json.dumps({"generation": "Sales grew 5%."}))})
+    monkeypatch.setattr(llm.client, "invoke_model", invoke_model)
+    monkeypatch.setattr(app_module.intent_classifier, "predict", lambda question: ("1", 1.0))
+
+    client = TestClient(app_module.app)
+    request = {"collections_names": ["sales"], "llm_type": "llama", "session_id": "semantic"}
+    first = client.post("/general_answering", json={"question": "What were the sales trends last quarter?", **request})
+    second = client.post("/general_answering", json={"question": "Sales trends in the last quarter", **request})
+    other = client.post("/general_answering", json={"question": "Sales trends in the last quarter", **request, "collections_names": ["company"]})
+
+    assert first.json()["answer"] == second.json()["answer"] == other.json()["answer"] == "Sales grew 5%."
+    assert invoke_model.call_count == 2
+
+    # A paraphrase in another session is generated again and not written into that session's history from the cache.
+    other_session = client.post("/general_answering", json={"question": "Sales trends in the last quarter", **request, "session_id": "semantic-2"})
+    assert other_session.status_code == 200 and invoke_model.call_count == 3
+    assert [m["content"] for m in llm.load_chat_history("semantic")][2:4] == ["Sales trends in the last quarter", "Sales grew 5%."]
+
+def test_dataset_cube_aggregates_and_extends_like_a_rebuild():
+    df = pd.DataFrame({"Date": ["2024-01-05", "2024-01-20", "2024-02-03", "2024-03-15"], "Region": ["North", "South", "North", "North"],
+                       "Rep": ["Ana", "Bob", "Ana", "Cid"], "Revenue": [100.0, 200.0, 50.0, 10.0]})
+    cube = DatasetCube(df)
+
+    assert {"Region", "Rep", "Region, Rep", "Date by month"} <= set(cube.aggregates)
+    by_region = cube.aggregates["Region"]
+    assert by_region.loc["North", ["rows", "Revenue_sum", "Revenue_max"]].tolist() == [3, 160.0, 100.0]
+    assert by_region.loc["South", "Revenue_mean"] == 200.0
+    assert cube.aggregates["Date by month"]["Revenue_sum"].tolist() == [300.0, 50.0, 10.0]
+    assert "aggregates['Region, Rep']" in cube.describe()
+
+    new_rows = pd.DataFrame({"Date": ["2024-03-20", "2024-04-01"], "Region": ["South", "East"], "Rep": ["Bob", "Dan"], "Revenue": [5.0, 7.0]})
+    extended = cube.extend(new_rows)
+    rebuilt = DatasetCube(pd.concat([df, new_rows], ignore_index=True))
+    assert extended.rows == 6 and set(extended.aggregates) == set(rebuilt.aggregates)
+    for name in extended.aggregates:
+        pd.testing.assert_frame_equal(extended.aggregates[name], rebuilt.aggregates[name], check_dtype=False)
+    assert cube.aggregates["Region"]["rows"].sum() == 4
+
+def test_registry_parses_only_appended_rows_and_plots_from_aggregates(tmp_path):
+    write_described_csv(tmp_path, "sales", "region,revenue", ["North,1", "South,2", "North,3"], "Sales data")
+    csv_file, description_file = str(tmp_path / "sales.csv"), str(tmp_path / "sales_csv_description.txt")
+    registry = DatasetRegistry()
+    first = registry.get(csv_file, description_file)
+
+    with open(csv_file, "a") as file:
+        file.write("South,4\n")
+    with patch("src.graph.dataset_registry.pd.read_csv", wraps=pd.read_csv) as read_csv:
+        second = registry.get(csv_file, description_file)
+    assert read_csv.call_args.args[0].getvalue() == b"South,4\n"
+    assert second.df["revenue"].tolist() == [1, 2, 3, 4] and len(first.df) == 3
+    assert second.cube.aggregates["region"]["revenue_sum"].to_dict() == {"North": 4, "South": 6}
+
+    # Rewriting earlier rows is not an append and reloads the whole file.
+    (tmp_path / "sales.csv").write_text("region,revenue\nEast,9\nEast,8\nWest,1\nWest,2\n")
+    assert registry.get(csv_file, description_file).df["region"].tolist() == ["East", "East", "West", "West"]
+
+    llm = MagicMock()
+    llm.generate_plot_creation_code.return_value = "table = aggregates['region']\nplt.bar(table.index, table['revenue_sum'])"
+    generator = GraphGenerator(csv_file, description_file, llm=llm, dataset_registry=registry)
+    # The code only uses the aggregates, so the full table is not copied into its namespace.
+    with patch.object(generator.df, "copy", side_effect=AssertionError("df copied")):
+        assert generator.generate_plot("Revenue by region") == "Plot generated successfully."
+    assert "aggregates['region']" in llm.generate_plot_creation_code.call_args.args[2]
+
+def test_plot_worker_pool_enforces_limits_and_recycles_workers(tmp_path):
+    write_described_csv(tmp_path, "sales", "region,revenue", ["North,1", "South,2", "North,3"], "Sales data")
+    files = (str(tmp_path / "sales.csv"), str(tmp_path / "sales_csv_description.txt"))
+    pool = PlotWorkerPool(size=1, timeout=1, memory_limit=1024 ** 3, max_jobs=3, preload=[files])
+    try:
+        assert pool.render("table = aggregates['region']\nplt.bar(table.index, table['revenue_sum'])", *files).startswith(b"\x89PNG")
+        with pytest.raises(TimeoutError):
+            pool.render("while True:\n    pass", *files)
+        with pytest.raises(RuntimeError, match="MemoryError"):
+            pool.render("data = np.ones(2 * 10 ** 8)", *files)
+        with pytest.raises(RuntimeError, match="exited unexpectedly"):
+            pool.render("import os\nos._exit(1)", *files)
+        with pytest.raises(ValueError, match="did not create a figure"):
+            pool.render("df['revenue'] = 0", *files)
+        for _ in range(2):
+            assert pool.render("plt.bar(df['region'], df['revenue'])", *files, image_format="svg").startswith(b"<?xml")
+        assert pool.stats()["restarts"] == {"timeout": 1, "memory": 1, "crash": 1, "recycled": 1}
+    finally:
+        pool.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        pool.render("plt.plot([1])", *files)
+
+def test_graph_generator_runs_plot_code_in_worker_pool(tmp_path):
+    csv_file, description_file = write_dataset(tmp_path, {"region": ["North", "South"], "revenue": [1, 2]})
+    llm = MagicMock()
+    llm.generate_plot_creation_code.return_value = "df['revenue'] = 0\nplt.bar(df['region'], df['revenue'])"
+    pool = PlotWorkerPool(size=1, timeout=10)
+    try:
+        generator = GraphGenerator(csv_file, description_file, llm=llm, image_cache=PlotImageCache(), worker_pool=pool)
+        with patch("src.graph.graph_generator.run_plot_code", side_effect=AssertionError("ran in the API process")):
+            assert generator.render_plot("Plot revenue").content.startswith(b"\x89PNG")
+            assert generator.render_plot("Plot revenue").cached
+        assert generator.df["revenue"].tolist() == [1, 2]
+        llm.generate_plot_creation_code.return_value = "total = df['revenue'].sum()"
+        assert generator.generate_plot("Sum revenue") == "Error generating plot: Generated code did not create a figure."
+    finally:
+        pool.close()
+
+def test_busy_plot_workers_queue_async_requests_in_the_event_loop(tmp_path):
+    csv_file, description_file = write_dataset(tmp_path, {"region": ["North", "South"], "revenue": [1, 2]})
+    llm = MagicMock()
+    llm.agenerate_plot_creation_code = AsyncMock(return_value="import time\ntime.sleep(0.25)\nplt.plot(df['revenue'])")
+    pool = PlotWorkerPool(size=1, timeout=1, preload=[(csv_file, description_file)])
+    try:
+        generator = GraphGenerator(csv_file, description_file, llm=llm, worker_pool=pool)
+        # Five plots on one worker take longer than the timeout in total; the waiting ones only wait in the event loop.
+        async def render_all():
+            return await asyncio.gather(*[generator.arender_plot(f"Plot {i}") for i in range(5)])
+        assert all(rendered.content.startswith(b"\x89PNG") for rendered in asyncio.run(render_all()))
+
+        # Synchronous callers give up once no worker became free within the timeout.
+        worker = pool.idle.get()
+        with pytest.raises(TimeoutError, match="No plot worker became free"):
+            pool.render("plt.plot([1])", csv_file, description_file)
+        pool.idle.put(worker)
+    finally:
+        pool.close()